@@ -22,9 +22,9 @@ CREATE TABLE stg.OpenFlights_Airports (
 );
 
 CREATE TABLE stg.OpenFlights_Routes (
-    Airline VARCHAR(3), AirlineID NVARCHAR(10), 
-    SourceAirport VARCHAR(3), SourceID NVARCHAR(10), 
-    DestAirport VARCHAR(3), DestID NVARCHAR(10)
+    Airline VARCHAR(3), AirlineID INT, 
+    SourceAirport VARCHAR(3), SourceID INT, 
+    DestAirport VARCHAR(3), DestID INT
 );
 
 -- J: Lgitrsasgok nyers tbla
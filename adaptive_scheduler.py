@@ -0,0 +1,82 @@
+import random
+from datetime import datetime
+
+# =========================================================
+# Adaptív poll ütemezés a FUTÁR gyűjtőkhöz (fix 30 mp helyett)
+# =========================================================
+# Célonként (megálló / vonal) a legutóbbi válasz alapján dönt a következő pollról:
+#   - érkezés IMMINENT_SEC-en belül (vagy már esedékes, de még listázva)  -> MIN_SEC
+#   - normál forgalom                                                     -> BASE_SEC
+#   - a következő indulás messze van                                      -> addig ritkítunk, hogy
+#     LEAD_SEC-kel előtte már újra nézzük (legfeljebb MAX_SEC)
+#   - nincs egy érkezés / jármű sem (üzemszünet, éjszaka)                  -> IDLE_SEC
+#   - hiba: exponenciális visszalépés BACKOFF_BASE * 2^(n-1), legfeljebb BACKOFF_MAX,
+#     "equal jitter"-rel (a fele fix, a fele véletlen), hogy a célok ne egyszerre próbálkozzanak újra
+# Minden döntés kiíródik (LOG = True), így a választott időközök ellenőrizhetők.
+
+MIN_SEC = 15
+BASE_SEC = 30
+MAX_SEC = 300
+IDLE_SEC = 600
+IMMINENT_SEC = 90
+LEAD_SEC = 90
+STALE_SEC = 60        # az ennél régebben esedékes, de még listázott trip-ek már nem számítanak közelgőnek
+BACKOFF_BASE = 30
+BACKOFF_MAX = 900
+LOG = True
+
+class AdaptiveScheduler:
+    def __init__(self, name, base_sec=BASE_SEC, log=LOG):
+        self.name = name
+        self.base_sec = base_sec
+        self.log = log
+        self.failures = 0
+        self.stats = {"polls": 0, "errors": 0, "sec_total": 0.0}
+
+    def _decide(self, sec, reason):
+        self.stats["polls"] += 1
+        self.stats["sec_total"] += sec
+        if self.log:
+            print(f"   ⏱ {self.name}: következő poll {sec:.0f}s múlva ({reason})")
+        return sec
+
+    def on_success(self, next_event_sec=None, active=True):
+        """next_event_sec: mennyi idő (mp) a következő érkezésig / indulásig (None = nem tudjuk);
+        active: van-e egyáltalán forgalom a válaszban. -> mp a következő pollig"""
+        self.failures = 0
+        if not active:
+            return self._decide(IDLE_SEC, "nincs forgalom")
+        if next_event_sec is None:
+            return self._decide(self.base_sec, "alap")
+        if next_event_sec <= IMMINENT_SEC:
+            return self._decide(MIN_SEC, f"érkezés {max(next_event_sec, 0):.0f}s múlva")
+        if next_event_sec - LEAD_SEC > self.base_sec:
+            sec = min(next_event_sec - LEAD_SEC, MAX_SEC)
+            return self._decide(sec, f"következő érkezés {next_event_sec:.0f}s múlva")
+        return self._decide(self.base_sec, f"érkezés {next_event_sec:.0f}s múlva")
+
+    def on_failure(self, error=None):
+        self.failures += 1
+        self.stats["errors"] += 1
+        cap = min(BACKOFF_BASE * 2 ** (self.failures - 1), BACKOFF_MAX)
+        sec = cap / 2 + random.uniform(0, cap / 2)
+        return self._decide(sec, f"hiba #{self.failures}: {error}" if error else f"hiba #{self.failures}")
+
+    def avg_interval(self):
+        return self.stats["sec_total"] / self.stats["polls"] if self.stats["polls"] else None
+
+# ---------- a válaszokból: mennyi idő a következő eseményig ----------
+def next_arrival_sec(rows, snap_dt: datetime):
+    """parse_arrivals sorok -> mp a legközelebbi (előrejelzett, ha nincs: ütemezett) érkezésig.
+    A legfeljebb STALE_SEC-e esedékes, de még listázott trip 0-t ad (épp most érkezik / indul).
+    None, ha nincs ilyen sor."""
+    secs = [(t - snap_dt).total_seconds()
+            for t in (r.get("PredictedArrivalDT") or r.get("ScheduledArrivalDT") for r in rows) if t is not None]
+    secs = [x for x in secs if x >= -STALE_SEC]
+    if not secs:
+        return None
+    return max(min(secs), 0.0)
+
+def vehicles_active(data):
+    """vehicles-for-route válasz: van-e jármű a vonalon"""
+    return bool(((data or {}).get("data") or {}).get("list"))
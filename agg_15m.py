@@ -0,0 +1,249 @@
+import sys, time, argparse
+import sqlalchemy
+
+import backend
+
+# =========================================================
+# 15 perces aggregátumok (dw.Agg_Transit_15m / dw.Agg_Transit_15m_Demo) futtatása
+# =========================================================
+# mssql:  a dw.usp_BuildAgg_Transit_15m(_Demo) SP-ket hívja (agg_view_15m_delays.sql, demo_view_with_delays.sql)
+# duckdb: ugyanaz a számítás DuckDB SQL-lel (SP nincs); PERCENTILE_CONT(0.95) == quantile_cont(x, 0.95)
+#
+# python agg_15m.py              -> dw.Agg_Transit_15m, 14 nap
+# python agg_15m.py --demo       -> dw.Agg_Transit_15m_Demo, 7 nap
+# python agg_15m.py --trips      -> dw.Agg_Transit_15m_Trips a trip szintű stg.RealTime_TripArrivals-ból
+#                                   (mssql: dw.usp_BuildAgg_Transit_15m_Trips, agg_trip_arrivals_15m.sql)
+
+SERVER = r"(localdb)\mssqllocaldb"
+DATABASE = "BudAirportBI"
+DRIVER = "ODBC Driver 17 for SQL Server"
+
+AGG_DDL = """
+IF OBJECT_ID('{table}','U') IS NULL
+CREATE TABLE {table} (
+    DateKey         INT NOT NULL,
+    TimeSlot        INT NOT NULL,
+    StopId          VARCHAR(50) NOT NULL,
+    RouteIdRT       VARCHAR(50) NOT NULL,
+    AvgDelaySec     FLOAT NULL,
+    P95DelaySec     FLOAT NULL,
+    OnTimeRatio     FLOAT NULL,
+    ObsCount        INT NOT NULL,
+    AvgHeadwaySec   FLOAT NULL,
+    CONSTRAINT PK_{name} PRIMARY KEY (DateKey, TimeSlot, StopId, RouteIdRT)
+);
+"""
+
+# ---------- DuckDB megfelelők ----------
+# DateKey / TimeSlot ugyanúgy, mint az SP-kben: yyyymmdd és (óra*60 + perc) / 15 egész osztással
+_KEYS = """
+    CAST(strftime(SnapshotDT, '%Y%m%d') AS INTEGER) AS DateKey,
+    (hour(SnapshotDT) * 60 + minute(SnapshotDT)) // 15 AS TimeSlot"""
+
+DEMO_VIEW_DUCKDB = """
+CREATE OR REPLACE VIEW dw.vw_StopArrivals_Demo AS
+WITH base AS (
+    SELECT
+        SnapshotDT, StopId, RouteIdRT, TripId, ScheduledArrivalDT,
+        COALESCE(DelaySec, 0) AS DelayBase,
+        RawFile
+    FROM stg.RealTime_StopArrivals
+),
+demo AS (
+    SELECT
+        *,
+        CASE
+            WHEN DelayBase <> 0 THEN DelayBase
+            ELSE
+                CASE (minute(SnapshotDT) % 10)
+                    WHEN 0 THEN  60
+                    WHEN 1 THEN 180
+                    WHEN 2 THEN 300
+                    WHEN 3 THEN 420
+                    WHEN 4 THEN 600
+                    WHEN 5 THEN -60
+                    ELSE 0
+                END
+        END AS DelaySec_Demo
+    FROM base
+)
+SELECT
+    SnapshotDT, StopId, RouteIdRT, TripId, ScheduledArrivalDT,
+    ScheduledArrivalDT + to_seconds(DelaySec_Demo) AS PredictedArrivalDT,
+    DelaySec_Demo AS DelaySec,
+    RawFile
+FROM demo;
+"""
+
+def _stats_cte(source):
+    return f"""
+    x AS (
+        SELECT {_KEYS}, StopId, RouteIdRT, DelaySec
+        FROM {source}
+        WHERE SnapshotDT >= $from_dt
+          AND DelaySec IS NOT NULL
+    ),
+    stats AS (
+        SELECT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            AVG(CAST(DelaySec AS DOUBLE)) AS AvgDelaySec,
+            quantile_cont(CAST(DelaySec AS DOUBLE), 0.95) AS P95DelaySec,
+            AVG(CASE WHEN ABS(DelaySec) <= 60 THEN 1.0 ELSE 0.0 END) AS OnTimeRatio,
+            COUNT(*) AS ObsCount
+        FROM x
+        GROUP BY DateKey, TimeSlot, StopId, RouteIdRT
+    )"""
+
+AGG_DUCKDB = """
+INSERT INTO dw.Agg_Transit_15m
+    (DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec)
+WITH """ + _stats_cte("stg.RealTime_StopArrivals") + """,
+    hw_raw AS (
+        SELECT """ + _KEYS + """, StopId, RouteIdRT,
+            date_diff('second', PredictedArrivalDT,
+                      LEAD(PredictedArrivalDT) OVER (PARTITION BY SnapshotDT, StopId, RouteIdRT
+                                                     ORDER BY PredictedArrivalDT)) AS HeadwaySec
+        FROM stg.RealTime_StopArrivals
+        WHERE SnapshotDT >= $from_dt
+          AND PredictedArrivalDT IS NOT NULL
+    ),
+    hw AS (
+        SELECT DateKey, TimeSlot, StopId, RouteIdRT, AVG(CAST(HeadwaySec AS DOUBLE)) AS AvgHeadwaySec
+        FROM hw_raw
+        WHERE HeadwaySec IS NOT NULL
+          AND HeadwaySec > 0
+          AND HeadwaySec < 7200 -- 2 óra felett gyanús, dobd
+        GROUP BY DateKey, TimeSlot, StopId, RouteIdRT
+    )
+SELECT s.DateKey, s.TimeSlot, s.StopId, s.RouteIdRT,
+       s.AvgDelaySec, s.P95DelaySec, s.OnTimeRatio, s.ObsCount, h.AvgHeadwaySec
+FROM stats s
+LEFT JOIN hw h
+  ON h.DateKey = s.DateKey AND h.TimeSlot = s.TimeSlot AND h.StopId = s.StopId AND h.RouteIdRT = s.RouteIdRT;
+"""
+
+AGG_DEMO_DUCKDB = """
+INSERT INTO dw.Agg_Transit_15m_Demo
+    (DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec)
+WITH """ + _stats_cte("dw.vw_StopArrivals_Demo") + """,
+    hw AS (
+        SELECT """ + _KEYS + """, StopId, RouteIdRT, AVG(CAST(HeadwaySec AS DOUBLE)) AS AvgHeadwaySec
+        FROM stg.RealTime_StopHeadway
+        WHERE SnapshotDT >= $from_dt
+          AND HeadwaySec IS NOT NULL
+        GROUP BY ALL
+    )
+SELECT s.DateKey, s.TimeSlot, s.StopId, s.RouteIdRT,
+       s.AvgDelaySec, s.P95DelaySec, s.OnTimeRatio, s.ObsCount, h.AvgHeadwaySec
+FROM stats s
+LEFT JOIN hw h
+  ON h.DateKey = s.DateKey AND h.TimeSlot = s.TimeSlot AND h.StopId = s.StopId AND h.RouteIdRT = s.RouteIdRT;
+"""
+
+# trip szinten: egy trip = egy megfigyelés (végső predikció), slot az ütemezett érkezésből,
+# headway az egymást követő trip-ek végső előrejelzett érkezése között
+AGG_TRIPS_DUCKDB = """
+INSERT INTO dw.Agg_Transit_15m_Trips
+    (DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec)
+WITH
+    t AS (
+        SELECT
+            CAST(strftime(ScheduledArrivalDT, '%Y%m%d') AS INTEGER) AS DateKey,
+            (hour(ScheduledArrivalDT) * 60 + minute(ScheduledArrivalDT)) // 15 AS TimeSlot,
+            ServiceDate, StopId, RouteIdRT,
+            COALESCE(FinalDelaySec, LastDelaySec) AS DelaySec,
+            COALESCE(FinalPredictedDT, LastPredictedDT) AS ArrivalDT
+        FROM stg.RealTime_TripArrivals
+        WHERE ServiceDate >= CAST($from_dt AS DATE)
+          AND ScheduledArrivalDT >= $from_dt
+          AND RouteIdRT IS NOT NULL
+    ),
+    stats AS (
+        SELECT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            AVG(CAST(DelaySec AS DOUBLE)) AS AvgDelaySec,
+            quantile_cont(CAST(DelaySec AS DOUBLE), 0.95) AS P95DelaySec,
+            AVG(CASE WHEN ABS(DelaySec) <= 60 THEN 1.0 ELSE 0.0 END) AS OnTimeRatio,
+            COUNT(*) AS ObsCount
+        FROM t
+        WHERE DelaySec IS NOT NULL
+        GROUP BY DateKey, TimeSlot, StopId, RouteIdRT
+    ),
+    hw_raw AS (
+        SELECT DateKey, TimeSlot, StopId, RouteIdRT,
+            date_diff('second', ArrivalDT,
+                      LEAD(ArrivalDT) OVER (PARTITION BY ServiceDate, StopId, RouteIdRT ORDER BY ArrivalDT)) AS HeadwaySec
+        FROM t
+        WHERE ArrivalDT IS NOT NULL
+    ),
+    hw AS (
+        SELECT DateKey, TimeSlot, StopId, RouteIdRT, AVG(CAST(HeadwaySec AS DOUBLE)) AS AvgHeadwaySec
+        FROM hw_raw
+        WHERE HeadwaySec IS NOT NULL
+          AND HeadwaySec > 0
+          AND HeadwaySec < 7200 -- 2 óra felett gyanús, dobd
+        GROUP BY DateKey, TimeSlot, StopId, RouteIdRT
+    )
+SELECT s.DateKey, s.TimeSlot, s.StopId, s.RouteIdRT,
+       s.AvgDelaySec, s.P95DelaySec, s.OnTimeRatio, s.ObsCount, h.AvgHeadwaySec
+FROM stats s
+LEFT JOIN hw h
+  ON h.DateKey = s.DateKey AND h.TimeSlot = s.TimeSlot AND h.StopId = s.StopId AND h.RouteIdRT = s.RouteIdRT;
+"""
+
+def _table(demo=False, trips=False):
+    if trips:
+        return "dw.Agg_Transit_15m_Trips"
+    return "dw.Agg_Transit_15m_Demo" if demo else "dw.Agg_Transit_15m"
+
+def ensure_agg_tables(conn):
+    for table in ("dw.Agg_Transit_15m", "dw.Agg_Transit_15m_Demo", "dw.Agg_Transit_15m_Trips"):
+        conn.exec_driver_sql(backend.sql(AGG_DDL.format(table=table, name=table.split(".")[1])))
+
+def _build_duckdb(conn, days_back, demo, trips=False):
+    table = _table(demo, trips)
+    from_dt = conn.exec_driver_sql(
+        "SELECT CAST(current_date - CAST(? AS INTEGER) AS TIMESTAMP)", (days_back,)).scalar()
+    from_key = int(from_dt.strftime("%Y%m%d"))
+
+    if demo:
+        conn.exec_driver_sql(DEMO_VIEW_DUCKDB)
+    # mint az SP-ben: törlés + újratöltés az időablakra
+    conn.exec_driver_sql(f"DELETE FROM {table} WHERE DateKey >= ?", (from_key,))
+    if trips:
+        sql = AGG_TRIPS_DUCKDB
+    else:
+        sql = AGG_DEMO_DUCKDB if demo else AGG_DUCKDB
+    sql = sql.replace("$from_dt", "?")
+    conn.exec_driver_sql(sql, (from_dt,) * sql.count("?"))
+    return conn.exec_driver_sql(f"SELECT COUNT(*) FROM {table} WHERE DateKey >= ?", (from_key,)).scalar()
+
+def build(engine, days_back=None, demo=False, trips=False):
+    """Aggregátum újraszámolása; -> a frissített ablak sorainak száma (mssql-en None)"""
+    if days_back is None:
+        days_back = 7 if demo else 14
+    with engine.begin() as conn:
+        ensure_agg_tables(conn)
+        if backend.is_duckdb():
+            return _build_duckdb(conn, days_back, demo, trips)
+        # dw.Agg_Transit_15m(_Demo|_Trips) -> dw.usp_BuildAgg_Transit_15m(_Demo|_Trips)
+        proc = "dw.usp_Build" + _table(demo, trips).split(".")[1]
+        conn.execute(sqlalchemy.text(f"EXEC {proc} @DaysBack = :d"), {"d": days_back})
+        return None
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="15 perces aggregátum újraszámolása (mssql SP / duckdb SQL)")
+    ap.add_argument("--demo", action="store_true", help="dw.Agg_Transit_15m_Demo (demo view alapján)")
+    ap.add_argument("--trips", action="store_true", help="dw.Agg_Transit_15m_Trips (stg.RealTime_TripArrivals alapján)")
+    ap.add_argument("--days", type=int, default=None, help="időablak napokban (alap: 14, demo: 7)")
+    args = ap.parse_args(sys.argv[1:] if argv is None else argv)
+
+    engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+    t0 = time.perf_counter()
+    n = build(engine, args.days, args.demo, args.trips)
+    rows = "" if n is None else f" ({n} sor)"
+    print(f"✅ {_table(args.demo, args.trips)} kész{rows} [{backend.BACKEND}] "
+          f"{time.perf_counter() - t0:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+USE BudAirportBI;
+GO
+
+/* Inkrementlis 15 perces aggregls (dw.Agg_Transit_15m / dw.Agg_Transit_15m_Demo)
+   - a dw.usp_BuildAgg_Transit_15m(_Demo) minden hvsnl trli s jraszmolja a teljes @DaysBack ablakot
+   - itt: vzjel (watermark) a betltsi sorszmon (stg.RealTime_StopArrivals / StopHeadway .LoadID, IDENTITY),
+     nem a SnapshotDT-n: egy ksbb bert rgi snapshot (spool visszajtszs, poller retry, backfill) is j
+     LoadID-t kap, gy nem csszik a vzjel al
+   - az j sorok 15 perces slotjait (brmilyen rgi a SnapshotDT-jk) a forrsbl teljesen jraszmoljuk:
+     a slot hisztogramja / headway akkumultora trls + jrapts, nem hozzads, gy egy slot tbbszr
+     is jraszmolhat dupla szmols nlkl
+   - P95: slotonknti DelaySec -> darabszm hisztogram; pontosan ugyanazt a PERCENTILE_CONT(0.95) rtket adja,
+     mint a teljes jraszmols
+   - tlag / pontossgi arny / ObsCount is a hisztogrambl jn, headway: sszeg + darab slotonknt
+
+   Futtats (akr percenknt):  EXEC dw.usp_BuildAgg_Transit_15m_Incremental;
+                                EXEC dw.usp_BuildAgg_Transit_15m_Demo_Incremental;
+   Teljes jrapts (a @DaysBack ablak):
+                                EXEC dw.usp_ResetAgg_Transit_15m_Incremental @AggName = 'Main';
+*/
+
+/* betltsi sorszm a nyers tblkon (a realtime_ingest_100e.py j tblkat mr ezzel hoz ltre) */
+IF COL_LENGTH('stg.RealTime_StopArrivals', 'LoadID') IS NULL
+    ALTER TABLE stg.RealTime_StopArrivals ADD LoadID INT IDENTITY(1,1) NOT NULL;
+GO
+IF COL_LENGTH('stg.RealTime_StopHeadway', 'LoadID') IS NULL
+    ALTER TABLE stg.RealTime_StopHeadway ADD LoadID INT IDENTITY(1,1) NOT NULL;
+GO
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RealTime_StopArrivals_LoadID')
+    CREATE INDEX IX_RealTime_StopArrivals_LoadID ON stg.RealTime_StopArrivals (LoadID) INCLUDE (SnapshotDT);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RealTime_StopArrivals_SnapshotDT')
+    CREATE INDEX IX_RealTime_StopArrivals_SnapshotDT ON stg.RealTime_StopArrivals (SnapshotDT);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RealTime_StopHeadway_LoadID')
+    CREATE INDEX IX_RealTime_StopHeadway_LoadID ON stg.RealTime_StopHeadway (LoadID) INCLUDE (SnapshotDT);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RealTime_StopHeadway_SnapshotDT')
+    CREATE INDEX IX_RealTime_StopHeadway_SnapshotDT ON stg.RealTime_StopHeadway (SnapshotDT);
+GO
+
+IF OBJECT_ID('dw.Agg_Transit_15m','U') IS NULL
+CREATE TABLE dw.Agg_Transit_15m (
+    DateKey         INT NOT NULL,
+    TimeSlot        INT NOT NULL,
+    StopId          VARCHAR(50) NOT NULL,
+    RouteIdRT       VARCHAR(50) NOT NULL,
+    AvgDelaySec     FLOAT NULL,
+    P95DelaySec     FLOAT NULL,
+    OnTimeRatio     FLOAT NULL,
+    ObsCount        INT NOT NULL,
+    AvgHeadwaySec   FLOAT NULL,
+    CONSTRAINT PK_Agg_Transit_15m PRIMARY KEY (DateKey, TimeSlot, StopId, RouteIdRT)
+);
+GO
+
+/* vzjel: meddig (LoadID) dolgoztuk mr fel a forrst; AggName = 'Main' | 'Demo'
+   LastSnapshotDT csak tjkoztat (a legutbb jraszmolt legfrissebb snapshot) */
+IF OBJECT_ID('dw.Agg_Watermark','U') IS NULL
+CREATE TABLE dw.Agg_Watermark (
+    AggName             VARCHAR(20) NOT NULL PRIMARY KEY,
+    LastLoadID          INT NULL,           -- stg.RealTime_StopArrivals
+    LastHeadwayLoadID   INT NULL,           -- stg.RealTime_StopHeadway (csak Demo)
+    LastSnapshotDT      DATETIME2(0) NULL,
+    UpdatedAt           DATETIME2(0) NOT NULL
+);
+GO
+/* rgi (SnapshotDT vzjeles) tbla: a LastLoadID nlkli sor els futsnak szmt (a @DaysBack ablak jra) */
+IF COL_LENGTH('dw.Agg_Watermark', 'LastLoadID') IS NULL
+BEGIN
+    ALTER TABLE dw.Agg_Watermark ADD LastLoadID INT NULL, LastHeadwayLoadID INT NULL;
+    ALTER TABLE dw.Agg_Watermark ALTER COLUMN LastSnapshotDT DATETIME2(0) NULL;
+END
+GO
+
+/* kss hisztogram: slotonknt minden elfordult DelaySec rtk s a darabszma */
+IF OBJECT_ID('dw.Agg_Transit_15m_DelayHist','U') IS NULL
+CREATE TABLE dw.Agg_Transit_15m_DelayHist (
+    AggName     VARCHAR(20) NOT NULL,
+    DateKey     INT NOT NULL,
+    TimeSlot    INT NOT NULL,
+    StopId      VARCHAR(50) NOT NULL,
+    RouteIdRT   VARCHAR(50) NOT NULL,
+    DelaySec    INT NOT NULL,
+    Cnt         INT NOT NULL,
+    CONSTRAINT PK_Agg_Transit_15m_DelayHist PRIMARY KEY (AggName, DateKey, TimeSlot, StopId, RouteIdRT, DelaySec)
+);
+GO
+
+/* headway akkumultor: sszeg + darab slotonknt (az tlag ebbl sszefslhet) */
+IF OBJECT_ID('dw.Agg_Transit_15m_HeadwayAcc','U') IS NULL
+CREATE TABLE dw.Agg_Transit_15m_HeadwayAcc (
+    AggName     VARCHAR(20) NOT NULL,
+    DateKey     INT NOT NULL,
+    TimeSlot    INT NOT NULL,
+    StopId      VARCHAR(50) NOT NULL,
+    RouteIdRT   VARCHAR(50) NOT NULL,
+    HwSum       FLOAT NOT NULL,
+    HwCnt       INT NOT NULL,
+    CONSTRAINT PK_Agg_Transit_15m_HeadwayAcc PRIMARY KEY (AggName, DateKey, TimeSlot, StopId, RouteIdRT)
+);
+GO
+
+/* Kzs lezr lps: a hv #touched (DateKey, TimeSlot, StopId, RouteIdRT) tbljn lv slotokat
+   jraszmolja a hisztogrambl / akkumultorbl, s kicserli a cltblban. */
+CREATE OR ALTER PROCEDURE dw.usp_Agg15m_RefreshTouched
+    @AggName VARCHAR(20)
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    IF OBJECT_ID('tempdb..#result') IS NOT NULL DROP TABLE #result;
+
+    ;WITH h AS (
+        SELECT
+            d.DateKey, d.TimeSlot, d.StopId, d.RouteIdRT, d.DelaySec, d.Cnt,
+            SUM(d.Cnt) OVER (PARTITION BY d.DateKey, d.TimeSlot, d.StopId, d.RouteIdRT
+                             ORDER BY d.DelaySec ROWS UNBOUNDED PRECEDING) AS CumCnt,
+            SUM(d.Cnt) OVER (PARTITION BY d.DateKey, d.TimeSlot, d.StopId, d.RouteIdRT) AS N
+        FROM dw.Agg_Transit_15m_DelayHist d
+        JOIN #touched t
+          ON t.DateKey = d.DateKey AND t.TimeSlot = d.TimeSlot AND t.StopId = d.StopId AND t.RouteIdRT = d.RouteIdRT
+        WHERE d.AggName = @AggName
+    ),
+    stats AS (
+        -- PERCENTILE_CONT(0.95): pozci = 0.95 * (N-1) a rendezett sorban (0-tl szmozva),
+        -- az als / fels szomszd rtke a kumullt darabszmbl, kztk lineris interpolci
+        SELECT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            SUM(CAST(DelaySec AS FLOAT) * Cnt) / SUM(Cnt) AS AvgDelaySec,
+            SUM(CASE WHEN ABS(DelaySec) <= 60 THEN Cnt ELSE 0 END) * 1.0 / SUM(Cnt) AS OnTimeRatio,
+            SUM(Cnt) AS ObsCount,
+            MAX(0.95 * (N - 1)) AS Pos,
+            MIN(CASE WHEN CumCnt > FLOOR(0.95 * (N - 1)) THEN DelaySec END) AS VLo,
+            MIN(CASE WHEN CumCnt > CEILING(0.95 * (N - 1)) THEN DelaySec END) AS VHi
+        FROM h
+        GROUP BY DateKey, TimeSlot, StopId, RouteIdRT
+    )
+    SELECT
+        s.DateKey, s.TimeSlot, s.StopId, s.RouteIdRT,
+        s.AvgDelaySec,
+        CAST(s.VLo AS FLOAT) + (s.Pos - FLOOR(s.Pos)) * (CAST(s.VHi AS FLOAT) - s.VLo) AS P95DelaySec,
+        s.OnTimeRatio,
+        s.ObsCount,
+        h.HwSum / NULLIF(h.HwCnt, 0) AS AvgHeadwaySec
+    INTO #result
+    FROM stats s
+    LEFT JOIN dw.Agg_Transit_15m_HeadwayAcc h
+      ON h.AggName = @AggName
+     AND h.DateKey = s.DateKey AND h.TimeSlot = s.TimeSlot AND h.StopId = s.StopId AND h.RouteIdRT = s.RouteIdRT;
+
+    IF @AggName = 'Demo'
+    BEGIN
+        DELETE a
+        FROM dw.Agg_Transit_15m_Demo a
+        JOIN #touched t
+          ON t.DateKey = a.DateKey AND t.TimeSlot = a.TimeSlot AND t.StopId = a.StopId AND t.RouteIdRT = a.RouteIdRT;
+
+        INSERT INTO dw.Agg_Transit_15m_Demo (DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec)
+        SELECT DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec
+        FROM #result;
+    END
+    ELSE
+    BEGIN
+        DELETE a
+        FROM dw.Agg_Transit_15m a
+        JOIN #touched t
+          ON t.DateKey = a.DateKey AND t.TimeSlot = a.TimeSlot AND t.StopId = a.StopId AND t.RouteIdRT = a.RouteIdRT;
+
+        INSERT INTO dw.Agg_Transit_15m (DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec)
+        SELECT DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec
+        FROM #result;
+    END
+END
+GO
+
+/* Vzjel ablak: (@FromID, @ToID] LoadID. Az j sorok slotjai a forrsbl teljesen jraszmoldnak.
+   Zrol READ COMMITTED mellett (alaprtelmezs) a (@FromID, @ToID] olvass megvrja a mg nyitott r
+   tranzakcit, gy egy kisebb, de ksbb commitolt LoadID sem marad ki. */
+CREATE OR ALTER PROCEDURE dw.usp_BuildAgg_Transit_15m_Incremental
+    @DaysBack INT = 14,           -- els futsnl (nincs vzjel) ennyi napot dolgozunk fel
+    @SketchKeepDays INT = 14      -- ennl rgebbi slotok hisztogramja trlhet (az agg sor megmarad)
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @FromID INT = (SELECT LastLoadID FROM dw.Agg_Watermark WHERE AggName = 'Main');
+    DECLARE @Since DATETIME2(0) = CAST(DATEADD(DAY, -@DaysBack, CAST(GETDATE() AS DATE)) AS DATETIME2(0));
+    DECLARE @ToID INT = (SELECT MAX(LoadID) FROM stg.RealTime_StopArrivals);
+    IF ISNULL(@ToID, 0) <= ISNULL(@FromID, 0) RETURN;   -- nincs j adat
+
+    -- az j sorok 15 perces slotjai, brmilyen rgi a SnapshotDT-jk (els futsnl: a @DaysBack ablak)
+    IF OBJECT_ID('tempdb..#slots') IS NOT NULL DROP TABLE #slots;
+    SELECT
+        SlotStart,
+        CONVERT(INT, CONVERT(VARCHAR(8), SlotStart, 112)) AS DateKey,
+        (DATEPART(HOUR, SlotStart)*60 + DATEPART(MINUTE, SlotStart))/15 AS TimeSlot
+    INTO #slots
+    FROM (
+        SELECT DISTINCT
+            DATEADD(MINUTE, ((DATEPART(HOUR, SnapshotDT)*60 + DATEPART(MINUTE, SnapshotDT))/15)*15,
+                    CAST(CAST(SnapshotDT AS DATE) AS DATETIME2(0))) AS SlotStart
+        FROM stg.RealTime_StopArrivals
+        WHERE LoadID <= @ToID
+          AND (LoadID > @FromID OR (@FromID IS NULL AND SnapshotDT >= @Since))
+    ) x;
+
+    -- a slotok minden sora (a @ToID utn bertak is: a slot a kvetkez futsnl gyis jra szmoldik)
+    IF OBJECT_ID('tempdb..#src') IS NOT NULL DROP TABLE #src;
+    SELECT
+        a.SnapshotDT,
+        s.DateKey,
+        s.TimeSlot,
+        a.StopId,
+        a.RouteIdRT,
+        a.DelaySec,
+        a.PredictedArrivalDT
+    INTO #src
+    FROM #slots s
+    JOIN stg.RealTime_StopArrivals a
+      ON a.SnapshotDT >= s.SlotStart AND a.SnapshotDT < DATEADD(MINUTE, 15, s.SlotStart)
+    WHERE a.StopId IS NOT NULL AND a.RouteIdRT IS NOT NULL;
+
+    IF OBJECT_ID('tempdb..#touched') IS NOT NULL DROP TABLE #touched;
+    SELECT DISTINCT DateKey, TimeSlot, StopId, RouteIdRT
+    INTO #touched
+    FROM #src
+    WHERE DelaySec IS NOT NULL;
+
+    BEGIN TRAN;
+
+    DELETE d
+    FROM dw.Agg_Transit_15m_DelayHist d
+    JOIN #slots s ON s.DateKey = d.DateKey AND s.TimeSlot = d.TimeSlot
+    WHERE d.AggName = 'Main';
+
+    INSERT INTO dw.Agg_Transit_15m_DelayHist (AggName, DateKey, TimeSlot, StopId, RouteIdRT, DelaySec, Cnt)
+    SELECT 'Main', DateKey, TimeSlot, StopId, RouteIdRT, DelaySec, COUNT(*)
+    FROM #src
+    WHERE DelaySec IS NOT NULL
+    GROUP BY DateKey, TimeSlot, StopId, RouteIdRT, DelaySec;
+
+    DELETE h
+    FROM dw.Agg_Transit_15m_HeadwayAcc h
+    JOIN #slots s ON s.DateKey = h.DateKey AND s.TimeSlot = h.TimeSlot
+    WHERE h.AggName = 'Main';
+
+    -- headway ugyangy, mint az eredeti SP-ben: snapshoton bell a rendezett predikcik klnbsge.
+    -- Egy snapshot minden sora ugyanabba a slotba esik (a slot a SnapshotDT-bl jn), s a slot teljes.
+    ;WITH hw_raw AS (
+        SELECT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            DATEDIFF(
+                SECOND,
+                PredictedArrivalDT,
+                LEAD(PredictedArrivalDT) OVER (
+                    PARTITION BY SnapshotDT, StopId, RouteIdRT
+                    ORDER BY PredictedArrivalDT
+                )
+            ) AS HeadwaySec
+        FROM #src
+        WHERE PredictedArrivalDT IS NOT NULL
+    )
+    INSERT INTO dw.Agg_Transit_15m_HeadwayAcc (AggName, DateKey, TimeSlot, StopId, RouteIdRT, HwSum, HwCnt)
+    SELECT 'Main', DateKey, TimeSlot, StopId, RouteIdRT,
+           SUM(CAST(HeadwaySec AS FLOAT)), COUNT(*)
+    FROM hw_raw
+    WHERE HeadwaySec IS NOT NULL
+      AND HeadwaySec > 0
+      AND HeadwaySec < 7200 -- 2 ra felett gyans, dobd
+    GROUP BY DateKey, TimeSlot, StopId, RouteIdRT;
+
+    EXEC dw.usp_Agg15m_RefreshTouched @AggName = 'Main';
+
+    DECLARE @LastDT DATETIME2(0) = (SELECT MAX(SnapshotDT) FROM #src);
+    MERGE dw.Agg_Watermark AS t
+    USING (SELECT 'Main' AS AggName) AS s ON t.AggName = s.AggName
+    WHEN MATCHED THEN UPDATE SET LastLoadID = @ToID, LastSnapshotDT = @LastDT, UpdatedAt = SYSDATETIME()
+    WHEN NOT MATCHED THEN INSERT (AggName, LastLoadID, LastSnapshotDT, UpdatedAt) VALUES ('Main', @ToID, @LastDT, SYSDATETIME());
+
+    DECLARE @KeepFromKey INT = CONVERT(INT, CONVERT(VARCHAR(8), DATEADD(DAY, -@SketchKeepDays, CAST(GETDATE() AS DATE)), 112));
+    DELETE FROM dw.Agg_Transit_15m_DelayHist  WHERE AggName = 'Main' AND DateKey < @KeepFromKey;
+    DELETE FROM dw.Agg_Transit_15m_HeadwayAcc WHERE AggName = 'Main' AND DateKey < @KeepFromKey;
+
+    COMMIT;
+END
+GO
+
+/* DEMO vltozat: kss a dw.vw_StopArrivals_Demo view-bl, headway a stg.RealTime_StopHeadway tblbl
+   (ugyanaz a logika, mint a dw.usp_BuildAgg_Transit_15m_Demo-ban); vzjel mindkt forrs LoadID-jn */
+CREATE OR ALTER PROCEDURE dw.usp_BuildAgg_Transit_15m_Demo_Incremental
+    @DaysBack INT = 7,
+    @SketchKeepDays INT = 14
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    DECLARE @FromID INT, @FromHwID INT;
+    SELECT @FromID = LastLoadID, @FromHwID = LastHeadwayLoadID FROM dw.Agg_Watermark WHERE AggName = 'Demo';
+    DECLARE @Since DATETIME2(0) = CAST(DATEADD(DAY, -@DaysBack, CAST(GETDATE() AS DATE)) AS DATETIME2(0));
+    DECLARE @ToID INT = ISNULL((SELECT MAX(LoadID) FROM stg.RealTime_StopArrivals), 0);
+    DECLARE @ToHwID INT = ISNULL((SELECT MAX(LoadID) FROM stg.RealTime_StopHeadway), 0);
+    IF @ToID <= ISNULL(@FromID, 0) AND @ToHwID <= ISNULL(@FromHwID, 0) RETURN;
+
+    IF OBJECT_ID('tempdb..#slots') IS NOT NULL DROP TABLE #slots;
+    SELECT
+        SlotStart,
+        CONVERT(INT, CONVERT(VARCHAR(8), SlotStart, 112)) AS DateKey,
+        (DATEPART(HOUR, SlotStart)*60 + DATEPART(MINUTE, SlotStart))/15 AS TimeSlot
+    INTO #slots
+    FROM (
+        SELECT DATEADD(MINUTE, ((DATEPART(HOUR, SnapshotDT)*60 + DATEPART(MINUTE, SnapshotDT))/15)*15,
+                       CAST(CAST(SnapshotDT AS DATE) AS DATETIME2(0))) AS SlotStart
+        FROM stg.RealTime_StopArrivals
+        WHERE LoadID <= @ToID
+          AND (LoadID > @FromID OR (@FromID IS NULL AND SnapshotDT >= @Since))
+        UNION
+        SELECT DATEADD(MINUTE, ((DATEPART(HOUR, SnapshotDT)*60 + DATEPART(MINUTE, SnapshotDT))/15)*15,
+                       CAST(CAST(SnapshotDT AS DATE) AS DATETIME2(0)))
+        FROM stg.RealTime_StopHeadway
+        WHERE LoadID <= @ToHwID
+          AND (LoadID > @FromHwID OR (@FromHwID IS NULL AND SnapshotDT >= @Since))
+    ) x;
+
+    IF OBJECT_ID('tempdb..#src') IS NOT NULL DROP TABLE #src;
+    SELECT
+        v.SnapshotDT,
+        s.DateKey,
+        s.TimeSlot,
+        v.StopId,
+        v.RouteIdRT,
+        v.DelaySec
+    INTO #src
+    FROM #slots s
+    JOIN dw.vw_StopArrivals_Demo v
+      ON v.SnapshotDT >= s.SlotStart AND v.SnapshotDT < DATEADD(MINUTE, 15, s.SlotStart)
+    WHERE v.DelaySec IS NOT NULL
+      AND v.StopId IS NOT NULL AND v.RouteIdRT IS NOT NULL;
+
+    IF OBJECT_ID('tempdb..#touched') IS NOT NULL DROP TABLE #touched;
+    SELECT DISTINCT DateKey, TimeSlot, StopId, RouteIdRT
+    INTO #touched
+    FROM #src;
+
+    BEGIN TRAN;
+
+    DELETE d
+    FROM dw.Agg_Transit_15m_DelayHist d
+    JOIN #slots s ON s.DateKey = d.DateKey AND s.TimeSlot = d.TimeSlot
+    WHERE d.AggName = 'Demo';
+
+    INSERT INTO dw.Agg_Transit_15m_DelayHist (AggName, DateKey, TimeSlot, StopId, RouteIdRT, DelaySec, Cnt)
+    SELECT 'Demo', DateKey, TimeSlot, StopId, RouteIdRT, DelaySec, COUNT(*)
+    FROM #src
+    GROUP BY DateKey, TimeSlot, StopId, RouteIdRT, DelaySec;
+
+    DELETE h
+    FROM dw.Agg_Transit_15m_HeadwayAcc h
+    JOIN #slots s ON s.DateKey = h.DateKey AND s.TimeSlot = h.TimeSlot
+    WHERE h.AggName = 'Demo';
+
+    INSERT INTO dw.Agg_Transit_15m_HeadwayAcc (AggName, DateKey, TimeSlot, StopId, RouteIdRT, HwSum, HwCnt)
+    SELECT 'Demo', s.DateKey, s.TimeSlot, h.StopId, h.RouteIdRT,
+           SUM(CAST(h.HeadwaySec AS FLOAT)), COUNT(*)
+    FROM #slots s
+    JOIN stg.RealTime_StopHeadway h
+      ON h.SnapshotDT >= s.SlotStart AND h.SnapshotDT < DATEADD(MINUTE, 15, s.SlotStart)
+    WHERE h.HeadwaySec IS NOT NULL
+      AND h.StopId IS NOT NULL AND h.RouteIdRT IS NOT NULL
+    GROUP BY s.DateKey, s.TimeSlot, h.StopId, h.RouteIdRT;
+
+    EXEC dw.usp_Agg15m_RefreshTouched @AggName = 'Demo';
+
+    DECLARE @LastDT DATETIME2(0) = (SELECT MAX(SnapshotDT) FROM #src);
+    MERGE dw.Agg_Watermark AS t
+    USING (SELECT 'Demo' AS AggName) AS s ON t.AggName = s.AggName
+    WHEN MATCHED THEN UPDATE SET LastLoadID = @ToID, LastHeadwayLoadID = @ToHwID, LastSnapshotDT = @LastDT,
+                                 UpdatedAt = SYSDATETIME()
+    WHEN NOT MATCHED THEN INSERT (AggName, LastLoadID, LastHeadwayLoadID, LastSnapshotDT, UpdatedAt)
+         VALUES ('Demo', @ToID, @ToHwID, @LastDT, SYSDATETIME());
+
+    DECLARE @KeepFromKey INT = CONVERT(INT, CONVERT(VARCHAR(8), DATEADD(DAY, -@SketchKeepDays, CAST(GETDATE() AS DATE)), 112));
+    DELETE FROM dw.Agg_Transit_15m_DelayHist  WHERE AggName = 'Demo' AND DateKey < @KeepFromKey;
+    DELETE FROM dw.Agg_Transit_15m_HeadwayAcc WHERE AggName = 'Demo' AND DateKey < @KeepFromKey;
+
+    COMMIT;
+END
+GO
+
+/* Vzjel + hisztogramok trlse: a kvetkez inkrementlis futs a @DaysBack ablakot jra felpti */
+CREATE OR ALTER PROCEDURE dw.usp_ResetAgg_Transit_15m_Incremental
+    @AggName VARCHAR(20) = 'Main'
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DELETE FROM dw.Agg_Watermark              WHERE AggName = @AggName;
+    DELETE FROM dw.Agg_Transit_15m_DelayHist  WHERE AggName = @AggName;
+    DELETE FROM dw.Agg_Transit_15m_HeadwayAcc WHERE AggName = @AggName;
+END
+GO
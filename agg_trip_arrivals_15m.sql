@@ -0,0 +1,117 @@
+USE BudAirportBI;
+GO
+
+/* 15 perces aggregtum a trip szint stg.RealTime_TripArrivals-bl (trip_arrivals.py)
+   - egy trip egy megfigyels: kss = a vgs predikci (FinalDelaySec, ha nincs: LastDelaySec)
+   - slot: az temezett rkezs (ScheduledArrivalDT) 15 perce, nem a snapshot idpontja
+   - headway: egymst kvet trip-ek vgs elrejelzett rkezse kzti id (megll + vonal + zemnap)
+   Kimenet: dw.Agg_Transit_15m_Trips, ugyanazokkal az oszlopokkal, mint a dw.Agg_Transit_15m
+
+   Futtats:  EXEC dw.usp_BuildAgg_Transit_15m_Trips @DaysBack = 14;
+*/
+
+IF OBJECT_ID('dw.Agg_Transit_15m_Trips','U') IS NULL
+CREATE TABLE dw.Agg_Transit_15m_Trips (
+    DateKey         INT NOT NULL,
+    TimeSlot        INT NOT NULL,
+    StopId          VARCHAR(50) NOT NULL,
+    RouteIdRT       VARCHAR(50) NOT NULL,
+    AvgDelaySec     FLOAT NULL,
+    P95DelaySec     FLOAT NULL,
+    OnTimeRatio     FLOAT NULL,
+    ObsCount        INT NOT NULL,
+    AvgHeadwaySec   FLOAT NULL,
+    CONSTRAINT PK_Agg_Transit_15m_Trips PRIMARY KEY (DateKey, TimeSlot, StopId, RouteIdRT)
+);
+GO
+
+CREATE OR ALTER PROCEDURE dw.usp_BuildAgg_Transit_15m_Trips
+    @DaysBack INT = 14
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @FromDate DATE = DATEADD(DAY, -@DaysBack, CAST(GETDATE() AS DATE));
+    DECLARE @FromDateKey INT = CONVERT(INT, CONVERT(VARCHAR(8), @FromDate, 112));
+
+    DELETE FROM dw.Agg_Transit_15m_Trips
+    WHERE DateKey >= @FromDateKey;
+
+    ;WITH t AS (
+        SELECT
+            CONVERT(INT, CONVERT(VARCHAR(8), CAST(ScheduledArrivalDT AS DATE), 112)) AS DateKey,
+            (DATEPART(HOUR, ScheduledArrivalDT)*60 + DATEPART(MINUTE, ScheduledArrivalDT))/15 AS TimeSlot,
+            ServiceDate,
+            StopId,
+            RouteIdRT,
+            COALESCE(FinalDelaySec, LastDelaySec) AS DelaySec,
+            COALESCE(FinalPredictedDT, LastPredictedDT) AS ArrivalDT
+        FROM stg.RealTime_TripArrivals
+        WHERE ServiceDate >= @FromDate
+          AND ScheduledArrivalDT >= @FromDate
+          AND RouteIdRT IS NOT NULL
+    ),
+    x AS (
+        SELECT DateKey, TimeSlot, StopId, RouteIdRT, DelaySec
+        FROM t
+        WHERE DelaySec IS NOT NULL
+    ),
+    stats AS (
+        SELECT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            AVG(CAST(DelaySec AS FLOAT)) AS AvgDelaySec,
+            AVG(CASE WHEN ABS(DelaySec) <= 60 THEN 1.0 ELSE 0.0 END) AS OnTimeRatio,
+            COUNT(*) AS ObsCount
+        FROM x
+        GROUP BY DateKey, TimeSlot, StopId, RouteIdRT
+    ),
+    p95 AS (
+        SELECT DISTINCT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY CAST(DelaySec AS FLOAT))
+                OVER (PARTITION BY DateKey, TimeSlot, StopId, RouteIdRT) AS P95DelaySec
+        FROM x
+    ),
+    hw_raw AS (
+        SELECT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            DATEDIFF(
+                SECOND,
+                ArrivalDT,
+                LEAD(ArrivalDT) OVER (
+                    PARTITION BY ServiceDate, StopId, RouteIdRT
+                    ORDER BY ArrivalDT
+                )
+            ) AS HeadwaySec
+        FROM t
+        WHERE ArrivalDT IS NOT NULL
+    ),
+    hw AS (
+        SELECT
+            DateKey, TimeSlot, StopId, RouteIdRT,
+            AVG(CAST(HeadwaySec AS FLOAT)) AS AvgHeadwaySec
+        FROM hw_raw
+        WHERE HeadwaySec IS NOT NULL
+          AND HeadwaySec > 0
+          AND HeadwaySec < 7200 -- 2 ra felett gyans, dobd
+        GROUP BY DateKey, TimeSlot, StopId, RouteIdRT
+    )
+    INSERT INTO dw.Agg_Transit_15m_Trips
+        (DateKey, TimeSlot, StopId, RouteIdRT, AvgDelaySec, P95DelaySec, OnTimeRatio, ObsCount, AvgHeadwaySec)
+    SELECT
+        s.DateKey,
+        s.TimeSlot,
+        s.StopId,
+        s.RouteIdRT,
+        s.AvgDelaySec,
+        p.P95DelaySec,
+        s.OnTimeRatio,
+        s.ObsCount,
+        h.AvgHeadwaySec
+    FROM stats s
+    JOIN p95 p
+      ON p.DateKey = s.DateKey AND p.TimeSlot = s.TimeSlot AND p.StopId = s.StopId AND p.RouteIdRT = s.RouteIdRT
+    LEFT JOIN hw h
+      ON h.DateKey = s.DateKey AND h.TimeSlot = s.TimeSlot AND h.StopId = s.StopId AND h.RouteIdRT = s.RouteIdRT;
+END
+GO
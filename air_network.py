@@ -0,0 +1,254 @@
+import os, sys, time, argparse
+import numpy as np
+import pandas as pd
+
+import backend
+import bulk_load
+
+# =========================================================
+# OpenFlights légi hálózat: CSR gráf + előre számolt elérhetőség BUD-ról (0 / 1 / 2 átszállás)
+# =========================================================
+# A dw.Fact_FlightRoutes csak a BUD-ot érintő közvetlen járatokat tartja, és a légitársaság párosítás
+# egy nem indexelhető "r.Airline = a.IATA OR r.Airline = a.ICAO" join a teljes stg.OpenFlights_Routes-on.
+# Itt a teljes routes.dat egyszer beolvasva:
+#   - légitársaság: a routes.dat AirlineID-ja, ha hiányzik (\N), a kód alapján egy előre felépített
+#     dict-ből (IATA és ICAO kód -> AirlineID; azonos kódnál az aktív, azon belül a kisebb ID); -1 = ismeretlen
+#   - AirNetwork: repülőterek sűrű indexen (0..n-1), élek forrás szerint rendezve: indptr / dst / airline
+#     tömbök (CSR); egy repülőtér kimenő élei egy szelet, sok csúcs kimenő élei egy np.repeat-tel
+#   - elérhetőség egy kiinduló reptérről, élek szintjén (légitársaságonként):
+#       dw.Fact_AirConnections: 1 átszállás: minden BUD -> hub -> cél út (első / második légitársaság)
+#                               2 átszállás: csak az 1 átszállással sem elérhető célokra, (hub1, hub2, cél,
+#                               első, utolsó légitársaság) szerint összevonva, Paths = középső járatok száma
+#       dw.Fact_AirReach:       célonként a minimális átszállásszám, ott a hubok / utak / légitársaságok száma,
+#                               és hogy elérhető-e egyetlen légitársasággal
+# A Power BI decomposition tree (cél -> hub -> légitársaság) ezekből a sorokból megy, ad hoc join nélkül.
+#
+# python air_network.py                  -> BUD, a táblák újraírása
+# python air_network.py --origin VIE
+# (az etl_static.py a dw.Fact_FlightRoutes után automatikusan futtatja, ha a routes / airlines változott)
+
+DATA_FOLDER = r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data"
+OPENFLIGHTS_ROUTES   = "routes.dat"
+OPENFLIGHTS_AIRLINES = "airlines.dat"
+
+SERVER = r"(localdb)\mssqllocaldb"
+DATABASE = "BudAirportBI"
+DRIVER = "ODBC Driver 17 for SQL Server"
+
+ORIGIN = "BUD"
+UNKNOWN_AIRLINE = -1   # airlines.dat: -1 = "Unknown"
+
+ROUTE_COLS = ["Airline", "AirlineID", "SourceAirport", "SourceID", "DestAirport", "DestID",
+              "Codeshare", "Stops", "Equipment"]
+AIRLINE_COLS = ["AirlineID", "Name", "Alias", "IATA", "ICAO", "Callsign", "Country", "Active"]
+
+CONN_COLS = ["OriginAirportID", "Stops", "Hub1AirportID", "Hub2AirportID", "DestAirportID",
+             "FirstAirlineID", "LastAirlineID", "Paths", "SameAirline"]
+REACH_COLS = ["OriginAirportID", "DestAirportID", "MinStops", "Hubs", "Paths", "Airlines", "SameAirline"]
+
+NETWORK_DDL = ["""
+IF OBJECT_ID('dw.Fact_AirConnections','U') IS NULL
+CREATE TABLE dw.Fact_AirConnections (
+    OriginAirportID INT NOT NULL,
+    Stops TINYINT NOT NULL,
+    Hub1AirportID INT NOT NULL,
+    Hub2AirportID INT NULL,
+    DestAirportID INT NOT NULL,
+    FirstAirlineID INT NOT NULL,
+    LastAirlineID INT NOT NULL,
+    Paths INT NOT NULL,
+    SameAirline BIT NOT NULL
+);""", """
+IF OBJECT_ID('dw.Fact_AirReach','U') IS NULL
+CREATE TABLE dw.Fact_AirReach (
+    OriginAirportID INT NOT NULL,
+    DestAirportID INT NOT NULL,
+    MinStops TINYINT NOT NULL,
+    Hubs INT NOT NULL,
+    Paths INT NOT NULL,
+    Airlines INT NOT NULL,
+    SameAirline BIT NOT NULL,
+    CONSTRAINT PK_Fact_AirReach PRIMARY KEY (OriginAirportID, DestAirportID)
+);"""]
+
+# ---------- beolvasás ----------
+def _read_dat(path, names):
+    df = pd.read_csv(path, header=None, names=names, dtype=str, encoding="utf-8", on_bad_lines="skip")
+    return df.replace({r"\N": None, "": None})
+
+def airline_lookup(airlines: pd.DataFrame) -> dict:
+    """IATA / ICAO kód -> AirlineID (egy dict, a route-onkénti OR join helyett)"""
+    al = airlines.assign(id=pd.to_numeric(airlines["AirlineID"], errors="coerce"))
+    al = al[al["id"].notna() & (al["id"] >= 0)]
+    # azonos kódnál (pl. megszűnt + új társaság) az aktív nyer, azon belül a kisebb ID
+    al = al.assign(inactive=al["Active"].ne("Y")).sort_values(["inactive", "id"], kind="stable")
+    lookup = {}
+    for col in ("ICAO", "IATA"):
+        codes = al[[col, "id"]].dropna()
+        codes = codes[codes[col].str.strip().str.len() > 1]
+        lookup.update(zip(codes[col].str.strip(), codes["id"].astype("int64")))
+    return lookup
+
+def resolve_airlines(routes: pd.DataFrame, lookup: dict) -> np.ndarray:
+    ids = pd.to_numeric(routes["AirlineID"], errors="coerce")
+    by_code = routes["Airline"].str.strip().map(lookup)
+    return ids.fillna(by_code).fillna(UNKNOWN_AIRLINE).astype("int64").to_numpy()
+
+# ---------- gráf ----------
+class AirNetwork:
+    def __init__(self, src_ids, dst_ids, airline_ids):
+        src = np.asarray(src_ids, dtype=np.int64)
+        dst = np.asarray(dst_ids, dtype=np.int64)
+        airline = np.asarray(airline_ids, dtype=np.int64)
+        self.airports = np.unique(np.concatenate([src, dst]))    # index -> AirportID
+        s, d = np.searchsorted(self.airports, src), np.searchsorted(self.airports, dst)
+
+        # (forrás, cél, légitársaság) egyszer; forrás szerint rendezve -> CSR
+        edges = np.unique(np.column_stack([s, d, airline]), axis=0)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        n = len(self.airports)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edges[:, 0], minlength=n), out=self.indptr[1:])
+        self.dst = edges[:, 1].copy()
+        self.airline = edges[:, 2].copy()
+
+    def __len__(self):
+        return len(self.dst)
+
+    @classmethod
+    def from_routes(cls, routes: pd.DataFrame, lookup: dict):
+        src = pd.to_numeric(routes["SourceID"], errors="coerce")
+        dst = pd.to_numeric(routes["DestID"], errors="coerce")
+        ok = (src.notna() & dst.notna()).to_numpy()
+        net = cls(src[ok], dst[ok], resolve_airlines(routes, lookup)[ok])
+        # IATA kód -> AirportID, a kiinduló reptér megadásához
+        codes = pd.concat([
+            routes.loc[ok, ["SourceAirport"]].set_axis(["code"], axis=1).assign(id=src[ok]),
+            routes.loc[ok, ["DestAirport"]].set_axis(["code"], axis=1).assign(id=dst[ok]),
+        ]).dropna().drop_duplicates("code")
+        net.codes = dict(zip(codes["code"], codes["id"].astype("int64")))
+        return net
+
+    def index(self, airport_id):
+        i = int(np.searchsorted(self.airports, airport_id))
+        return i if i < len(self.airports) and self.airports[i] == airport_id else -1
+
+    def out_edges(self, nodes):
+        """csúcsok (index tömb) kimenő élei egyben -> (él indexek, melyik csúcs sorából)"""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = self.indptr[nodes]
+        cnt = self.indptr[nodes + 1] - starts
+        pos = np.repeat(np.arange(len(nodes)), cnt)
+        first = np.cumsum(cnt) - cnt
+        return np.repeat(starts, cnt) + (np.arange(cnt.sum()) - np.repeat(first, cnt)), pos
+
+    def reach(self, origin_id):
+        """-> (dw.Fact_AirConnections sorok, dw.Fact_AirReach sorok) egy kiinduló repülőtérre"""
+        o = self.index(origin_id)
+        if o < 0:
+            return pd.DataFrame(columns=CONN_COLS), pd.DataFrame(columns=REACH_COLS)
+        ids = self.airports
+
+        # 0 átszállás
+        e1, _ = self.out_edges([o])
+        h1, a1 = self.dst[e1], self.airline[e1]
+        # 1 átszállás: minden (első él, második él) pár
+        e2, p1 = self.out_edges(h1)
+        d1 = self.dst[e2]
+        keep = (d1 != o) & (d1 != h1[p1])
+        one = pd.DataFrame({"Hub1": h1[p1][keep], "Dest": d1[keep], "First": a1[p1][keep], "Last": self.airline[e2][keep]})
+
+        # 2 átszállás: csak az eddig el nem ért célokra; a harmadik élből csak az új célba menők kellenek
+        seen = np.zeros(len(ids), dtype=bool)
+        seen[o] = True
+        seen[h1] = True
+        seen[one["Dest"].to_numpy()] = True
+        e3_ok = ~seen[self.dst]
+        src = np.repeat(np.arange(len(ids)), np.diff(self.indptr))
+        new_deg = np.bincount(src[e3_ok], minlength=len(ids))
+        mid = one[new_deg[one["Dest"].to_numpy()] > 0]
+        e3, p2 = self.out_edges(mid["Dest"].to_numpy())
+        e3_keep = e3_ok[e3]
+        e3, p2 = e3[e3_keep], p2[e3_keep]
+        two = pd.DataFrame({
+            "Hub1": mid["Hub1"].to_numpy()[p2], "Hub2": mid["Dest"].to_numpy()[p2], "Dest": self.dst[e3],
+            "First": mid["First"].to_numpy()[p2], "Mid": mid["Last"].to_numpy()[p2], "Last": self.airline[e3],
+        })
+        two["Same"] = (two["First"] == two["Mid"]) & (two["Mid"] == two["Last"])
+        two = (two.groupby(["Hub1", "Hub2", "Dest", "First", "Last"], as_index=False, sort=False)
+                  .agg(Paths=("Mid", "size"), Same=("Same", "any")))
+
+        conn = pd.concat([
+            pd.DataFrame({"Stops": 1, "Hub1AirportID": ids[one["Hub1"]], "Hub2AirportID": None,
+                          "DestAirportID": ids[one["Dest"]], "FirstAirlineID": one["First"].to_numpy(),
+                          "LastAirlineID": one["Last"].to_numpy(), "Paths": 1,
+                          "SameAirline": (one["First"] == one["Last"]).to_numpy()}),
+            pd.DataFrame({"Stops": 2, "Hub1AirportID": ids[two["Hub1"]], "Hub2AirportID": ids[two["Hub2"]],
+                          "DestAirportID": ids[two["Dest"]], "FirstAirlineID": two["First"].to_numpy(),
+                          "LastAirlineID": two["Last"].to_numpy(), "Paths": two["Paths"].to_numpy(),
+                          "SameAirline": two["Same"].to_numpy()}),
+        ], ignore_index=True)
+        conn.insert(0, "OriginAirportID", origin_id)
+        conn = conn.astype({"Hub2AirportID": "Int64"})
+
+        # célonként a minimális átszállásszámon
+        direct = pd.DataFrame({"DestAirportID": ids[h1], "MinStops": 0, "Hub": -1, "Paths": 1,
+                               "Airline": a1, "Same": True})
+        best = pd.concat([
+            direct,
+            conn.rename(columns={"Stops": "MinStops", "Hub1AirportID": "Hub", "FirstAirlineID": "Airline",
+                                 "SameAirline": "Same"})[["DestAirportID", "MinStops", "Hub", "Paths", "Airline", "Same"]],
+        ], ignore_index=True)
+        best = best[best["MinStops"] == best.groupby("DestAirportID")["MinStops"].transform("min")]
+        reach = best.groupby("DestAirportID", as_index=False).agg(
+            MinStops=("MinStops", "first"), Hubs=("Hub", "nunique"), Paths=("Paths", "sum"),
+            Airlines=("Airline", "nunique"), SameAirline=("Same", "any"))
+        reach.loc[reach["MinStops"] == 0, "Hubs"] = 0
+        reach.insert(0, "OriginAirportID", origin_id)
+        return conn[CONN_COLS], reach[REACH_COLS]
+
+# ---------- DB ----------
+def load_network(data_folder=DATA_FOLDER):
+    routes = _read_dat(os.path.join(data_folder, OPENFLIGHTS_ROUTES), ROUTE_COLS)
+    airlines = _read_dat(os.path.join(data_folder, OPENFLIGHTS_AIRLINES), AIRLINE_COLS)
+    return AirNetwork.from_routes(routes, airline_lookup(airlines))
+
+def build(conn, data_folder=DATA_FOLDER, origin=ORIGIN, net=None):
+    """a kiinduló reptér sorainak újraírása mindkét táblában; -> (kapcsolat sorok, elérhető célok)"""
+    for ddl in NETWORK_DDL:
+        conn.exec_driver_sql(backend.sql(ddl))
+    net = net or load_network(data_folder)
+    origin_id = net.codes.get(origin)
+    if origin_id is None:
+        print(f"⚠️ {origin} nem szerepel a routes.dat-ban")
+        return 0, 0
+    connections, reach = net.reach(origin_id)
+    for table in ("Fact_AirConnections", "Fact_AirReach"):
+        conn.exec_driver_sql(f"DELETE FROM dw.{table} WHERE OriginAirportID = ?", (int(origin_id),))
+    n = bulk_load.insert(conn, connections, "Fact_AirConnections", "dw", report=False)
+    bulk_load.insert(conn, reach, "Fact_AirReach", "dw", report=False)
+    return n, len(reach)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpenFlights CSR gráf -> dw.Fact_AirConnections / dw.Fact_AirReach")
+    ap.add_argument("--origin", default=ORIGIN, help="kiinduló repülőtér IATA kódja")
+    ap.add_argument("--data", default=DATA_FOLDER, help="routes.dat / airlines.dat mappája")
+    args = ap.parse_args(sys.argv[1:] if argv is None else argv)
+
+    t0 = time.perf_counter()
+    net = load_network(args.data)
+    t1 = time.perf_counter()
+    print(f"→ gráf: {len(net.airports)} repülőtér, {len(net)} él ({t1 - t0:.2f}s)")
+
+    engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+    with engine.begin() as conn:
+        n, dests = build(conn, args.data, args.origin, net)
+        if dests:
+            for stops, cnt, paths in conn.exec_driver_sql(
+                    "SELECT MinStops, COUNT(*), SUM(Paths) FROM dw.Fact_AirReach WHERE OriginAirportID = ? "
+                    "GROUP BY MinStops ORDER BY MinStops", (int(net.codes[args.origin]),)).fetchall():
+                print(f"   {stops} átszállás: {cnt} cél, {paths} út")
+    print(f"✅ {args.origin}: {n} kapcsolat sor, {dests} elérhető cél | {time.perf_counter() - t1:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os, re
+from datetime import datetime
+
+# =========================================================
+# FUTÁR arrivals-and-departures-for-stop feldolgozás (DB/hálózat nélkül)
+# =========================================================
+# Külön modulban, hogy a realtime ingest, az async poller és a backfill
+# process pool workerei is importálhassák mellékhatás (engine, mappák) nélkül.
+
+# az első gyűjtés célja: ezek a bkk_100e_arr_*.json fájlok
+LEGACY_STOP_ID = "BKK_F00950"
+LEGACY_ROUTE_ID = "BKK_1005"
+
+# bkk_100e_arr_20251214_213817.json / bkk_BKK_2005__BKK_089411_arr_20251214_213817.json
+RAW_ARR_RE = re.compile(r"^bkk_(?P<target>.+)_arr_(?P<ts>\d{8}_\d{6})\.json$")
+
+# a stg táblák oszlopai; a parse sorai ennél többet is tartalmazhatnak (pl. ServiceDate), az írók ezekre szűkítenek
+ARRIVAL_COLS = ["SnapshotDT", "StopId", "RouteIdRT", "TripId", "ScheduledArrivalDT",
+                "PredictedArrivalDT", "DelaySec", "RawFile"]
+HEADWAY_COLS = ["SnapshotDT", "StopId", "RouteIdRT", "HeadwaySec", "RawFile"]
+
+def epoch_to_dt(x):
+    if x is None:
+        return None
+    x = int(x)
+    if x > 10**12:
+        x //= 1000
+    return datetime.fromtimestamp(x)
+
+def service_date(x, sched=None):
+    """FUTÁR serviceDate ("20251214" vagy epoch) -> date; ha nincs, az ütemezett idő napja"""
+    if x not in (None, ""):
+        s = str(x)
+        if len(s) == 8 and s.isdigit():
+            return datetime.strptime(s, "%Y%m%d").date()
+        if s.isdigit():
+            return epoch_to_dt(s).date()
+    return sched.date() if sched else None
+
+def normalize_route(x: str) -> str:
+    # biztos ami biztos: "BKK_1005" vs "1005"
+    if not x:
+        return ""
+    return x.replace(" ", "")
+
+def raw_file_name(ts: str, stop_id: str = LEGACY_STOP_ID, route_id: str = LEGACY_ROUTE_ID) -> str:
+    # az eredeti (100E @ Deák tér) cél marad a régi néven, a többi: bkk_<route>__<stop>_arr_<ts>.json
+    if stop_id == LEGACY_STOP_ID and route_id == LEGACY_ROUTE_ID:
+        return f"bkk_100e_arr_{ts}.json"
+    return f"bkk_{normalize_route(route_id)}__{stop_id}_arr_{ts}.json"
+
+def parse_raw_name(raw_name):
+    """raw_file_name inverze: -> (stop_id, route_id, snapshot datetime) vagy None"""
+    m = RAW_ARR_RE.match(os.path.basename(raw_name))
+    if not m:
+        return None
+    snap_dt = datetime.strptime(m.group("ts"), "%Y%m%d_%H%M%S")
+    if m.group("target") == "100e":
+        return LEGACY_STOP_ID, LEGACY_ROUTE_ID, snap_dt
+    route_id, sep, stop_id = m.group("target").partition("__")
+    if not sep:
+        return None
+    return stop_id, route_id, snap_dt
+
+def parse_arrivals(data, snap_dt, raw_name, route_id=LEGACY_ROUTE_ID, stop_id=None):
+    """Egy arrivals-and-departures-for-stop válasz -> (érkezés sorok, headway sorok)"""
+    entry = (data.get("data") or {}).get("entry") or {}
+    refs  = (data.get("data") or {}).get("references") or {}
+    trips_ref = refs.get("trips") or {}
+    stop_id = stop_id or entry.get("stopId")
+
+    rows = []
+    pred_times = []
+
+    aad = entry.get("arrivalsAndDepartures")
+    if isinstance(aad, list) and len(aad) > 0:
+        # --- ESET 1: arrivalsAndDepartures (ha valamikor ilyen jön) ---
+        for a in aad:
+            rid = a.get("routeId")
+            if rid != route_id:
+                continue
+
+            sched = epoch_to_dt(a.get("scheduledArrivalTime")) or epoch_to_dt(a.get("scheduledDepartureTime"))
+            pred  = epoch_to_dt(a.get("predictedArrivalTime")) or epoch_to_dt(a.get("predictedDepartureTime"))
+
+            delay = None
+            if sched and pred:
+                delay = int((pred - sched).total_seconds())
+
+            if pred:
+                pred_times.append(pred)
+
+            rows.append({
+                "SnapshotDT": snap_dt,
+                "StopId": entry.get("stopId"),
+                "RouteIdRT": rid,
+                "TripId": a.get("tripId"),
+                "ServiceDate": service_date(a.get("serviceDate"), sched),
+                "ScheduledArrivalDT": sched,
+                "PredictedArrivalDT": pred,
+                "DelaySec": delay,
+                "RawFile": raw_name
+            })
+
+    else:
+        # --- ESET 2: stopTimes (NÁLAD EZ JÖN) ---
+        st = entry.get("stopTimes") or []
+        for s in st:
+            trip_id = s.get("tripId")
+            rid = (trips_ref.get(trip_id) or {}).get("routeId")  # <- innen jön, és a fájlban BKK_1005
+            if rid != route_id:
+                continue
+
+            # stopTimes-ban ezek a mezők vannak: departureTime / predictedDepartureTime (epoch sec)
+            sched = epoch_to_dt(s.get("departureTime"))  # scheduled
+            pred  = epoch_to_dt(s.get("predictedDepartureTime")) or sched  # ha nincs predicted, legyen sched
+
+            delay = None
+            if sched and pred:
+                delay = int((pred - sched).total_seconds())
+
+            if pred:
+                pred_times.append(pred)
+
+            rows.append({
+                "SnapshotDT": snap_dt,
+                "StopId": entry.get("stopId"),
+                "RouteIdRT": rid,
+                "TripId": trip_id,
+                "ServiceDate": service_date(s.get("serviceDate"), sched),
+                "ScheduledArrivalDT": sched,
+                "PredictedArrivalDT": pred,
+                "DelaySec": delay,
+                "RawFile": raw_name
+            })
+
+    return rows, headway_rows(pred_times, snap_dt, stop_id, route_id, raw_name)
+
+def headway_rows(pred_times, snap_dt, stop_id, route_id, raw_name):
+    """headway: a következő predikciók közti különbség (egy snapshot előrejelzett érkezéseiből)"""
+    head_rows = []
+    pred_times = sorted([t for t in pred_times if t is not None])
+    for i in range(1, len(pred_times)):
+        hw = int((pred_times[i] - pred_times[i-1]).total_seconds())
+        # szűrés: 1 perc .. 60 perc között
+        if 60 <= hw <= 3600:
+            head_rows.append({
+                "SnapshotDT": snap_dt,
+                "StopId": stop_id,
+                "RouteIdRT": route_id,
+                "HeadwaySec": hw,
+                "RawFile": raw_name
+            })
+    return head_rows
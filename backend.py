@@ -0,0 +1,83 @@
+import os
+import re
+import urllib
+import sqlalchemy
+
+# =========================================================
+# DB backend választás: SQL Server LocalDB vagy beágyazott DuckDB
+# =========================================================
+# "mssql":  (localdb)\mssqllocaldb, pyodbc (alap, Power BI ezt olvassa)
+# "duckdb": beágyazott, oszlopos, egyetlen fájl (duckdb_engine) - bármilyen gépen fut, ODBC nélkül;
+#           ugyanazok a stg / dw táblanevek, a dw.usp_BuildAgg_* SP-k helyett az agg_15m.py számol
+# Felülírható környezeti változóval: BUDAIRPORTBI_BACKEND=duckdb
+#
+# A DuckDB fájlt egyszerre csak egy processz írhatja (pl. ne fusson párhuzamosan a poller és az ETL).
+
+BACKEND = os.environ.get("BUDAIRPORTBI_BACKEND", "mssql").strip().lower()
+DUCKDB_PATH = os.environ.get(
+    "BUDAIRPORTBI_DUCKDB",
+    r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data\BudAirportBI.duckdb",
+)
+
+def is_duckdb():
+    return BACKEND == "duckdb"
+
+def make_engine(server, database, driver):
+    if is_duckdb():
+        folder = os.path.dirname(DUCKDB_PATH)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        engine = sqlalchemy.create_engine(f"duckdb:///{DUCKDB_PATH}")
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE SCHEMA IF NOT EXISTS stg; CREATE SCHEMA IF NOT EXISTS dw;"))
+        return engine
+    if BACKEND != "mssql":
+        raise SystemExit(f"❌ Ismeretlen backend: {BACKEND} (mssql | duckdb)")
+
+    connection_string = f"DRIVER={{{driver}}};SERVER={server};DATABASE={database};Trusted_Connection=yes;"
+    params = urllib.parse.quote_plus(connection_string)
+    return sqlalchemy.create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
+
+# ---------- T-SQL -> DuckDB (csak amit a projekt DDL/DML-je használ) ----------
+_CREATE_SCHEMA = re.compile(
+    r"IF\s+NOT\s+EXISTS\s*\(\s*SELECT\s+1\s+FROM\s+sys\.schemas\s+WHERE\s+name\s*=\s*'(\w+)'\s*\)\s*"
+    r"EXEC\s*\(\s*'CREATE SCHEMA \w+'\s*\)", re.I)
+_CREATE_TABLE = re.compile(r"IF\s+OBJECT_ID\(\s*'[\w.]+'\s*,\s*'U'\s*\)\s+IS\s+NULL\s+CREATE\s+TABLE\s+([\w.]+)", re.I)
+# oszlop migráció: IF COL_LENGTH('s.t','c') IS NULL ALTER TABLE s.t ADD c típus
+_ADD_COLUMN = re.compile(r"IF\s+COL_LENGTH\(\s*'[\w.]+'\s*,\s*'\w+'\s*\)\s+IS\s+NULL\s+ALTER\s+TABLE\s+([\w.]+)\s+ADD\s+", re.I)
+_IDENTITY = re.compile(r"\b(\w+)\s+INT\s+IDENTITY\s*\(\s*1\s*,\s*1\s*\)", re.I)
+
+_RULES = [
+    (re.compile(r"\bNVARCHAR\b", re.I), "VARCHAR"),
+    (re.compile(r"\bVARCHAR\s*\(\s*MAX\s*\)", re.I), "VARCHAR"),
+    (re.compile(r"\bDATETIME2(\s*\(\s*\d+\s*\))?", re.I), "TIMESTAMP"),
+    (re.compile(r"\bBIT\b", re.I), "BOOLEAN"),
+    (re.compile(r"\bFLOAT\b", re.I), "DOUBLE"),          # T-SQL FLOAT = 8 bájt, DuckDB FLOAT = 4 bájt
+    (re.compile(r"\[(\w+)\]"), r'"\1"'),
+    (re.compile(r"\b(SYSDATETIME|GETDATE)\(\)", re.I), "current_localtimestamp()"),
+    (re.compile(r"\bCOUNT_BIG\(", re.I), "COUNT("),
+]
+
+def translate(stmt: str) -> str:
+    """A projekt T-SQL utasításai DuckDB nyelvjárásra"""
+    out = _CREATE_SCHEMA.sub(r"CREATE SCHEMA IF NOT EXISTS \1", stmt)
+    out = _ADD_COLUMN.sub(r"ALTER TABLE \1 ADD COLUMN IF NOT EXISTS ", out)
+
+    m = _CREATE_TABLE.search(out)
+    if m:
+        table = m.group(1)
+        out = _CREATE_TABLE.sub(r"CREATE TABLE IF NOT EXISTS \1", out)
+        if _IDENTITY.search(out):
+            # IDENTITY helyett szekvencia + DEFAULT nextval
+            schema, _, name = table.rpartition(".")
+            seq = f"{schema + '.' if schema else ''}seq_{name}"
+            out = _IDENTITY.sub(rf"\1 INTEGER DEFAULT nextval('{seq}')", out)
+            out = f"CREATE SEQUENCE IF NOT EXISTS {seq};\n{out}"
+
+    for rx, repl in _RULES:
+        out = rx.sub(repl, out)
+    return out
+
+def sql(stmt: str) -> str:
+    """Az aktuális backendnek megfelelő SQL (mssql: változatlan)"""
+    return translate(stmt) if is_duckdb() else stmt
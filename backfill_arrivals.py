@@ -0,0 +1,190 @@
+import os, glob, time, argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+import bulk_load
+import futar_decode
+import snapshot_archive
+import trip_arrivals
+from arrivals_parse import ARRIVAL_COLS, HEADWAY_COLS, parse_raw_name
+
+# =========================================================
+# stg.RealTime_StopArrivals / stg.RealTime_StopHeadway / stg.RealTime_TripArrivals újraépítése a nyers archívumból
+# =========================================================
+# python backfill_arrivals.py                                   -> alap mappa (Data\arrivals\RealTime_JSON)
+# python backfill_arrivals.py Data\arrivals\RealTime_JSON Data\RealTime_JSON\arrivals
+# python backfill_arrivals.py --archive bkk_100e_arr            -> snapshot_archive stream
+#
+# Idempotens: a már betöltött RawFile-okat kihagyja, így bármikor újra futtatható.
+# A stg.RealTime_TripArrivals-ba is ír (trip_arrivals.upsert); az újra beküldött snapshotokat az is kiszűri.
+# A workerek a nyers bájtokat típusosan dekódolják (futar_decode.py) egyenesen oszlopos batch-be.
+
+DEFAULT_SRC = r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data\arrivals\RealTime_JSON"
+
+FILES_PER_TASK = 200        # ennyi fájlt dolgoz fel egy worker egy feladatban
+WRITE_BATCH_ROWS = 200_000  # ennyi sor gyűlik össze egy DB írás előtt
+INFLIGHT_PER_WORKER = 2     # workerenként ennyi beküldött, még fel nem dolgozott feladat (korlátos memória)
+
+# ---------- worker oldal (külön processz, DB nélkül) ----------
+def _parse_one(batch, raw_name, body):
+    meta = parse_raw_name(raw_name)
+    if meta is None:
+        return
+    stop_id, route_id, snap_dt = meta
+    batch.add(futar_decode.decode_arrivals(body), snap_dt, raw_name, route_id, stop_id)
+
+def _frames(batch):
+    # ServiceDate is megy a fő processzbe (stg.RealTime_TripArrivals), a stg.RealTime_StopArrivals-ba nem
+    return batch.frame(), pd.DataFrame(batch.head_rows, columns=HEADWAY_COLS)
+
+def parse_files(paths):
+    batch, bad = futar_decode.ArrivalColumns(), 0
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                _parse_one(batch, os.path.basename(path), f.read())
+        except (OSError, futar_decode.DecodeError):
+            bad += 1
+    return _frames(batch) + (len(paths), bad)
+
+def parse_segment(bin_path, stream, entries):
+    """entries: [(ts_ms, offset, hossz), ...] egy szegmensből"""
+    batch, bad = futar_decode.ArrivalColumns(), 0
+    with open(bin_path, "rb") as f:
+        for ts_ms, offset, length in entries:
+            f.seek(offset + snapshot_archive.REC_HDR.size)
+            try:
+                _parse_one(batch, archive_raw_name(stream, ts_ms), snapshot_archive.payload_bytes(f.read(length)))
+            except futar_decode.DecodeError:
+                bad += 1
+    return _frames(batch) + (len(entries), bad)
+
+def archive_raw_name(stream, ts_ms):
+    # ugyanaz a név, amit a fájl alapú gyűjtés adott volna -> RawFile egyezik, migráció után sem duplikál
+    return f"{stream}_{snapshot_archive.ms_to_dt(ts_ms).strftime('%Y%m%d_%H%M%S')}.json"
+
+# ---------- fő processz ----------
+def loaded_raw_files(engine):
+    sql = """
+        SELECT DISTINCT RawFile FROM stg.RealTime_StopArrivals WHERE RawFile IS NOT NULL
+        UNION
+        SELECT DISTINCT RawFile FROM stg.RealTime_StopHeadway WHERE RawFile IS NOT NULL
+    """
+    return set(pd.read_sql(sql, engine)["RawFile"].astype(str))
+
+def build_tasks(srcs, streams, loaded):
+    tasks, pending, skipped = [], 0, 0
+
+    for src in srcs:
+        paths = sorted(glob.glob(os.path.join(src, "*.json")))
+        todo = []
+        for path in paths:
+            name = os.path.basename(path)
+            if parse_raw_name(name) is None:
+                continue
+            if name in loaded:
+                skipped += 1
+                continue
+            todo.append(path)
+        pending += len(todo)
+        for i in range(0, len(todo), FILES_PER_TASK):
+            tasks.append((parse_files, (todo[i:i + FILES_PER_TASK],)))
+
+    for stream in streams:
+        for seg in snapshot_archive.ArchiveReader(stream).segments:
+            todo = []
+            for ts_ms, offset, length, flags in seg.entries():
+                if archive_raw_name(stream, ts_ms) in loaded:
+                    skipped += 1
+                    continue
+                todo.append((ts_ms, offset, length))
+            pending += len(todo)
+            for i in range(0, len(todo), FILES_PER_TASK):
+                tasks.append((parse_segment, (seg.bin_path, stream, todo[i:i + FILES_PER_TASK])))
+
+    return tasks, pending, skipped
+
+def write_batch(engine, arr_frames, hw_frames, write_raw=True):
+    arr = pd.concat(arr_frames, ignore_index=True) if arr_frames else None
+    hw = pd.concat(hw_frames, ignore_index=True) if hw_frames else None
+    # egy tranzakció: egy fájl sorai vagy mind bent vannak, vagy egyik sem (RawFile alapú skip miatt fontos)
+    with engine.begin() as conn:
+        if arr is not None:
+            trip_arrivals.upsert(conn, arr.to_dict("records"))
+            if write_raw:
+                bulk_load.insert(conn, arr[ARRIVAL_COLS], "RealTime_StopArrivals", "stg", report=False)
+        bulk_load.insert(conn, hw, "RealTime_StopHeadway", "stg", report=False)
+    return (0 if arr is None else len(arr)), (0 if hw is None else len(hw))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="RealTime_StopArrivals/StopHeadway backfill a nyers JSON archívumból")
+    ap.add_argument("src", nargs="*", help="JSON mappa(k) (alap: Data\\arrivals\\RealTime_JSON)")
+    ap.add_argument("--archive", action="append", default=[], metavar="STREAM",
+                    help="snapshot_archive stream (pl. bkk_100e_arr), többször is megadható")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--dry-run", action="store_true", help="csak feldolgozás, DB írás nélkül")
+    args = ap.parse_args(argv)
+
+    srcs = args.src or ([] if args.archive else [DEFAULT_SRC])
+
+    # csak itt importáljuk: a workereknek nem kell engine / ODBC
+    import realtime_ingest_100e as rt
+    engine = rt.engine
+
+    print(f"--- Backfill: {', '.join(srcs + ['archive:' + s for s in args.archive])} ---")
+    t0 = time.perf_counter()
+    if args.dry_run:
+        loaded = set()
+    else:
+        rt.ensure_tables()
+        loaded = loaded_raw_files(engine)
+    tasks, pending, skipped = build_tasks(srcs, args.archive, loaded)
+    print(f"→ {pending} snapshot feldolgozandó, "
+          f"{skipped} már betöltve ({len(tasks)} feladat, {args.workers} worker)")
+
+    snaps = bad = 0
+    totals = [0, 0]
+    buf = ([], [])
+
+    def flush():
+        if args.dry_run:
+            a, h = sum(map(len, buf[0])), sum(map(len, buf[1]))
+        else:
+            a, h = write_batch(engine, buf[0], buf[1], rt.WRITE_RAW_ARRIVALS)
+        totals[0] += a
+        totals[1] += h
+        buf[0].clear()
+        buf[1].clear()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # korlátos ablak: nem megy be egyszerre minden feladat, és a feldolgozott future kikerül az ablakból,
+        # így a kész DataFrame-ek nem maradnak a memóriában; az eredmények a beküldés sorrendjében jönnek
+        todo = iter(tasks)
+        window = deque()
+        for fn, a in todo:
+            window.append(pool.submit(fn, *a))
+            if len(window) >= INFLIGHT_PER_WORKER * args.workers:
+                break
+        while window:
+            arr, hw, n, nbad = window.popleft().result()
+            nxt = next(todo, None)
+            if nxt is not None:
+                window.append(pool.submit(nxt[0], *nxt[1]))
+            snaps += n
+            bad += nbad
+            buf[0].append(arr)
+            buf[1].append(hw)
+            if sum(map(len, buf[0])) + sum(map(len, buf[1])) >= WRITE_BATCH_ROWS:
+                flush()
+                print(f"   ... {snaps} snapshot | arrivals={totals[0]} | headways={totals[1]}")
+    if buf[0]:
+        flush()
+
+    dt = time.perf_counter() - t0
+    print(f"✅ Kész: {snaps} snapshot ({bad} hibás) | arrivals={totals[0]} | headways={totals[1]} "
+          f"| {dt:.1f}s ({snaps / dt if dt else 0:.0f} snapshot/s)")
+    bulk_load.summary()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import os, sys, gc, io, glob, json, time, argparse, platform, tempfile, tracemalloc, subprocess, contextlib
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# Offline benchmark a pipeline lépéseire a Data\ mappa fájljain
+# =========================================================
+# Lépések, külön-külön mérve (a lépés előkészítése - fájl lista, előre beolvasott chunkok - nem számít bele):
+#   csv_staging             OpenFlights .dat + GTFS .txt -> stg táblák (etl_static.STG_LOADERS)
+#   stop_times_filter       100E trip-ek stop_times sorai a .tidx indexszel (etl_static.read_stop_times)
+#   stop_times_filter_scan  ugyanez teljes chunkolt olvasással (USE_STOP_TIMES_INDEX = False ág)
+#   segments                stop_times -> menetrendi szakaszok (gtfs_segments.SegmentBuilder)
+#   arrivals_parse          nyers arrivals JSON -> sorok (backfill_arrivals.parse_files: olvasás + decode + parse)
+#   headway                 snapshotonkénti headway a predikciókból (arrivals_parse.headway_rows)
+#   agg_15m                 dw.Agg_Transit_15m újraszámolása (agg_15m.build, DuckDB SQL)
+# Lépésenként: legjobb / medián idő --repeat futásból, sor/s és MB/s, valamint egy külön, tracemalloc-kal
+# mért futás csúcs memóriája (Python + numpy/pandas foglalások; a DuckDB saját memóriáját nem látja).
+# A tracemalloc lassít, ezért az időt nem abból a futásból vesszük.
+#
+# Hálózat és SQL Server nélkül fut: a DB lépések egy ideiglenes DuckDB fájlba írnak (backend.py).
+# A stop_times.txt / trips.txt nincs a repóban (több száz MB): ha a --data mappában nincs, a routes.txt /
+# stops.txt / calendar_dates.txt alapján fix seed-del szintetikus menetrend készül (--synth-trips trip).
+#
+# Eredmény: egy JSON sor / lépés / futás a --out fájlba (run_id, git commit, verziók), és összevetés
+# az előző futással (vagy --baseline RUN_ID / címke).
+#
+# python bench_pipeline.py
+# python bench_pipeline.py --only arrivals_parse headway --repeat 5 --label orjson
+# python bench_pipeline.py --compare                 -> csak az utolsó két futás összevetése, mérés nélkül
+
+WORK_DIR = os.path.join(tempfile.gettempdir(), "budairportbi_bench")
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+ARRIVAL_DIRS = [os.path.join("arrivals", "RealTime_JSON"), os.path.join("RealTime_JSON", "arrivals")]
+RESULTS = "bench_results.jsonl"
+REPEAT = 3
+SYNTH_TRIPS = 20_000
+SEED = 100
+
+# a backend.py a környezeti változót import időben olvassa: a pipeline modulok előtt kell beállítani
+os.environ["BUDAIRPORTBI_BACKEND"] = "duckdb"
+os.environ["BUDAIRPORTBI_DUCKDB"] = os.path.join(WORK_DIR, "bench.duckdb")
+
+import agg_15m
+import etl_static
+import backfill_arrivals
+from gtfs_segments import SegmentBuilder
+from stop_times_index import StopTimesIndex
+from load_manifest import Manifest
+from arrivals_parse import ARRIVAL_COLS, HEADWAY_COLS, headway_rows, parse_raw_name
+
+engine = etl_static.engine
+
+# =========================================================
+# Bemenetek
+# =========================================================
+def _size(*paths):
+    return sum(os.path.getsize(x) for x in paths if os.path.exists(x))
+
+def _hms(sec):
+    h, rest = np.divmod(sec, 3600)
+    m, s = np.divmod(rest, 60)
+    return (pd.Series(h).astype(str).str.zfill(2) + ":" + pd.Series(m).astype(str).str.zfill(2)
+            + ":" + pd.Series(s).astype(str).str.zfill(2))
+
+def synth_gtfs(src, folder, n_trips, seed=SEED):
+    """Szintetikus trips.txt + stop_times.txt a valódi route / stop / service azonosítókkal.
+    Vonalanként fix megállósor (10-40 megálló), trip-enként véletlen indulás 04:00 és 25:00 között
+    (24:00 feletti GTFS idők is), 1-3 perc menetidő, 0-30 mp tartózkodás; trip_id szerint csoportosítva."""
+    rng = np.random.default_rng(seed)
+    routes = pd.read_csv(os.path.join(src, etl_static.GTFS_ROUTES), dtype=str)["route_id"].dropna().unique()
+    stops = pd.read_csv(os.path.join(src, etl_static.GTFS_STOPS), dtype=str)["stop_id"].dropna().unique()
+    services = pd.read_csv(os.path.join(src, etl_static.GTFS_CALDATES), dtype=str)["service_id"].dropna().unique()
+
+    patterns = [rng.choice(stops, size=int(rng.integers(10, 41)), replace=False) for _ in routes]
+    route_idx = np.arange(n_trips) % len(routes)
+    trip_ids = np.array([f"B{i:07d}" for i in range(n_trips)], dtype=object)
+    pd.DataFrame({
+        "route_id": routes[route_idx],
+        "service_id": rng.choice(services, n_trips),
+        "trip_id": trip_ids,
+        "trip_headsign": "bench",
+        "direction_id": rng.integers(0, 2, n_trips).astype(str),
+        "shape_id": "bench",
+    }).to_csv(os.path.join(folder, etl_static.GTFS_TRIPS), index=False)
+
+    lens = np.array([len(patterns[r]) for r in route_idx])
+    first = np.cumsum(lens) - lens
+    seq = np.arange(lens.sum()) - np.repeat(first, lens)
+    hop = rng.integers(60, 181, len(seq))
+    hop[seq == 0] = 0
+    run = np.cumsum(hop)
+    arr = np.repeat(rng.integers(4 * 3600, 25 * 3600, n_trips), lens) + run - np.repeat(run[first], lens)
+    dep = arr + rng.integers(0, 31, len(seq))
+    pd.DataFrame({
+        "trip_id": np.repeat(trip_ids, lens),
+        "arrival_time": _hms(arr),
+        "departure_time": _hms(dep),
+        "stop_id": np.concatenate([patterns[r] for r in route_idx]),
+        "stop_sequence": seq + 1,
+    }).to_csv(os.path.join(folder, etl_static.GTFS_STOP_TIMES), index=False)
+
+def prepare_data(src, synth_trips):
+    """-> (mappa, szintetikus-e): ha a src-ben nincs stop_times.txt / trips.txt, egy munkamappa a src
+    fájljaira mutató linkekkel + szintetikus menetrenddel (méretenként egyszer készül el)"""
+    gtfs = (etl_static.GTFS_STOP_TIMES, etl_static.GTFS_TRIPS)
+    if all(os.path.exists(os.path.join(src, f)) for f in gtfs):
+        return src, False
+
+    folder = os.path.join(WORK_DIR, f"data_synth_{synth_trips}")
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(src):
+        path, link = os.path.join(src, name), os.path.join(folder, name)
+        if name not in gtfs and not os.path.lexists(link):
+            os.symlink(os.path.abspath(path), link)
+    if not all(os.path.exists(os.path.join(folder, f)) for f in gtfs):
+        t0 = time.perf_counter()
+        synth_gtfs(src, folder, synth_trips)
+        print(f"   szintetikus menetrend: {synth_trips} trip, {_size(os.path.join(folder, gtfs[0])) / 1e6:.1f} MB "
+              f"({time.perf_counter() - t0:.1f}s) -> {folder}")
+    return folder, True
+
+def _quiet():
+    return contextlib.redirect_stdout(io.StringIO())
+
+def _target_trips():
+    """A 100E trip_id-k a routes.txt / trips.txt alapján (mint a load_stop_times_100e SQL-je)"""
+    routes = pd.read_csv(etl_static.p(etl_static.GTFS_ROUTES), dtype=str)
+    target = etl_static.TARGET_SHORTNAME
+    hit = ((routes["route_short_name"].str.strip() == target) | (routes["route_desc"].str.strip() == target)
+           | routes["route_desc"].str.contains(target, regex=False, na=False))
+    trips = pd.read_csv(etl_static.p(etl_static.GTFS_TRIPS), dtype=str, usecols=["route_id", "trip_id"])
+    return set(trips.loc[trips["route_id"].isin(routes.loc[hit, "route_id"].str.strip()), "trip_id"])
+
+def _arrivals(ctx):
+    """Parse-olt arrivals (egyszer, a headway / agg lépések előkészítéséhez)"""
+    if "arrivals" not in ctx:
+        arr, hw, _, _ = backfill_arrivals.parse_files(ctx["arrival_paths"])
+        ctx["arrivals"] = (arr, hw)
+    return ctx["arrivals"]
+
+# =========================================================
+# Lépések: setup(ctx) -> state (nem mérjük; "bytes" és "unit": a bemenet mérete / egysége),
+# run(state) -> (bemenő egységek, kimenő sorok)
+# =========================================================
+def setup_csv_staging(ctx):
+    with _quiet():
+        etl_static.setup_tables(Manifest(engine))
+    files = [etl_static.p(f) for t in etl_static.STG_LOADERS for f in etl_static.STG_SOURCES[t]]
+    return {"tables": list(etl_static.STG_LOADERS.items()), "bytes": _size(*files), "unit": "sor"}
+
+def run_csv_staging(state):
+    rows = 0
+    with _quiet():
+        for table, load in state["tables"]:
+            with engine.begin() as conn:
+                etl_static.run_stmt(conn, f"TRUNCATE TABLE {table};")
+            rows += load()
+    return rows, rows
+
+def setup_stop_times_filter(ctx):
+    path = etl_static.p(etl_static.GTFS_STOP_TIMES)
+    with _quiet():
+        StopTimesIndex.open(path)
+    return {"trip_set": _target_trips(), "bytes": _size(path), "unit": "sor"}
+
+def run_stop_times_filter(state, use_index=True):
+    saved, etl_static.USE_STOP_TIMES_INDEX = etl_static.USE_STOP_TIMES_INDEX, use_index
+    try:
+        rows = sum(len(chunk) for chunk in etl_static.read_stop_times(state["trip_set"]))
+    finally:
+        etl_static.USE_STOP_TIMES_INDEX = saved
+    return rows, rows
+
+def setup_segments(ctx):
+    path = etl_static.p(etl_static.GTFS_STOP_TIMES)
+    trip_map = pd.read_csv(etl_static.p(etl_static.GTFS_TRIPS), dtype=str,
+                           usecols=["trip_id", "route_id", "service_id"])
+    return {"chunks": list(etl_static.read_stop_times()), "trip_map": trip_map, "bytes": _size(path), "unit": "sor"}
+
+def run_segments(state):
+    sb = SegmentBuilder(state["trip_map"])
+    out = sum(len(sb.feed(chunk)) for chunk in state["chunks"]) + len(sb.finish())
+    return sum(len(c) for c in state["chunks"]), out
+
+def setup_arrivals_parse(ctx):
+    return {"paths": ctx["arrival_paths"], "bytes": _size(*ctx["arrival_paths"]), "unit": "snapshot"}
+
+def run_arrivals_parse(state):
+    arr, hw, n, bad = backfill_arrivals.parse_files(state["paths"])
+    return n - bad, len(arr) + len(hw)
+
+def setup_headway(ctx):
+    arr, _ = _arrivals(ctx)
+    groups = []
+    for raw, g in arr.groupby("RawFile", sort=False):
+        meta = parse_raw_name(raw)
+        if meta is None:
+            continue
+        stop_id, route_id, snap_dt = meta
+        preds = [t for t in pd.to_datetime(g["PredictedArrivalDT"]).dt.to_pydatetime() if not pd.isna(t)]
+        groups.append((preds, snap_dt, stop_id, route_id, raw))
+    return {"groups": groups, "bytes": 0, "unit": "predikció"}
+
+def run_headway(state):
+    rows = out = 0
+    for preds, snap_dt, stop_id, route_id, raw in state["groups"]:
+        rows += len(preds)
+        out += len(headway_rows(preds, snap_dt, stop_id, route_id, raw))
+    return rows, out
+
+def setup_agg_15m(ctx):
+    arr, hw = _arrivals(ctx)
+    raw = engine.raw_connection()
+    try:
+        con = raw.driver_connection
+        for table, df in (("stg.RealTime_StopArrivals", arr[ARRIVAL_COLS]), ("stg.RealTime_StopHeadway", hw[HEADWAY_COLS])):
+            con.register("_bench_src", df)
+            con.execute(f"CREATE OR REPLACE TABLE {table} AS SELECT * FROM _bench_src")
+            con.unregister("_bench_src")
+    finally:
+        raw.close()
+    first = pd.to_datetime(arr["SnapshotDT"]).min()
+    days = (date.today() - first.date()).days + 1 if pd.notna(first) else 14
+    return {"rows": len(arr), "days_back": days, "bytes": 0, "unit": "sor"}
+
+def run_agg_15m(state):
+    return state["rows"], agg_15m.build(engine, state["days_back"])
+
+STAGES = {
+    "csv_staging":            (setup_csv_staging, run_csv_staging),
+    "stop_times_filter":      (setup_stop_times_filter, run_stop_times_filter),
+    "stop_times_filter_scan": (setup_stop_times_filter, lambda s: run_stop_times_filter(s, use_index=False)),
+    "segments":               (setup_segments, run_segments),
+    "arrivals_parse":         (setup_arrivals_parse, run_arrivals_parse),
+    "headway":                (setup_headway, run_headway),
+    "agg_15m":                (setup_agg_15m, run_agg_15m),
+}
+
+# =========================================================
+# Mérés
+# =========================================================
+def measure(run, state, repeat):
+    """-> (idők, csúcs memória bájt, (bemenő, kimenő sorok))"""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        result = run(state)
+        times.append(time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return times, peak, result
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def run_meta(label, data_folder, synthetic, synth_trips):
+    import duckdb
+    return {
+        "run_id": datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "label": label,
+        "git": _git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "duckdb": duckdb.__version__,
+        "data": data_folder,
+        "synthetic_gtfs": synth_trips if synthetic else None,
+    }
+
+def bench(stages, repeat, meta):
+    ctx = {"arrival_paths": sorted(x for d in ARRIVAL_DIRS
+                                   for x in glob.glob(os.path.join(meta["data_src"], d, "*.json")))}
+    results = []
+    for name in stages:
+        setup, run = STAGES[name]
+        state = setup(ctx)
+        times, peak, (rows_in, rows_out) = measure(run, state, repeat)
+        best, median = min(times), float(np.median(times))
+        rec = {k: v for k, v in meta.items() if k != "data_src"}
+        rec.update({
+            "stage": name,
+            "repeat": repeat,
+            "best_sec": round(best, 4),
+            "median_sec": round(median, 4),
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "bytes_in": state["bytes"],
+            "unit": state["unit"],
+            "rows_per_sec": round(rows_in / best, 1) if best else None,
+            "mb_per_sec": round(state["bytes"] / 1e6 / best, 2) if best and state["bytes"] else None,
+            "peak_mb": round(peak / 1e6, 1),
+        })
+        results.append(rec)
+        mbs = f"{rec['mb_per_sec']:8.1f} MB/s" if rec["mb_per_sec"] else " " * 13
+        print(f"   {name:<24} {best:8.3f}s (med {median:7.3f}s) | {rows_in:>9,} -> {rows_out:>9,} | "
+              f"{rec['rows_per_sec']:>12,.0f} {state['unit'] + '/s':<12} | {mbs} | csúcs {rec['peak_mb']:7.1f} MB")
+    return results
+
+# =========================================================
+# Eredmények: JSONL + összevetés
+# =========================================================
+def load_results(path):
+    runs = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    runs.setdefault(rec["run_id"], {})[rec["stage"]] = rec
+    return runs
+
+def compare(runs, current, baseline=None):
+    """current run_id vs baseline (run_id vagy címke; alap: a közvetlenül előtte lévő futás)"""
+    ids = list(runs)
+    if baseline:
+        base = baseline if baseline in runs else next(
+            (r for r in reversed(ids) if r != current and any(x.get("label") == baseline for x in runs[r].values())), None)
+    else:
+        before = ids[:ids.index(current)] if current in ids else []
+        base = before[-1] if before else None
+    if base is None:
+        print("   (nincs korábbi futás az összevetéshez)")
+        return
+    now, old = runs[current], runs[base]
+    label = lambda r: next(iter(runs[r].values())).get("label") or "-"
+    print(f"\n--- {current} ({label(current)}) vs {base} ({label(base)}) ---")
+    print(f"   {'lépés':<24} {'most':>9} {'előtte':>9} {'változás':>9} | {'csúcs MB':>9} {'előtte':>9}")
+    for stage, rec in now.items():
+        prev = old.get(stage)
+        if prev is None:
+            print(f"   {stage:<24} {rec['best_sec']:8.3f}s {'-':>9}")
+            continue
+        change = (rec["best_sec"] / prev["best_sec"] - 1) * 100 if prev["best_sec"] else 0.0
+        mark = "⚡" if change <= -5 else ("⚠️" if change >= 5 else "")
+        print(f"   {stage:<24} {rec['best_sec']:8.3f}s {prev['best_sec']:8.3f}s {change:+8.1f}% | "
+              f"{rec['peak_mb']:9.1f} {prev['peak_mb']:9.1f} {mark}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline benchmark a pipeline lépéseire (Data\\ fájlok, DuckDB)")
+    ap.add_argument("--data", default=DATA_FOLDER, help="a Data mappa (OpenFlights .dat, GTFS .txt, RealTime_JSON)")
+    ap.add_argument("--only", nargs="+", choices=list(STAGES), help="csak ezek a lépések")
+    ap.add_argument("--repeat", type=int, default=REPEAT)
+    ap.add_argument("--synth-trips", type=int, default=SYNTH_TRIPS, help="szintetikus menetrend mérete, ha nincs stop_times.txt")
+    ap.add_argument("--label", default=None, help="címke a futáshoz (pl. a vizsgált változtatás neve)")
+    ap.add_argument("--out", default=RESULTS, help="eredmény JSONL (hozzáfűz)")
+    ap.add_argument("--baseline", default=None, help="összevetés ezzel a run_id-vel / címkével")
+    ap.add_argument("--compare", action="store_true", help="csak összevetés a meglévő eredményekből")
+    args = ap.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.compare:
+        runs = load_results(args.out)
+        if not runs:
+            raise SystemExit(f"❌ Nincs eredmény: {args.out}")
+        return compare(runs, list(runs)[-1], args.baseline)
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    folder, synthetic = prepare_data(args.data, args.synth_trips)
+    etl_static.DATA_FOLDER = folder
+    meta = run_meta(args.label, os.path.abspath(args.data), synthetic, args.synth_trips)
+    meta["data_src"] = args.data
+    stages = args.only or list(STAGES)
+
+    print(f"--- Benchmark {meta['run_id']} | {len(stages)} lépés x {args.repeat} | git={meta['git']} | "
+          f"python {meta['python']}, pandas {meta['pandas']}, duckdb {meta['duckdb']} ---")
+    results = bench(stages, args.repeat, meta)
+
+    with open(args.out, "a", encoding="utf-8") as f:
+        for rec in results:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    print(f"✅ {len(results)} eredmény -> {args.out}")
+    compare(load_results(args.out), meta["run_id"], args.baseline)
+
+if __name__ == "__main__":
+    main()
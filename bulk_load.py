@@ -0,0 +1,140 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import pandas as pd
+import sqlalchemy
+
+import backend
+
+# =========================================================
+# Tömeges betöltés DataFrame -> tábla (a DataFrame.to_sql(chunksize=...) helyett)
+# =========================================================
+# duckdb: a DataFrame-et regisztráljuk, és egyetlen INSERT ... SELECT viszi be (oszloposan, Python sorok nélkül)
+# mssql:  1) bcp (ha van a PATH-on és az adat tabulátor / sortörés mentes): natív bulk copy fájlból
+#         2) pyodbc executemany fast_executemany-vel, közvetlenül a nyers kurzoron (SQLAlchemy / pandas nélkül)
+#         3) végső eset: DataFrame.to_sql
+# Minden betöltés sor/s statisztikát gyűjt (STATS), a summary() táblánként kiírja.
+
+USE_BCP = True
+BCP_MIN_ROWS = 50_000      # kis frame-eknél a bcp processz indítása drágább, mint amit nyerünk
+TO_SQL_CHUNK = 10_000      # csak a to_sql fallbackhez
+
+STATS = {}                 # "schema.tábla" -> [sorok, másodperc, módszer]
+_STATS_LOCK = threading.Lock()   # az etl_static DAG több szálon tölt egyszerre
+
+def insert(target, df: pd.DataFrame, table, schema="stg", report=True):
+    """df -> schema.table; target: Engine (saját tranzakció) vagy Connection (a hívó tranzakciója). -> sorok"""
+    if df is None or df.empty:
+        return 0
+
+    t0 = time.perf_counter()
+    if isinstance(target, sqlalchemy.engine.Engine):
+        with target.begin() as conn:
+            method = _insert(conn, df, table, schema, own_tx=True)
+    else:
+        method = _insert(target, df, table, schema, own_tx=False)
+    dt = time.perf_counter() - t0
+
+    key = f"{schema}.{table}"
+    with _STATS_LOCK:
+        st = STATS.setdefault(key, [0, 0.0, method])
+        st[0] += len(df)
+        st[1] += dt
+        st[2] = method
+    if report:
+        print(f"   ⚡ {key}: {len(df)} sor | {len(df) / dt if dt else 0:,.0f} sor/s | {method}")
+    return len(df)
+
+def summary(reset=True):
+    with _STATS_LOCK:
+        stats = [(key, *st) for key, st in STATS.items()]
+        if reset:
+            STATS.clear()
+    for key, rows, dt, method in stats:
+        print(f"   ⚡ {key}: {rows} sor | {rows / dt if dt else 0:,.0f} sor/s | {method}")
+
+def _insert(conn, df, table, schema, own_tx):
+    if backend.is_duckdb():
+        return _insert_duckdb(conn, df, table, schema)
+    return _insert_mssql(conn, df, table, schema, own_tx)
+
+def _cols(df):
+    return ", ".join(f'"{c}"' for c in df.columns)
+
+# ---------- duckdb ----------
+def _insert_duckdb(conn, df, table, schema):
+    raw = conn.connection.driver_connection
+    name = f"_bulk_{os.getpid()}_{id(df)}"
+    raw.register(name, df)
+    try:
+        raw.execute(f"INSERT INTO {schema}.{table} ({_cols(df)}) SELECT {_cols(df)} FROM {name}")
+    finally:
+        raw.unregister(name)
+    return "duckdb"
+
+# ---------- mssql ----------
+def _rows(df):
+    # NaN / NaT / <NA> -> None, numpy skalárok -> Python típusok (a pyodbc csak ezeket ismeri)
+    obj = df.astype(object)
+    return list(obj.where(df.notna(), None).itertuples(index=False, name=None))
+
+def _insert_mssql(conn, df, table, schema, own_tx):
+    # a bcp saját kapcsolaton ír: csak ha a hívó nem a saját tranzakciójában kérte (pl. backfill batch)
+    if own_tx and USE_BCP and len(df) >= BCP_MIN_ROWS and shutil.which("bcp"):
+        if _insert_bcp(conn, df, table, schema):
+            return "bcp"
+    try:
+        cur = conn.connection.driver_connection.cursor()
+    except AttributeError:
+        cur = None
+    if cur is not None and hasattr(cur, "fast_executemany"):
+        cur.fast_executemany = True
+        marks = ", ".join("?" for _ in df.columns)
+        cur.executemany(f"INSERT INTO {schema}.{table} ({_cols(df)}) VALUES ({marks})", _rows(df))
+        cur.close()
+        return "pyodbc"
+
+    df.to_sql(table, con=conn, schema=schema, if_exists="append", index=False, chunksize=TO_SQL_CHUNK)
+    return "to_sql"
+
+def _table_columns(conn, table, schema):
+    return [r[0] for r in conn.exec_driver_sql(
+        "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS "
+        "WHERE TABLE_SCHEMA = ? AND TABLE_NAME = ? ORDER BY ORDINAL_POSITION", (schema, table))]
+
+def _insert_bcp(conn, df, table, schema):
+    """bcp csak akkor, ha a frame oszlopai pontosan a tábla oszlopai (sorrendben), és nincs tab / sortörés az adatban"""
+    if list(df.columns) != _table_columns(conn, table, schema):
+        return False
+    text = df.astype("string")
+    for c in text.columns:
+        if text[c].str.contains(r"[\t\r\n]", regex=True, na=False).any():
+            return False
+
+    url = conn.engine.url
+    odbc = url.query.get("odbc_connect", "")
+    server = _odbc_value(odbc, "SERVER") or url.host
+    database = _odbc_value(odbc, "DATABASE") or url.database
+    fd, path = tempfile.mkstemp(suffix=".tsv")
+    os.close(fd)
+    try:
+        text.to_csv(path, sep="\t", header=False, index=False, na_rep="", encoding="utf-8")
+        res = subprocess.run(
+            ["bcp", f"{database}.{schema}.{table}", "in", path, "-S", server, "-T",
+             "-c", "-C", "65001", "-t", "\t", "-b", "50000"],
+            capture_output=True, text=True)
+    finally:
+        os.remove(path)
+    if res.returncode != 0:
+        raise RuntimeError(f"bcp HIBA ({schema}.{table}): {res.stdout[-500:]} {res.stderr[-500:]}")
+    return True
+
+def _odbc_value(conn_str, key):
+    for part in conn_str.split(";"):
+        k, _, v = part.partition("=")
+        if k.strip().upper() == key:
+            return v.strip()
+    return None
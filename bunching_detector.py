@@ -0,0 +1,325 @@
+import os, sys, glob, json, time, argparse, threading
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+import backend
+import bulk_load
+from arrivals_parse import parse_arrivals, parse_raw_name
+
+# =========================================================
+# Valós idejű "bus bunching" / járatkimaradás (gap) jelzés a poll ciklusban
+# =========================================================
+# A headway eddig csak a stg.RealTime_StopHeadway-be ment (60..3600 mp szűréssel, tehát a 1 percen belül
+# összetorlódott párok ki is estek), és csak a 15 perces átlagokban látszott.
+# Itt minden snapshot után, megálló + vonal szerint:
+#   - az előrejelzett érkezések sorrendjében az egymást követő (elöl haladó, követő) trip párok headway-e
+#     (szűrés nélkül), és a menetrendi headway ugyanott, ugyanakkor
+#   - menetrendi alap: dw.Fact_ScheduledSegments (a megálló indulásai / a végállomás érkezései trip-enként)
+#     az aznapi aktív service-ekre (dw.Bridge_ServiceDate), üzemnap-percenként előre kiszámolva egy tömbbe
+#     -> esemény-enként O(1) kiolvasás
+#   - a poll ciklusban (background=True) az alap háttér szálon töltődik, a poll nem vár a DB-re; amíg nincs
+#     kész (vagy a DB nem elérhető), a menetrend nélküli szabály (BUNCH_ABS_SEC) megy; éjfél előtt
+#     PREFETCH_MIN perccel a következő üzemnap alapja is elindul
+#   - BUNCHING: headway < BUNCH_RATIO * menetrendi (menetrend nélkül: < BUNCH_ABS_SEC)
+#     GAP:      headway > GAP_RATIO * menetrendi és legalább GAP_MIN_EXTRA_SEC-kel több
+#   - állapot megálló + vonal szerint: EWMA (gördülő átlag) a headway-re és a menetrendhez mért arányra,
+#     a nyitott riasztások dict-je (kulcs: megálló, vonal, elöl haladó + követő trip) -> O(1) / esemény
+#   - egy pár riasztása addig nyitott, amíg a pár a válaszban feltétellel együtt látszik; ha eltűnik
+#     (elhaladtak) vagy a feltétel megszűnik, lezárul (ClosedDT). Csak a változott riasztások íródnak.
+# A riasztások a stg.RealTime_HeadwayAlerts-be mennek ugyanabban a DB batch-ben, mint a poll sorai
+# (realtime_ingest_100e.py -> db_writer), így egy poll cikluson belül látszanak.
+#
+# python bunching_detector.py --replay <arrivals mappa>          -> archív snapshotok visszajátszása, kiírás
+# python bunching_detector.py --replay <arrivals mappa> --write  -> ... és a riasztások a táblába
+
+SERVER = r"(localdb)\mssqllocaldb"
+DATABASE = "BudAirportBI"
+DRIVER = "ODBC Driver 17 for SQL Server"
+
+RT_PREFIX = "BKK_"        # FUTÁR azonosítók: BKK_F00950 / BKK_1005, a GTFS-ben prefix nélkül
+BUNCH_RATIO = 0.25
+BUNCH_ABS_SEC = 90        # ha nincs menetrendi alap: ennél közelebb = bunching
+GAP_RATIO = 2.0
+GAP_MIN_EXTRA_SEC = 300
+EWMA_ALPHA = 0.2
+DAY_MINUTES = 30 * 60     # üzemnap percei (GTFS: 24:00 utáni idők, legfeljebb 30:00-ig)
+BASELINE_RETRY_SEC = 60   # ha a menetrend betöltése nem sikerült (pl. nincs DB), ennyi után újra
+PREFETCH_MIN = 30         # éjfél előtt ennyi perccel a következő üzemnap alapjának betöltése (háttérben)
+
+ALERT_COLS = ["AlertID", "Kind", "StopId", "RouteIdRT", "LeadTripId", "FollowTripId",
+              "OpenedDT", "LastSeenDT", "ClosedDT", "HeadwaySec", "WorstHeadwaySec",
+              "ScheduledHeadwaySec", "Ratio", "RollingHeadwaySec", "Snapshots"]
+
+ALERTS_DDL = """
+IF OBJECT_ID('stg.RealTime_HeadwayAlerts','U') IS NULL
+CREATE TABLE stg.RealTime_HeadwayAlerts(
+    AlertID VARCHAR(260) NOT NULL PRIMARY KEY,
+    Kind VARCHAR(10) NOT NULL,
+    StopId VARCHAR(50) NOT NULL,
+    RouteIdRT VARCHAR(50) NOT NULL,
+    LeadTripId VARCHAR(100) NULL,
+    FollowTripId VARCHAR(100) NULL,
+    OpenedDT DATETIME2(0) NOT NULL,
+    LastSeenDT DATETIME2(0) NOT NULL,
+    ClosedDT DATETIME2(0) NULL,
+    HeadwaySec INT NULL,
+    WorstHeadwaySec INT NULL,
+    ScheduledHeadwaySec INT NULL,
+    Ratio FLOAT NULL,
+    RollingHeadwaySec INT NULL,
+    Snapshots INT NOT NULL
+);
+"""
+
+def strip_rt(x):
+    return x[len(RT_PREFIX):] if isinstance(x, str) and x.startswith(RT_PREFIX) else x
+
+# ---------- menetrendi alap ----------
+def minute_headways(times_sec):
+    """egy megálló + vonal menetrendi időpontjai (mp, üzemnap eleje óta) -> üzemnap-percenként a
+    menetrendi headway (az adott percet tartalmazó két menetrendi érkezés különbsége; NaN = nincs járat)"""
+    t = np.unique(np.asarray(times_sec, dtype=np.float64))
+    out = np.full(DAY_MINUTES, np.nan)
+    if len(t) < 2:
+        return out
+    idx = np.searchsorted(t, np.arange(DAY_MINUTES) * 60.0, side="right")
+    ok = (idx > 0) & (idx < len(t))
+    out[ok] = t[idx[ok]] - t[idx[ok] - 1]
+    return out
+
+class Baseline:
+    """(GTFS megálló, GTFS vonal) -> üzemnap-perc tömb, üzemnaponként cache-elve.
+    background=True: a betöltés háttér szálon, a get() nem blokkol (None, amíg nincs kész)"""
+    def __init__(self, engine, pairs=None, background=False):
+        self.engine = engine
+        self.pairs = pairs        # csak ezek a (megálló, vonal) párok kellenek (None = mind)
+        self.background = background
+        self.days = {}
+        self.failed_at = {}
+        self.loading = set()
+        self.lock = threading.Lock()
+
+    def load(self, day):
+        key = int(day.strftime("%Y%m%d"))
+        where = ""
+        if self.pairs:
+            stops = ",".join("'" + s.replace("'", "''") + "'" for s in {s for s, _ in self.pairs})
+            where = f" AND (s.FromStopID IN ({stops}) OR s.ToStopID IN ({stops}))"
+        sql = f"""
+            SELECT s.RouteID, s.TripID, s.FromStopID, s.ToStopID, s.FromDepTimeSec, s.ToArrTimeSec
+            FROM dw.Fact_ScheduledSegments s
+            JOIN dw.Bridge_ServiceDate b ON b.ServiceID = s.ServiceID AND b.DateKey = {key} AND b.IsActive = 1
+            WHERE 1 = 1{where}"""
+        with self.engine.connect() as conn:
+            seg = pd.read_sql(backend.sql(sql), conn)
+        # a megálló ideje trip-enként: indulás (FromStop) vagy a végállomáson érkezés (ToStop), egyszer
+        ev = pd.concat([
+            seg[["RouteID", "TripID", "FromStopID", "FromDepTimeSec"]].set_axis(["RouteID", "TripID", "StopID", "Sec"], axis=1),
+            seg[["RouteID", "TripID", "ToStopID", "ToArrTimeSec"]].set_axis(["RouteID", "TripID", "StopID", "Sec"], axis=1),
+        ]).dropna(subset=["Sec"])
+        ev = ev.groupby(["StopID", "RouteID", "TripID"], as_index=False)["Sec"].min()
+        table = {}
+        for (stop, route), g in ev.groupby(["StopID", "RouteID"]):
+            if self.pairs is None or (stop, route) in self.pairs:
+                table[(stop, route)] = minute_headways(g["Sec"].to_numpy())
+        return table
+
+    def _fetch(self, day):
+        """load + cache; hibánál None, és BASELINE_RETRY_SEC-ig nem próbálja újra"""
+        try:
+            table = self.load(day)
+        except Exception as e:
+            with self.lock:
+                self.failed_at[day] = time.time()
+            print(f"⚠️ menetrendi headway alap nem tölthető ({day}): {type(e).__name__}: {str(e).strip().splitlines()[-1][:200]}")
+            return None
+        with self.lock:
+            self.days[day] = table
+            # régi napok ki a cache-ből (ma + tegnap elég: 24:00 utáni járatok)
+            for d in [d for d in self.days if d < day - timedelta(days=1)]:
+                del self.days[d]
+        print(f"   → headway alap {day}: {len(table)} megálló / vonal")
+        return table
+
+    def _background(self, day):
+        try:
+            self._fetch(day)
+        finally:
+            with self.lock:
+                self.loading.discard(day)
+
+    def request(self, day):
+        """a nap alapjának betöltése háttér szálon, ha még nincs meg / nem töltődik / nem most hibázott"""
+        with self.lock:
+            if (day in self.days or day in self.loading
+                    or time.time() - self.failed_at.get(day, -1e9) < BASELINE_RETRY_SEC):
+                return
+            self.loading.add(day)
+        threading.Thread(target=self._background, args=(day,), name=f"baseline:{day}", daemon=True).start()
+
+    def prefetch(self, now):
+        """éjfél előtt PREFETCH_MIN perccel a következő üzemnap alapja (háttérben)"""
+        if self.background and now.hour * 60 + now.minute >= 24 * 60 - PREFETCH_MIN:
+            self.request(now.date() + timedelta(days=1))
+
+    def get(self, day):
+        with self.lock:
+            if day in self.days:
+                return self.days[day]
+        if self.background:
+            self.request(day)
+            return None
+        if time.time() - self.failed_at.get(day, -1e9) < BASELINE_RETRY_SEC:
+            return None
+        return self._fetch(day)
+
+    def scheduled(self, stop, route, service_day, when):
+        """menetrendi headway mp-ben a when időpontban (None = nincs alap)"""
+        table = self.get(service_day)
+        arr = table.get((strip_rt(stop), strip_rt(route))) if table else None
+        if arr is None:
+            return None
+        m = int((when - datetime.combine(service_day, datetime.min.time())).total_seconds() // 60)
+        if not 0 <= m < DAY_MINUTES or np.isnan(arr[m]):
+            return None
+        return float(arr[m])
+
+# ---------- detektor ----------
+class _State:
+    __slots__ = ("ewma_hw", "ewma_ratio", "n", "open")
+    def __init__(self):
+        self.ewma_hw = self.ewma_ratio = None
+        self.n = 0
+        self.open = {}      # (lead, follow) -> riasztás dict
+
+class Detector:
+    def __init__(self, baseline=None):
+        self.baseline = baseline
+        self.state = {}     # (megálló, vonal) -> _State
+        self.stats = {"events": 0, "opened": 0, "closed": 0}
+
+    def classify(self, hw, sched):
+        if sched:
+            if hw < BUNCH_RATIO * sched:
+                return "BUNCHING"
+            if hw > GAP_RATIO * sched and hw - sched >= GAP_MIN_EXTRA_SEC:
+                return "GAP"
+            return None
+        return "BUNCHING" if hw < BUNCH_ABS_SEC else None
+
+    def observe(self, rows, snap_dt):
+        """egy snapshot parse_arrivals sorai -> a változott (új / frissült / lezárt) riasztások"""
+        if self.baseline is not None:
+            self.baseline.prefetch(snap_dt)
+        groups = {}
+        for r in rows:
+            if r.get("PredictedArrivalDT") is not None and r.get("TripId"):
+                groups.setdefault((r["StopId"], r["RouteIdRT"]), []).append(r)
+        changed = []
+        for key in set(groups) | {k for k, s in self.state.items() if s.open}:
+            changed.extend(self._observe_stop(key, groups.get(key, []), snap_dt))
+        return changed
+
+    def _observe_stop(self, key, rows, snap_dt):
+        st = self.state.get(key) or self.state.setdefault(key, _State())
+        rows = sorted(rows, key=lambda r: r["PredictedArrivalDT"])
+        seen, out = set(), []
+        for lead, follow in zip(rows, rows[1:]):
+            hw = (follow["PredictedArrivalDT"] - lead["PredictedArrivalDT"]).total_seconds()
+            day = follow.get("ServiceDate") or follow["PredictedArrivalDT"].date()
+            sched = self.baseline.scheduled(key[0], key[1], day, follow["PredictedArrivalDT"]) if self.baseline else None
+            self.stats["events"] += 1
+            # gördülő állapot (EWMA), O(1)
+            st.n += 1
+            st.ewma_hw = hw if st.ewma_hw is None else st.ewma_hw + EWMA_ALPHA * (hw - st.ewma_hw)
+            if sched:
+                ratio = hw / sched
+                st.ewma_ratio = ratio if st.ewma_ratio is None else st.ewma_ratio + EWMA_ALPHA * (ratio - st.ewma_ratio)
+
+            kind = self.classify(hw, sched)
+            pair = (lead["TripId"], follow["TripId"])
+            a = st.open.get(pair)
+            if a is not None and a["Kind"] != kind:
+                out.append(self._close(st, pair, snap_dt))
+                a = None
+            if kind is None:
+                continue
+            seen.add(pair)
+            if a is None:
+                a = st.open[pair] = {
+                    "AlertID": f"{key[0]}|{key[1]}|{pair[0]}|{pair[1]}|{snap_dt:%Y%m%d%H%M%S}",
+                    "Kind": kind, "StopId": key[0], "RouteIdRT": key[1],
+                    "LeadTripId": pair[0], "FollowTripId": pair[1],
+                    "OpenedDT": snap_dt, "ClosedDT": None, "WorstHeadwaySec": int(hw), "Snapshots": 0,
+                }
+                self.stats["opened"] += 1
+                print(f"   🚨 {kind} {key[0]} {key[1]}: {pair[0]} -> {pair[1]} headway {hw:.0f}s"
+                      f" (menetrend {sched:.0f}s)" if sched else f"   🚨 {kind} {key[0]} {key[1]}: {pair[0]} -> {pair[1]} headway {hw:.0f}s")
+            worst = min if kind == "BUNCHING" else max
+            a.update(LastSeenDT=snap_dt, HeadwaySec=int(hw), WorstHeadwaySec=int(worst(a["WorstHeadwaySec"], hw)),
+                     ScheduledHeadwaySec=int(sched) if sched else None,
+                     Ratio=round(hw / sched, 3) if sched else None,
+                     RollingHeadwaySec=int(st.ewma_hw), Snapshots=a["Snapshots"] + 1)
+            out.append(dict(a))
+        # ami most nem látszik (elhaladt / megszűnt): lezárás
+        for pair in [p for p in st.open if p not in seen]:
+            out.append(self._close(st, pair, snap_dt))
+        return out
+
+    def _close(self, st, pair, snap_dt):
+        a = st.open.pop(pair)
+        a["ClosedDT"] = snap_dt
+        self.stats["closed"] += 1
+        return dict(a)
+
+# ---------- DB ----------
+def ensure_table(conn):
+    conn.exec_driver_sql(backend.sql(ALERTS_DDL))
+
+def upsert(conn, alerts):
+    """riasztás sorok (egy batch-ben ugyanaz az AlertID többször is: az utolsó állapot marad) -> tábla"""
+    if not alerts:
+        return 0
+    last = {a["AlertID"]: a for a in alerts}
+    conn.exec_driver_sql("DELETE FROM stg.RealTime_HeadwayAlerts WHERE AlertID = ?", [(k,) for k in last])
+    bulk_load.insert(conn, pd.DataFrame(list(last.values()), columns=ALERT_COLS),
+                     "RealTime_HeadwayAlerts", "stg", report=False)
+    return len(last)
+
+# ---------- visszajátszás ----------
+def replay(folder, write=False):
+    files = []
+    for path in glob.glob(os.path.join(folder, "bkk_*_arr_*.json")):
+        parsed = parse_raw_name(path)
+        if parsed:
+            files.append((parsed[2], parsed[0], parsed[1], path))
+    files.sort()
+    engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+    det = Detector(Baseline(engine))
+    t0 = time.perf_counter()
+    alerts = {}
+    for snap_dt, stop_id, route_id, path in files:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        rows, _ = parse_arrivals(data, snap_dt, os.path.basename(path), route_id=route_id, stop_id=stop_id)
+        for a in det.observe(rows, snap_dt):
+            alerts[a["AlertID"]] = a
+    dt = time.perf_counter() - t0
+    kinds = pd.Series([a["Kind"] for a in alerts.values()]).value_counts().to_dict()
+    print(f"✅ {len(files)} snapshot, {det.stats['events']} headway esemény, {len(alerts)} riasztás {kinds} | "
+          f"{dt:.2f}s ({det.stats['events'] / dt if dt else 0:,.0f} esemény/s)")
+    if write and alerts:
+        with engine.begin() as conn:
+            ensure_table(conn)
+            print(f"   → stg.RealTime_HeadwayAlerts: {upsert(conn, list(alerts.values()))} sor")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Bus bunching / gap detektor (headway a menetrendhez mérve)")
+    ap.add_argument("--replay", required=True, help="bkk_*_arr_*.json mappa (archív snapshotok)")
+    ap.add_argument("--write", action="store_true", help="a riasztások írása a stg.RealTime_HeadwayAlerts-be")
+    args = ap.parse_args(sys.argv[1:] if argv is None else argv)
+    replay(args.replay, args.write)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import os, json, time, queue, random, threading
+from datetime import datetime, date
+import sqlalchemy.exc
+
+# =========================================================
+# Write-behind DB író a poll ciklusokhoz: korlátos sor + háttér szál + helyi spool fájl
+# =========================================================
+# A poll ciklus csak put()-ol (nem blokkol), a DB írás egy háttér szálon megy:
+#   - a szál a sorból egyszerre több snapshotot vesz ki (max MAX_BATCH), és egy tranzakcióban írja
+#     (write_fn(conn, items)), így lassú insertnél sem tolódik a következő poll
+#   - hiba: RETRIES újrapróbálás exponenciális visszalépéssel (BACKOFF_BASE * 2^n, jitterrel)
+#   - ha így sem megy (pl. leállt a DB): a batch a spool fájl végére (append-only JSON sorok, fsync),
+#     és amíg a spool nem üres, minden új batch is oda megy (a sorrend megmarad); a szál PROBE_MIN..PROBE_MAX
+#     mp-enként újrapróbálja, és ha a DB újra elérhető, visszajátssza a spoolt, utána vált vissza élő írásra
+#   - tele sor (a DB író nagyon lemaradt): a put() közvetlenül a spoolba ír, a snapshot akkor sem vész el
+#     (ilyenkor a még sorban lévő régebbi snapshotok utána kerülnek a spoolba: itt a sorrend felcserélődhet)
+#   - csak a kapcsolati hiba (OperationalError / InterfaceError / megszakadt kapcsolat) számít "nem elérhető
+#     DB"-nek; más hibánál (túl hosszú érték, PK ütközés, hibás adat) a batch snapshotonként újra megy, és ami
+#     így is hibás, a <spool>.rejected fájlba kerül (a hibaüzenettel); a többi snapshot beíródik, a spool
+#     visszajátszás is továbblép rajta (különben egy hibás snapshot örökre spool módban tartaná az írót)
+#   - visszajátszás: a spool átnevezve <spool>.replay lesz (az új batch-ek közben új spoolba mennek);
+#     MAX_BATCH snapshotonként ír, és minden sikeres tranzakció után a .pos fájlba menti a bájt pozíciót,
+#     így egy közbeni leállás után onnan folytatja; induláskor a megmaradt .replay / spool automatikusan megy
+# Legalább egyszer szemantika: leállásnál egy már beírt, de pozícióval még nem rögzített batch újra
+# beíródhat (a trip_arrivals upsert idempotens, a nyers append táblában ez duplikátum lehet).
+#
+# Használat:
+#   w = db_writer.WriteBehind("ingest_100e", engine, write_fn, spool_path, metrics=m)
+#   w.put({"rows": rows, "head_rows": head_rows})     -> a poll ciklusból
+#   w.close()                                           -> leállításnál: sor kiürítése (vagy spoolba)
+
+MAX_QUEUE = 500        # ennyi snapshot várhat a sorban; felette a put() a spoolba ír
+MAX_BATCH = 50         # ennyi snapshot megy egy tranzakcióba
+LINGER_SEC = 0.5       # az első elem után ennyit vár, hogy több snapshot gyűljön egy batch-be
+RETRIES = 3
+BACKOFF_BASE = 1.0
+PROBE_MIN = 5.0        # spool módban ennyi mp után próbálja újra a DB-t ...
+PROBE_MAX = 120.0      # ... duplázva, legfeljebb eddig
+ITEM_RETRIES = 1       # nem kapcsolati hibánál egy snapshot ennyiszer még újrapróbálva, utána .rejected
+
+def is_connection_error(e):
+    """a DB nem elérhető (-> spool / újrapróbálás), vagy az utasítás / adat hibás (-> .rejected)?"""
+    if isinstance(e, (sqlalchemy.exc.OperationalError, sqlalchemy.exc.InterfaceError)):
+        return True
+    if isinstance(e, sqlalchemy.exc.DBAPIError):
+        return bool(e.connection_invalidated)
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    # a bulk_load nyers kurzoros útjai a driver kivételét adják tovább (pyodbc / duckdb), SQLAlchemy csomagolás nélkül
+    return type(e).__name__ in ("OperationalError", "InterfaceError", "ConnectionException")
+
+# ---------- spool kódolás (datetime / date típusosan vissza) ----------
+def _default(o):
+    if isinstance(o, datetime):
+        return {"$dt": o.isoformat()}
+    if isinstance(o, date):
+        return {"$d": o.isoformat()}
+    if hasattr(o, "item"):          # numpy skalár
+        return o.item()
+    raise TypeError(f"nem JSON típus: {type(o).__name__}")
+
+def _hook(d):
+    if len(d) == 1:
+        if "$dt" in d:
+            return datetime.fromisoformat(d["$dt"])
+        if "$d" in d:
+            return date.fromisoformat(d["$d"])
+    return d
+
+def encode(item) -> bytes:
+    return (json.dumps(item, default=_default, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def decode(line: bytes):
+    return json.loads(line, object_hook=_hook)
+
+
+def write_or_reject(write_batch, items, reject):
+    """write_batch(items); nem kapcsolati hibánál snapshotonként újra, a hibásak reject(item, hiba)-ba.
+    Kapcsolati hiba továbbdobódik. -> beírt snapshotok"""
+    try:
+        write_batch(items)
+        return len(items)
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        if len(items) > 1:
+            print(f"⚠️ db_writer: batch hiba ({type(e).__name__}), snapshotonként újra ({len(items)})")
+    n = 0
+    for it in items:
+        for attempt in range(ITEM_RETRIES + 1):
+            try:
+                write_batch([it])
+                n += 1
+                break
+            except Exception as e:
+                if is_connection_error(e):
+                    raise
+                if attempt == ITEM_RETRIES:
+                    print(f"❌ db_writer: snapshot nem írható be -> .rejected ({type(e).__name__}: {(str(e).splitlines() or [''])[0][:200]})")
+                    reject(it, e)
+    return n
+
+
+class Spool:
+    """Append-only JSON sor fájl; a visszajátszás a .replay másolatból, pozíció a .pos fájlban"""
+    def __init__(self, path):
+        self.path = path
+        self.replay_path = path + ".replay"
+        self.pos_path = path + ".replay.pos"
+        self.rejected_path = path + ".rejected"
+        self.lock = threading.Lock()   # append (poll ciklus / író szál) és az átnevezés ne fedje egymást
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def append(self, items):
+        with self.lock, open(self.path, "ab") as f:
+            for it in items:
+                f.write(encode(it))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rotate(self):
+        with self.lock:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                return False
+            os.replace(self.path, self.replay_path)
+            self._set_pos(0)
+            return True
+
+    def reject(self, item, error):
+        """nem beírható snapshot -> <spool>.rejected (a hibával együtt, kézi vizsgálatra / javításra)"""
+        rec = {"RejectedDT": datetime.now(), "Error": f"{type(error).__name__}: {error}"[:2000], "Item": item}
+        with self.lock, open(self.rejected_path, "ab") as f:
+            f.write(encode(rec))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def pending(self):
+        return any(os.path.exists(p) and os.path.getsize(p) > 0 for p in (self.replay_path, self.path))
+
+    def _pos(self):
+        try:
+            with open(self.pos_path, encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _set_pos(self, pos):
+        tmp = self.pos_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(pos))
+        os.replace(tmp, self.pos_path)
+
+    def replay(self, write_batch, batch=MAX_BATCH, reject=None):
+        """a spool visszaírása write_batch(items)-szel; kapcsolati hibánál kivétel (a pozíció megmarad), a nem
+        beírható snapshotok a .rejected fájlba. -> beírt snapshotok"""
+        n = 0
+        while os.path.exists(self.replay_path) or self._rotate():
+            with open(self.replay_path, "rb") as f:
+                f.seek(self._pos())
+                while True:
+                    items, lines = [], 0
+                    for line in f:
+                        lines += 1
+                        try:
+                            items.append(decode(line))
+                        except ValueError:
+                            # csonka sor (leállás írás közben): kihagyjuk
+                            print(f"⚠️ spool: hibás sor kihagyva ({len(line)} bájt)")
+                        if len(items) >= batch:
+                            break
+                    if not lines:
+                        break
+                    if items:
+                        n += write_or_reject(write_batch, items, reject or self.reject)
+                    self._set_pos(f.tell())
+            os.remove(self.replay_path)
+            os.remove(self.pos_path)
+        return n
+
+
+class WriteBehind:
+    def __init__(self, name, engine, write_fn, spool_path, metrics=None,
+                 max_queue=MAX_QUEUE, max_batch=MAX_BATCH, linger_sec=LINGER_SEC):
+        self.name = name
+        self.engine = engine
+        self.write_fn = write_fn          # write_fn(conn, items): egy tranzakcióban, a hívó engine.begin()-jében
+        self.spool = Spool(spool_path)
+        self.metrics = metrics
+        self.q = queue.Queue(maxsize=max_queue)
+        self.max_batch, self.linger_sec = max_batch, linger_sec
+        self.stats = {"queued": 0, "written": 0, "spooled": 0, "replayed": 0, "batches": 0, "errors": 0,
+                      "rejected": 0}
+        self.db_ok = not self.spool.pending()
+        self.next_probe = 0.0
+        self.probe_sec = PROBE_MIN
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=f"db_writer:{name}", daemon=True)
+        self.thread.start()
+
+    # ---------- a poll ciklusból ----------
+    def put(self, item):
+        """nem blokkol; tele sornál közvetlenül a spoolba"""
+        try:
+            self.q.put_nowait(item)
+            self.stats["queued"] += 1
+        except queue.Full:
+            self.spool.append([item])
+            self.stats["spooled"] += 1
+            self.db_ok = False
+            print(f"⚠️ {self.name}: tele az írási sor ({self.q.maxsize}) -> spool")
+        self._gauges()
+
+    def close(self, timeout=30.0):
+        """a sorban lévők kiírása (vagy spoolba), a szál leállítása"""
+        self._stop.set()
+        self.thread.join(timeout)
+        rest = []
+        while True:
+            try:
+                rest.append(self.q.get_nowait())
+            except queue.Empty:
+                break
+        if rest:
+            self.spool.append(rest)
+            self.stats["spooled"] += len(rest)
+            print(f"⚠️ {self.name}: {len(rest)} snapshot a spoolba (leállítás)")
+
+    # ---------- háttér szál ----------
+    def _take(self):
+        try:
+            items = [self.q.get(timeout=1.0)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger_sec
+        while len(items) < self.max_batch:
+            left = deadline - time.monotonic()
+            try:
+                items.append(self.q.get(timeout=left) if left > 0 else self.q.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _write(self, items):
+        with self.engine.begin() as conn:
+            self.write_fn(conn, items)
+        self.stats["batches"] += 1
+
+    def _reject(self, item, error):
+        self.spool.reject(item, error)
+        self.stats["rejected"] += 1
+
+    def _write_checked(self, items):
+        """-> beírt snapshotok; a nem beírhatók .rejected-be, kapcsolati hiba továbbdobódik"""
+        return write_or_reject(self._write, items, self._reject)
+
+    def _write_retry(self, items):
+        for attempt in range(RETRIES + 1):
+            try:
+                if self.metrics:
+                    with self.metrics.stage("db_write") as st:
+                        st.rows = self._write_checked(items)
+                else:
+                    self._write_checked(items)
+                return True
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] DB HIBA ({self.name}, {attempt + 1}/{RETRIES + 1}): {e}")
+                if attempt == RETRIES or self._stop.is_set():
+                    return False
+                sec = BACKOFF_BASE * 2 ** attempt
+                time.sleep(sec / 2 + random.uniform(0, sec / 2))
+
+    def _try_replay(self):
+        if time.monotonic() < self.next_probe:
+            return False
+        try:
+            n = self.spool.replay(self._write, self.max_batch, self._reject)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.next_probe = time.monotonic() + self.probe_sec
+            print(f"   ↻ {self.name}: DB még nem elérhető ({type(e).__name__}), újra {self.probe_sec:.0f}s múlva")
+            self.probe_sec = min(self.probe_sec * 2, PROBE_MAX)
+            return False
+        self.stats["replayed"] += n
+        self.db_ok, self.probe_sec = True, PROBE_MIN
+        if n:
+            print(f"✅ {self.name}: spool visszajátszva ({n} snapshot)")
+        return True
+
+    def _run(self):
+        while not (self._stop.is_set() and self.q.empty()):
+            if not self.db_ok:
+                self._try_replay()
+            items = self._take()
+            if not items:
+                self._gauges()
+                continue
+            if self.db_ok and self._write_retry(items):
+                self.stats["written"] += len(items)
+            else:
+                # spool módban a sorrend miatt minden új batch a spool végére megy
+                self.spool.append(items)
+                self.db_ok = False
+                self.stats["spooled"] += len(items)
+            self._gauges()
+        # leállításkor még egy próba, hogy a spool ne maradjon a következő indulásra
+        if self.spool.pending():
+            self.next_probe = 0.0
+            self._try_replay()
+
+    def _gauges(self):
+        if self.metrics:
+            self.metrics.gauge("write_queue_items", self.q.qsize())
+            self.metrics.gauge("write_spooled_total", self.stats["spooled"])
+            self.metrics.gauge("write_db_ok", 1.0 if self.db_ok else 0.0)
+            self.metrics.gauge("write_rejected_total", self.stats["rejected"])
@@ -0,0 +1,158 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# =========================================================
+# Függőségi gráf (DAG) futtató az etl_static.py lépéseihez
+# =========================================================
+# Minden lépés (stg betöltés, dw tábla) egy task: név, függvény, függőségek.
+# A futtató egy szálkészleten egyszerre indít minden olyan taskot, aminek a függőségei már lefutottak
+# (a gráfban nem szereplő függőség, pl. egy változatlan, ki nem hagyott tábla, teljesültnek számít).
+# Így a független ágak (OpenFlights / GTFS / Dim_Date) párhuzamosan mennek, a futásidő a leghosszabb
+# lánchoz közelít, nem az összeghez.
+# Hibánál nem indul új task (a futók befejeződnek), a hiba továbbdobódik; a hibás task utódai kimaradnak.
+# Futás után: task idők, kritikus út (a ténylegesen mért időkkel a leghosszabb függőségi lánc).
+#
+# dag = etl_dag.DAG()
+# dag.add("stg.A", load_a)
+# dag.add("dw.B", build_b, deps=["stg.A"])
+# dag.run(workers=4); dag.report()
+#
+# downstream(deps, ["stg.A"]) -> a tábla és minden, ami (közvetve) ráépül (újrafuttatáshoz)
+
+def downstream(deps, names):
+    """deps: {task: [függőségek]} -> names + minden rájuk (közvetve) épülő task"""
+    users = {}
+    for task, ds in deps.items():
+        for d in ds:
+            users.setdefault(d, []).append(task)
+    out, stack = set(), list(names)
+    while stack:
+        t = stack.pop()
+        if t in out:
+            continue
+        out.add(t)
+        stack.extend(users.get(t, []))
+    return out
+
+class Task:
+    def __init__(self, name, fn, deps=()):
+        self.name, self.fn, self.deps = name, fn, list(deps)
+        self.result = None
+        self.start = self.end = None
+        self.error = None
+
+    @property
+    def sec(self):
+        return (self.end - self.start) if self.end is not None else 0.0
+
+class DAG:
+    def __init__(self):
+        self.tasks = {}
+        self.t0 = self.t1 = None
+
+    def add(self, name, fn, deps=()):
+        if name in self.tasks:
+            raise ValueError(f"már van ilyen task: {name}")
+        self.tasks[name] = Task(name, fn, deps)
+        return self.tasks[name]
+
+    def __contains__(self, name):
+        return name in self.tasks
+
+    def result(self, name, default=None):
+        t = self.tasks.get(name)
+        return t.result if t is not None else default
+
+    def _deps(self, t):
+        return [d for d in t.deps if d in self.tasks]
+
+    def order(self):
+        """topologikus sorrend (a hozzáadás sorrendjét követve); körnél ValueError"""
+        done, out = set(), []
+        pending = list(self.tasks.values())
+        while pending:
+            ready = [t for t in pending if all(d in done for d in self._deps(t))]
+            if not ready:
+                raise ValueError("körkörös függőség: " + ", ".join(t.name for t in pending))
+            for t in ready:
+                done.add(t.name)
+                out.append(t)
+            pending = [t for t in pending if t.name not in done]
+        return out
+
+    def run(self, workers=4, log=True):
+        """a taskok futtatása függőségi sorrendben, legfeljebb workers párhuzamosan; -> {név: eredmény}"""
+        order = self.order()
+        done, submitted, failed = set(), set(), None
+        running = {}
+        self.t0 = time.perf_counter()
+
+        def call(t):
+            t.start = time.perf_counter()
+            try:
+                t.result = t.fn()
+            finally:
+                t.end = time.perf_counter()
+            return t
+
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="etl") as pool:
+            while True:
+                if failed is None:
+                    for t in order:
+                        if t.name not in submitted and all(d in done for d in self._deps(t)):
+                            submitted.add(t.name)
+                            running[pool.submit(call, t)] = t.name
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for f in finished:
+                    name = running.pop(f)
+                    t = self.tasks[name]
+                    if f.exception() is not None:
+                        t.error = f.exception()
+                        failed = failed or t
+                        print(f"❌ {name}: HIBA ({type(t.error).__name__}) {t.sec:.2f}s")
+                        continue
+                    done.add(name)
+                    if log:
+                        print(f"   ✔ {name}: {t.sec:.2f}s")
+        self.t1 = time.perf_counter()
+        if failed is not None:
+            skipped = [t.name for t in order if t.start is None]
+            if skipped:
+                print(f"⚠️ kimaradt (hiba miatt): {', '.join(skipped)}")
+            raise failed.error
+        return {name: t.result for name, t in self.tasks.items()}
+
+    # ---------- riport ----------
+    def critical_path(self):
+        """-> ([task nevek], mp): a mért időkkel a leghosszabb függőségi lánc"""
+        finish, prev = {}, {}
+        for t in self.order():
+            if t.start is None:
+                continue
+            best = max(((finish[d], d) for d in self._deps(t) if d in finish), default=(0.0, None))
+            finish[t.name] = best[0] + t.sec
+            prev[t.name] = best[1]
+        if not finish:
+            return [], 0.0
+        name = max(finish, key=finish.get)
+        total, path = finish[name], []
+        while name is not None:
+            path.append(name)
+            name = prev[name]
+        return path[::-1], total
+
+    def report(self):
+        ran = sorted((t for t in self.tasks.values() if t.start is not None), key=lambda t: t.start)
+        if not ran:
+            return
+        print("\n--- Task idők (indulás szerint) ---")
+        width = max(len(t.name) for t in ran)
+        for t in ran:
+            print(f"   {t.name:<{width}}  +{t.start - self.t0:6.2f}s  {t.sec:7.2f}s")
+        path, cp = self.critical_path()
+        total = sum(t.sec for t in ran)
+        wall = self.t1 - self.t0
+        print(f"Kritikus út ({cp:.2f}s): {' → '.join(path)}")
+        print(f"Fal idő: {wall:.2f}s | taskok összesen: {total:.2f}s | párhuzamosság: {total / wall if wall else 0:.1f}x")
@@ -1,9 +1,23 @@
 import os
+import sys
+import time
+import argparse
+import threading
 import pandas as pd
 import sqlalchemy
-import urllib
 from datetime import date, timedelta
 
+import backend
+import bulk_load
+import metrics
+import air_network
+import etl_dag
+import service_schedule
+import stg_types
+from gtfs_segments import SegmentBuilder
+from stop_times_index import StopTimesIndex
+from load_manifest import Manifest, fingerprint, table_rows
+
 # =========================================================
 # KONFIG
 # =========================================================
@@ -22,22 +36,32 @@ GTFS_ROUTES     = "routes.txt"
 GTFS_TRIPS      = "trips.txt"
 GTFS_STOP_TIMES = "stop_times.txt"
 GTFS_CALDATES   = "calendar_dates.txt"
+GTFS_CALENDAR   = "calendar.txt"        # opcionális (a BKK feed csak calendar_dates-t ad)
 
 TARGET_SHORTNAME = "100E"        # ezt keressük a routes.route_short_name-ban (fallback route_desc)
 STOP_TIMES_READ_CHUNK = 200_000  # stop_times chunk olvasás
-TO_SQL_CHUNK = 10_000            # SQL batch size
+# trip szűrésnél (100E) a stop_times.txt.tidx index alapján csak a kellő bájt tartományokat olvassuk
+USE_STOP_TIMES_INDEX = True
+# dw.Fact_ScheduledSegments: "python" = stop_times olvasás közben számolva (gtfs_segments.py),
+# "sql" = LEAD INSERT a végén (stg.GTFS_StopTimes-ból)
+SEGMENTS_MODE = "python"
+
+# a független betöltések / dw lépések ennyi szálon párhuzamosan (etl_dag.py); --workers N, --serial = 1
+ETL_WORKERS = 4
 
-print("=== BudAirportBI - ETL (GTFS header alapján + 100E-only stop_times + PK fix) ===")
+DIM_DATE_START = date(2024, 1, 1)   # Dim_Date: fixen nagy intervallum (beadásbiztos)
+DIM_DATE_END   = date(2026, 12, 31)
 
 # =========================================================
 # DB kapcsolat
 # =========================================================
-connection_string = f"DRIVER={{{DRIVER}}};SERVER={SERVER};DATABASE={DATABASE};Trusted_Connection=yes;"
-params = urllib.parse.quote_plus(connection_string)
-engine = sqlalchemy.create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
+# backend.py: SQL Server LocalDB (alap) vagy beágyazott DuckDB (BUDAIRPORTBI_BACKEND=duckdb)
+engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+# lépésenkénti idők / sorok / bájtok / hibák -> Data\metrics\etl_static.prom + .jsonl (metrics.py)
+METRICS = metrics.Metrics("etl_static")
 
 def run_stmt(conn, sql: str):
-    conn.execute(sqlalchemy.text(sql))
+    conn.execute(sqlalchemy.text(backend.sql(sql)))
 
 def p(filename: str) -> str:
     return os.path.join(DATA_FOLDER, filename)
@@ -50,73 +74,148 @@ def load_openflights_dat(filename, table, schema, usecols, col_names):
     file_path = p(filename)
     if not os.path.exists(file_path):
         print(f"⚠️ HIÁNYZIK: {file_path}")
-        return
+        return 0
 
     print(f"→ Betöltés: {filename} -> {schema}.{table}")
-    df = pd.read_csv(
-        file_path,
-        header=None,
-        names=col_names,
-        usecols=usecols,
-        dtype=str,
-        encoding="utf-8",
-        on_bad_lines="skip",
-    )
-    df = df.replace({r"\N": None, "": None})
-    df.to_sql(table, con=engine, schema=schema, if_exists="append", index=False, chunksize=TO_SQL_CHUNK)
+    with METRICS.stage(f"{schema}.{table}/read") as st:
+        df = pd.read_csv(
+            file_path,
+            header=None,
+            names=col_names,
+            usecols=usecols,
+            dtype=str,
+            encoding="utf-8",
+            on_bad_lines="skip",
+        )
+        df = df.replace({r"\N": None, "": None})
+        df, rejects = stg_types.conform(df, f"{schema}.{table}", filename)
+        st.rows, st.bytes = len(df), os.path.getsize(file_path)
+    return write_stg(df, rejects, table, schema)
+
+def write_stg(df, rejects, table, schema):
+    """típusos frame -> stg tábla, a hibás értékek -> stg.Load_Rejects (stg_types.py)"""
+    with METRICS.stage(f"{schema}.{table}/db_write") as st:
+        st.rows = len(df)
+        bulk_load.insert(engine, df, table, schema)
+        stg_types.write_rejects(engine, rejects)
+    if len(rejects):
+        dropped = int((rejects["Action"] == "ROW").sum())
+        print(f"   ⚠️ {len(rejects)} hibás érték ({dropped} sor kihagyva) -> stg.Load_Rejects")
     print(f"   ✅ Kész: {len(df)} sor.")
+    return len(df)
 
 def load_gtfs_header_csv(filename, table, schema, usecols):
     """GTFS .txt fájlokhoz (header van) - FONTOS: header alapján választunk oszlopot"""
     file_path = p(filename)
     if not os.path.exists(file_path):
         print(f"⚠️ HIÁNYZIK: {file_path}")
-        return
+        return 0
 
     print(f"→ Betöltés: {filename} -> {schema}.{table}")
-    df = pd.read_csv(
-        file_path,
-        header=0,
-        usecols=usecols,
-        dtype=str,
-        encoding="utf-8",
-        on_bad_lines="skip",
-    )
-    df = df.replace({r"\N": None, "": None})
-    df.to_sql(table, con=engine, schema=schema, if_exists="append", index=False, chunksize=TO_SQL_CHUNK)
-    print(f"   ✅ Kész: {len(df)} sor.")
-
-def load_stop_times_100e_only(trip_set):
-    """stop_times csak 100E trip_id-kre szűrve, chunkolva"""
+    with METRICS.stage(f"{schema}.{table}/read") as st:
+        df = pd.read_csv(
+            file_path,
+            header=0,
+            usecols=usecols,
+            dtype=str,
+            encoding="utf-8",
+            on_bad_lines="skip",
+        )
+        df = df.replace({r"\N": None, "": None})
+        df, rejects = stg_types.conform(df, f"{schema}.{table}", filename)
+        st.rows, st.bytes = len(df), os.path.getsize(file_path)
+    return write_stg(df, rejects, table, schema)
+
+def read_stop_times(trip_set=None, rejects=None):
+    """stop_times chunkok trip_set-re szűrve (None = FULL), típusosan: stop_sequence INT, arrival_sec /
+    departure_sec másodpercben (stg_types.py); a hibás értékek a rejects listába (ha van); DB nélkül"""
     file_path = p(GTFS_STOP_TIMES)
     if not os.path.exists(file_path):
         raise SystemExit(f"❌ HIÁNYZIK: {file_path}")
 
-    total = 0
-    for chunk in pd.read_csv(
-        file_path,
-        header=0,
-        usecols=["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"],
-        dtype=str,
-        encoding="utf-8",
-        on_bad_lines="skip",
-        chunksize=STOP_TIMES_READ_CHUNK,
-    ):
+    usecols = ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"]
+    if trip_set is not None and USE_STOP_TIMES_INDEX:
+        chunks = StopTimesIndex.open(file_path).iter_trips(trip_set, usecols=usecols)
+    else:
+        chunks = pd.read_csv(
+            file_path,
+            header=0,
+            usecols=usecols,
+            dtype=str,
+            encoding="utf-8",
+            on_bad_lines="skip",
+            chunksize=STOP_TIMES_READ_CHUNK,
+        )
+
+    for chunk in chunks:
         chunk = chunk.replace({r"\N": None, "": None})
-        chunk = chunk[chunk["trip_id"].isin(trip_set)]
+        if trip_set is not None:
+            chunk = chunk[chunk["trip_id"].isin(trip_set)]
+        chunk, rej = stg_types.conform(chunk, "stg.GTFS_StopTimes", GTFS_STOP_TIMES)
+        if rejects is not None and len(rej):
+            rejects.append(rej)
         if not chunk.empty:
-            chunk.to_sql("GTFS_StopTimes", con=engine, schema="stg", if_exists="append",
-                         index=False, chunksize=TO_SQL_CHUNK)
-            total += len(chunk)
-            print(f"   ... +{len(chunk)} sor (100E stop_times összesen: {total})")
+            yield chunk
 
-    print(f"✅ 100E stop_times kész. Betöltött sorok: {total}")
+def stream_stop_times(trip_set=None, segments=None):
+    """stop_times chunkolva -> stg.GTFS_StopTimes (trip_set: csak ezek a trip_id-k, None = FULL);
+    ha van segments (SegmentBuilder), közben a szakaszok is mennek a dw.Fact_ScheduledSegments-be"""
+    label = "FULL" if trip_set is None else "100E"
+    total = 0
+    seg_total = 0
+    n_rejects = 0
+    rejects = []
+    chunks = read_stop_times(trip_set, rejects)
+    while True:
+        with METRICS.stage("stg.GTFS_StopTimes/read") as st:
+            chunk = next(chunks, None)
+            st.rows = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            break
+        with METRICS.stage("stg.GTFS_StopTimes/db_write") as st:
+            st.rows = bulk_load.insert(engine, chunk, "GTFS_StopTimes", "stg", report=False)
+            for rej in rejects:
+                stg_types.write_rejects(engine, rej)
+        n_rejects += sum(len(rej) for rej in rejects)
+        rejects.clear()
+        total += len(chunk)
+        if segments is not None:
+            with METRICS.stage("dw.Fact_ScheduledSegments/build"):
+                seg = segments.feed(chunk)
+            seg_total += write_segments(seg)
+        print(f"   ... +{len(chunk)} sor ({label} stop_times összesen: {total}, szakaszok: {seg_total})")
+
+    if segments is not None:
+        with METRICS.stage("dw.Fact_ScheduledSegments/build"):
+            seg = segments.finish()
+        seg_total += write_segments(seg)
+    for rej in rejects:     # az utolsó (üres) chunkok hibái
+        n_rejects += stg_types.write_rejects(engine, rej)
+    if n_rejects:
+        print(f"   ⚠️ {n_rejects} hibás stop_times érték -> stg.Load_Rejects")
+    print(f"✅ {label} stop_times kész: {total} sor, {seg_total} szakasz.")
     return total
 
+def write_segments(seg):
+    if seg.empty:
+        return 0
+    with METRICS.stage("dw.Fact_ScheduledSegments/db_write") as st:
+        st.rows = bulk_load.insert(engine, seg, "Fact_ScheduledSegments", "dw", report=False)
+    return st.rows
+
+def segment_builder(route_ids=None):
+    """SegmentBuilder a stg.GTFS_Trips trip -> route/service térképével (SEGMENTS_MODE = "sql" esetén None)"""
+    if SEGMENTS_MODE != "python":
+        return None
+    sql = "SELECT trip_id, route_id, service_id FROM stg.GTFS_Trips WHERE trip_id IS NOT NULL"
+    if route_ids:
+        sql += " AND route_id IN (" + ",".join("'" + rid.replace("'", "''") + "'" for rid in route_ids) + ")"
+    return SegmentBuilder(pd.read_sql(sql, engine, dtype=str))
+
 def generate_dim_date_fallback():
     """Dim_Date: fixen nagy intervallum (beadásbiztos), hogy biztos legyen mindenre DateKey"""
-    start = date(2024, 1, 1)
-    end   = date(2026, 12, 31)
+    start = DIM_DATE_START
+    end   = DIM_DATE_END
     print(f"→ Dim_Date generálás: {start} .. {end}")
 
     rows = []
@@ -130,311 +229,352 @@ def generate_dim_date_fallback():
         })
         curr += timedelta(days=1)
 
-    pd.DataFrame(rows).to_sql("Dim_Date", con=engine, schema="dw",
-                              if_exists="append", index=False, chunksize=TO_SQL_CHUNK)
+    bulk_load.insert(engine, pd.DataFrame(rows), "Dim_Date", "dw")
     print(f"   ✅ Dim_Date feltöltve: {len(rows)} nap.")
+    return len(rows)
 
 
-# =========================================================
-# 0) SETUP: táblák (ha hiányoznak)
-# =========================================================
-with engine.begin() as conn:
-    print("\n--- 0. SETUP ---")
-    run_stmt(conn, "IF NOT EXISTS (SELECT 1 FROM sys.schemas WHERE name='stg') EXEC('CREATE SCHEMA stg');")
-    run_stmt(conn, "IF NOT EXISTS (SELECT 1 FROM sys.schemas WHERE name='dw')  EXEC('CREATE SCHEMA dw');")
-
-    # STG
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.OpenFlights_Airports','U') IS NULL
-    CREATE TABLE stg.OpenFlights_Airports (
-        AirportID INT, Name NVARCHAR(255), City NVARCHAR(255), Country NVARCHAR(255),
-        IATA VARCHAR(3), ICAO VARCHAR(4), Lat FLOAT, Lon FLOAT
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.OpenFlights_Routes','U') IS NULL
-    CREATE TABLE stg.OpenFlights_Routes (
-        Airline VARCHAR(3), AirlineID NVARCHAR(10),
-        SourceAirport VARCHAR(3), SourceID NVARCHAR(10),
-        DestAirport VARCHAR(3), DestID NVARCHAR(10)
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.OpenFlights_Airlines','U') IS NULL
-    CREATE TABLE stg.OpenFlights_Airlines (
-        AirlineID INT, Name NVARCHAR(255), Alias NVARCHAR(255), IATA VARCHAR(10), ICAO VARCHAR(10),
-        Callsign NVARCHAR(100), Country NVARCHAR(100), Active VARCHAR(1)
-    );""")
-
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.GTFS_Stops','U') IS NULL
-    CREATE TABLE stg.GTFS_Stops (
-        stop_id VARCHAR(50), stop_name NVARCHAR(255), stop_lat FLOAT, stop_lon FLOAT
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.GTFS_Routes','U') IS NULL
-    CREATE TABLE stg.GTFS_Routes (
-        route_id VARCHAR(80), route_short_name VARCHAR(50), route_desc NVARCHAR(255)
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.GTFS_Trips','U') IS NULL
-    CREATE TABLE stg.GTFS_Trips (
-        route_id VARCHAR(80), service_id VARCHAR(50), trip_id VARCHAR(100) NOT NULL,
-        trip_headsign NVARCHAR(255), direction_id VARCHAR(10), shape_id VARCHAR(80)
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.GTFS_StopTimes','U') IS NULL
-    CREATE TABLE stg.GTFS_StopTimes (
-        trip_id VARCHAR(100) NOT NULL,
-        arrival_time VARCHAR(20),
-        departure_time VARCHAR(20),
-        stop_id VARCHAR(50) NOT NULL,
-        stop_sequence VARCHAR(10)
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('stg.GTFS_CalendarDates','U') IS NULL
-    CREATE TABLE stg.GTFS_CalendarDates (
-        service_id VARCHAR(50) NOT NULL,
-        [date] VARCHAR(8) NOT NULL,
-        exception_type VARCHAR(2) NOT NULL
-    );""")
-
-    # DW
-    run_stmt(conn, """
-    IF OBJECT_ID('dw.Dim_Airport','U') IS NULL
-    CREATE TABLE dw.Dim_Airport (
-        AirportID INT PRIMARY KEY, Name NVARCHAR(255), City NVARCHAR(255), Country NVARCHAR(255), IATA VARCHAR(3)
-    );""")
+def build_segments_sql(conn):
+    """SQL út: LEAD a teljes stg.GTFS_StopTimes-on (SEGMENTS_MODE = "sql", vagy ha a Python ág nem használható).
+    A stop_sequence és az idők már típusosak (stg_types.py): nincs TRY_CAST / PARSENAME, ugyanaz mindkét backenden."""
     run_stmt(conn, """
-    IF OBJECT_ID('dw.Dim_Stop','U') IS NULL
-    CREATE TABLE dw.Dim_Stop (
-        StopID VARCHAR(50) PRIMARY KEY, StopName NVARCHAR(255)
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('dw.Dim_Airline','U') IS NULL
-    CREATE TABLE dw.Dim_Airline (
-        AirlineID INT PRIMARY KEY, Name NVARCHAR(255), IATA VARCHAR(10), Country NVARCHAR(100)
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('dw.Dim_Date','U') IS NULL
-    CREATE TABLE dw.Dim_Date (
-        DateKey INT PRIMARY KEY, FullDate DATE, DayName NVARCHAR(20), IsWeekend BIT
-    );""")
-    run_stmt(conn, """
-    IF OBJECT_ID('dw.Fact_FlightRoutes','U') IS NULL
-    CREATE TABLE dw.Fact_FlightRoutes (
-        RouteID INT IDENTITY(1,1) PRIMARY KEY,
-        SourceAirportID INT,
-        DestAirportID INT,
-        AirlineID INT
-    );""")
-
-    run_stmt(conn, """
-    IF OBJECT_ID('dw.Dim_RouteLine','U') IS NULL
-    CREATE TABLE dw.Dim_RouteLine (
-        RouteID VARCHAR(80) PRIMARY KEY,
-        RouteShortName VARCHAR(50) NULL,
-        RouteDesc NVARCHAR(255) NULL
-    );""")
+        WITH base AS (
+            SELECT
+                t.route_id AS RouteID,
+                t.service_id AS ServiceID,
+                st.trip_id AS TripID,
+                st.stop_id AS FromStopID,
+                LEAD(st.stop_id) OVER (PARTITION BY st.trip_id ORDER BY st.stop_sequence) AS ToStopID,
+                st.departure_sec AS FromSec,
+                LEAD(st.arrival_sec) OVER (PARTITION BY st.trip_id ORDER BY st.stop_sequence) AS ToSec
+            FROM stg.GTFS_StopTimes st
+            JOIN stg.GTFS_Trips t ON t.trip_id = st.trip_id
+        )
+        INSERT INTO dw.Fact_ScheduledSegments
+        (RouteID, ServiceID, TripID, FromStopID, ToStopID, FromDepTimeSec, ToArrTimeSec, ScheduledDurSec)
+        SELECT
+            RouteID, ServiceID, TripID, FromStopID, ToStopID, FromSec, ToSec,
+            CASE WHEN ToSec < FromSec THEN ToSec + 86400 - FromSec ELSE ToSec - FromSec END
+        FROM base
+        WHERE ToStopID IS NOT NULL
+          AND FromSec IS NOT NULL
+          AND ToSec IS NOT NULL;
+    """)
 
-    run_stmt(conn, """
-    IF OBJECT_ID('dw.Bridge_ServiceDate','U') IS NULL
-    CREATE TABLE dw.Bridge_ServiceDate (
-        ServiceID VARCHAR(50) NOT NULL,
-        DateKey INT NOT NULL,
-        IsActive BIT NOT NULL,
-        CONSTRAINT PK_Bridge_ServiceDate PRIMARY KEY (ServiceID, DateKey)
-    );""")
 
-    run_stmt(conn, """
-    IF OBJECT_ID('dw.Fact_ScheduledSegments','U') IS NULL
-    CREATE TABLE dw.Fact_ScheduledSegments (
-        SegmentID INT IDENTITY(1,1) PRIMARY KEY,
-        RouteID VARCHAR(80) NOT NULL,
-        ServiceID VARCHAR(50) NULL,
-        TripID VARCHAR(100) NOT NULL,
-        FromStopID VARCHAR(50) NOT NULL,
-        ToStopID VARCHAR(50) NOT NULL,
-        FromDepTimeSec INT NULL,
-        ToArrTimeSec INT NULL,
-        ScheduledDurSec INT NULL
-    );""")
-
-print("✅ Setup kész.")
+# =========================================================
+# 0) SETUP: táblák (ha hiányoznak)
+# =========================================================
+def setup_tables(manifest):
+    with engine.begin() as conn:
+        print("\n--- 0. SETUP ---")
+        run_stmt(conn, "IF NOT EXISTS (SELECT 1 FROM sys.schemas WHERE name='stg') EXEC('CREATE SCHEMA stg');")
+        run_stmt(conn, "IF NOT EXISTS (SELECT 1 FROM sys.schemas WHERE name='dw')  EXEC('CREATE SCHEMA dw');")
+
+        # STG (típusos oszlopok, stg_types.py); a régi, string oszlopos táblák eldobva -> újratöltődnek
+        for table in stg_types.TYPES:
+            if stg_types.untyped(conn, table):
+                print(f"↻ {table}: régi (string oszlopos) séma -> újra létrehozva")
+                run_stmt(conn, f"DROP TABLE {table};")
+        run_stmt(conn, stg_types.REJECTS_DDL)
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.OpenFlights_Airports','U') IS NULL
+        CREATE TABLE stg.OpenFlights_Airports (
+            AirportID INT NOT NULL, Name NVARCHAR(255), City NVARCHAR(255), Country NVARCHAR(255),
+            IATA VARCHAR(3), ICAO VARCHAR(4), Lat FLOAT, Lon FLOAT
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.OpenFlights_Routes','U') IS NULL
+        CREATE TABLE stg.OpenFlights_Routes (
+            Airline VARCHAR(3), AirlineID INT,
+            SourceAirport VARCHAR(3), SourceID INT,
+            DestAirport VARCHAR(3), DestID INT
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.OpenFlights_Airlines','U') IS NULL
+        CREATE TABLE stg.OpenFlights_Airlines (
+            AirlineID INT NOT NULL, Name NVARCHAR(255), Alias NVARCHAR(255), IATA VARCHAR(10), ICAO VARCHAR(10),
+            Callsign NVARCHAR(100), Country NVARCHAR(100), Active VARCHAR(1)
+        );""")
+
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.GTFS_Stops','U') IS NULL
+        CREATE TABLE stg.GTFS_Stops (
+            stop_id VARCHAR(50), stop_name NVARCHAR(255), stop_lat FLOAT, stop_lon FLOAT
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.GTFS_Routes','U') IS NULL
+        CREATE TABLE stg.GTFS_Routes (
+            route_id VARCHAR(80), route_short_name VARCHAR(50), route_desc NVARCHAR(255)
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.GTFS_Trips','U') IS NULL
+        CREATE TABLE stg.GTFS_Trips (
+            route_id VARCHAR(80), service_id VARCHAR(50), trip_id VARCHAR(100) NOT NULL,
+            trip_headsign NVARCHAR(255), direction_id VARCHAR(10), shape_id VARCHAR(80)
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.GTFS_StopTimes','U') IS NULL
+        CREATE TABLE stg.GTFS_StopTimes (
+            trip_id VARCHAR(100) NOT NULL,
+            arrival_sec INT,
+            departure_sec INT,
+            stop_id VARCHAR(50) NOT NULL,
+            stop_sequence INT NOT NULL
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.GTFS_CalendarDates','U') IS NULL
+        CREATE TABLE stg.GTFS_CalendarDates (
+            service_id VARCHAR(50) NOT NULL,
+            [date] INT NOT NULL,
+            exception_type INT NOT NULL
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('stg.GTFS_Calendar','U') IS NULL
+        CREATE TABLE stg.GTFS_Calendar (
+            service_id VARCHAR(50) NOT NULL,
+            monday INT, tuesday INT, wednesday INT, thursday INT,
+            friday INT, saturday INT, sunday INT,
+            start_date INT NOT NULL,
+            end_date INT NOT NULL
+        );""")
+
+        # DW
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Dim_Airport','U') IS NULL
+        CREATE TABLE dw.Dim_Airport (
+            AirportID INT PRIMARY KEY, Name NVARCHAR(255), City NVARCHAR(255), Country NVARCHAR(255), IATA VARCHAR(3)
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Dim_Stop','U') IS NULL
+        CREATE TABLE dw.Dim_Stop (
+            StopID VARCHAR(50) PRIMARY KEY, StopName NVARCHAR(255)
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Dim_Airline','U') IS NULL
+        CREATE TABLE dw.Dim_Airline (
+            AirlineID INT PRIMARY KEY, Name NVARCHAR(255), IATA VARCHAR(10), Country NVARCHAR(100)
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Dim_Date','U') IS NULL
+        CREATE TABLE dw.Dim_Date (
+            DateKey INT PRIMARY KEY, FullDate DATE, DayName NVARCHAR(20), IsWeekend BIT
+        );""")
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Fact_FlightRoutes','U') IS NULL
+        CREATE TABLE dw.Fact_FlightRoutes (
+            RouteID INT IDENTITY(1,1) PRIMARY KEY,
+            SourceAirportID INT,
+            DestAirportID INT,
+            AirlineID INT
+        );""")
+
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Dim_RouteLine','U') IS NULL
+        CREATE TABLE dw.Dim_RouteLine (
+            RouteID VARCHAR(80) PRIMARY KEY,
+            RouteShortName VARCHAR(50) NULL,
+            RouteDesc NVARCHAR(255) NULL
+        );""")
+
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Bridge_ServiceDate','U') IS NULL
+        CREATE TABLE dw.Bridge_ServiceDate (
+            ServiceID VARCHAR(50) NOT NULL,
+            DateKey INT NOT NULL,
+            IsActive BIT NOT NULL,
+            CONSTRAINT PK_Bridge_ServiceDate PRIMARY KEY (ServiceID, DateKey)
+        );""")
+
+        run_stmt(conn, """
+        IF OBJECT_ID('dw.Fact_ScheduledSegments','U') IS NULL
+        CREATE TABLE dw.Fact_ScheduledSegments (
+            SegmentID INT IDENTITY(1,1) PRIMARY KEY,
+            RouteID VARCHAR(80) NOT NULL,
+            ServiceID VARCHAR(50) NULL,
+            TripID VARCHAR(100) NOT NULL,
+            FromStopID VARCHAR(50) NOT NULL,
+            ToStopID VARCHAR(50) NOT NULL,
+            FromDepTimeSec INT NULL,
+            ToArrTimeSec INT NULL,
+            ScheduledDurSec INT NULL
+        );""")
+
+        run_stmt(conn, service_schedule.SCHEDULE_DDL)
+        for ddl in air_network.NETWORK_DDL:
+            run_stmt(conn, ddl)
+
+        manifest.ensure_tables(conn)
+    print("✅ Setup kész.")
 
 
 # =========================================================
-# 1) ÜRÍTÉS (újratöltés)
+# Függőségek: forrásfájl -> stg tábla -> dw tábla
 # =========================================================
-with engine.begin() as conn:
-    print("\n--- 1. ÜRÍTÉS ---")
-    run_stmt(conn, "TRUNCATE TABLE stg.OpenFlights_Airports;")
-    run_stmt(conn, "TRUNCATE TABLE stg.OpenFlights_Routes;")
-    run_stmt(conn, "TRUNCATE TABLE stg.OpenFlights_Airlines;")
-    run_stmt(conn, "TRUNCATE TABLE stg.GTFS_Stops;")
-    run_stmt(conn, "TRUNCATE TABLE stg.GTFS_Routes;")
-    run_stmt(conn, "TRUNCATE TABLE stg.GTFS_Trips;")
-    run_stmt(conn, "TRUNCATE TABLE stg.GTFS_StopTimes;")
-    run_stmt(conn, "TRUNCATE TABLE stg.GTFS_CalendarDates;")
-
-    run_stmt(conn, "DELETE FROM dw.Fact_ScheduledSegments;")
-    run_stmt(conn, "DELETE FROM dw.Bridge_ServiceDate;")
-    run_stmt(conn, "DELETE FROM dw.Fact_FlightRoutes;")
-    run_stmt(conn, "DELETE FROM dw.Dim_RouteLine;")
-    run_stmt(conn, "DELETE FROM dw.Dim_Airport;")
-    run_stmt(conn, "DELETE FROM dw.Dim_Airline;")
-    run_stmt(conn, "DELETE FROM dw.Dim_Stop;")
-    run_stmt(conn, "DELETE FROM dw.Dim_Date;")
-
-print("✅ Ürítés kész.")
+# A manifest (load_manifest.py) alapján csak az a tábla töltődik újra, aminek a forrása vagy
+# valamelyik függő táblája változott. Pl. napi GTFS frissítésnél az OpenFlights oldal érintetlen marad.
+STG_SOURCES = {
+    "stg.OpenFlights_Airports": [OPENFLIGHTS_AIRPORTS],
+    "stg.OpenFlights_Routes":   [OPENFLIGHTS_ROUTES],
+    "stg.OpenFlights_Airlines": [OPENFLIGHTS_AIRLINES],
+    "stg.GTFS_Stops":           [GTFS_STOPS],
+    "stg.GTFS_Routes":          [GTFS_ROUTES],
+    "stg.GTFS_Trips":           [GTFS_TRIPS],
+    "stg.GTFS_CalendarDates":   [GTFS_CALDATES],
+    "stg.GTFS_Calendar":        [GTFS_CALENDAR],
+    # a 100E szűrés a routes/trips alapján megy, ezért azok változása is újratöltést jelent
+    "stg.GTFS_StopTimes":       [GTFS_STOP_TIMES, GTFS_ROUTES, GTFS_TRIPS],
+}
+STG_PARAMS = {"stg.GTFS_StopTimes": f"target={TARGET_SHORTNAME}"}
+# stg betöltések egymás között: a 100E stop_times szűrés a már betöltött routes / trips táblákat olvassa
+STG_DEPENDS = {"stg.GTFS_StopTimes": ["stg.GTFS_Routes", "stg.GTFS_Trips"]}
+
+# feltöltési sorrendben
+DW_DEPENDS = {
+    "dw.Dim_Date":               [],
+    "dw.Dim_Airport":            ["stg.OpenFlights_Airports"],
+    "dw.Dim_Stop":               ["stg.GTFS_Stops"],
+    "dw.Dim_Airline":            ["stg.OpenFlights_Airlines"],
+    "dw.Dim_RouteLine":          ["stg.GTFS_Routes"],
+    "dw.Fact_FlightRoutes":      ["stg.OpenFlights_Routes", "stg.OpenFlights_Airlines"],
+    "dw.Fact_AirConnections":    ["stg.OpenFlights_Routes", "stg.OpenFlights_Airlines"],
+    "dw.Fact_AirReach":          ["dw.Fact_AirConnections"],   # ugyanabból a számításból (air_network.py)
+    "dw.Bridge_ServiceDate":     ["stg.GTFS_CalendarDates", "dw.Dim_Date"],
+    "dw.Fact_ScheduledSegments": ["stg.GTFS_StopTimes", "stg.GTFS_Trips"],
+    "dw.Fact_TripSchedule":      ["stg.GTFS_Calendar", "stg.GTFS_CalendarDates", "stg.GTFS_Trips", "stg.GTFS_StopTimes"],
+}
+DW_PARAMS = {"dw.Dim_Date": f"{DIM_DATE_START}..{DIM_DATE_END}"}
+# a teljes függőségi gráf (stg + dw): a DAG taskjai és az újrafuttatás (--task) ebből
+DEPENDS = {**{t: STG_DEPENDS.get(t, []) for t in STG_SOURCES}, **DW_DEPENDS}
+
+def plan(manifest, force=False):
+    """-> (ujjlenyomat táblánként, újratöltendő táblák)"""
+    fps = {}
+    for table, files in STG_SOURCES.items():
+        fps[table] = fingerprint(table, STG_PARAMS.get(table, ""),
+                                 *(f"{f}:{manifest.file_sha(f, p(f))}" for f in files))
+    for table, deps in DW_DEPENDS.items():
+        fps[table] = fingerprint(table, DW_PARAMS.get(table, ""), *(fps[d] for d in deps))
+
+    with engine.connect() as conn:
+        rows = table_rows(conn, fps)
+    dirty = {t for t in fps if force or not manifest.is_current(t, fps[t], rows[t])}
+    # ami egy újratöltött táblára épül, az is újraépül (pl. kézzel ürített stg tábla)
+    return fps, etl_dag.downstream(DEPENDS, dirty)
 
 
 # =========================================================
-# 2) STAGING betöltés (GTFS header alapján)
+# 2) STAGING betöltők táblánként (GTFS header alapján)
 # =========================================================
-print("\n--- 2. STAGING betöltés ---")
-
-# OpenFlights
-load_openflights_dat(
-    OPENFLIGHTS_AIRPORTS, "OpenFlights_Airports", "stg",
-    usecols=[0,1,2,3,4,5,6,7],
-    col_names=["AirportID","Name","City","Country","IATA","ICAO","Lat","Lon"]
-)
-load_openflights_dat(
-    OPENFLIGHTS_ROUTES, "OpenFlights_Routes", "stg",
-    usecols=[0,1,2,3,4,5],
-    col_names=["Airline","AirlineID","SourceAirport","SourceID","DestAirport","DestID"]
-)
-# airlines.dat-nál csak ezeket töltjük (a tábla többi oszlopa NULL marad)
-load_openflights_dat(
-    OPENFLIGHTS_AIRLINES, "OpenFlights_Airlines", "stg",
-    usecols=[0,1,3,4,6],
-    col_names=["AirlineID","Name","IATA","ICAO","Country"]
-)
-
-# GTFS (header!)
-load_gtfs_header_csv(GTFS_STOPS,  "GTFS_Stops",  "stg", usecols=["stop_id","stop_name","stop_lat","stop_lon"])
-load_gtfs_header_csv(GTFS_ROUTES, "GTFS_Routes", "stg", usecols=["route_id","route_short_name","route_desc"])
-load_gtfs_header_csv(GTFS_TRIPS,  "GTFS_Trips",  "stg", usecols=["route_id","service_id","trip_id","trip_headsign","direction_id","shape_id"])
-load_gtfs_header_csv(GTFS_CALDATES,"GTFS_CalendarDates","stg", usecols=["service_id","date","exception_type"])
-
-print("✅ STAGING alap betöltés kész (stop_times még hátra).")
+STG_LOADERS = {
+    # OpenFlights
+    "stg.OpenFlights_Airports": lambda: load_openflights_dat(
+        OPENFLIGHTS_AIRPORTS, "OpenFlights_Airports", "stg",
+        usecols=[0,1,2,3,4,5,6,7],
+        col_names=["AirportID","Name","City","Country","IATA","ICAO","Lat","Lon"]
+    ),
+    "stg.OpenFlights_Routes": lambda: load_openflights_dat(
+        OPENFLIGHTS_ROUTES, "OpenFlights_Routes", "stg",
+        usecols=[0,1,2,3,4,5],
+        col_names=["Airline","AirlineID","SourceAirport","SourceID","DestAirport","DestID"]
+    ),
+    # airlines.dat-nál csak ezeket töltjük (a tábla többi oszlopa NULL marad)
+    "stg.OpenFlights_Airlines": lambda: load_openflights_dat(
+        OPENFLIGHTS_AIRLINES, "OpenFlights_Airlines", "stg",
+        usecols=[0,1,3,4,6],
+        col_names=["AirlineID","Name","IATA","ICAO","Country"]
+    ),
+
+    # GTFS (header!)
+    "stg.GTFS_Stops":  lambda: load_gtfs_header_csv(GTFS_STOPS,  "GTFS_Stops",  "stg", usecols=["stop_id","stop_name","stop_lat","stop_lon"]),
+    "stg.GTFS_Routes": lambda: load_gtfs_header_csv(GTFS_ROUTES, "GTFS_Routes", "stg", usecols=["route_id","route_short_name","route_desc"]),
+    "stg.GTFS_Trips":  lambda: load_gtfs_header_csv(GTFS_TRIPS,  "GTFS_Trips",  "stg", usecols=["route_id","service_id","trip_id","trip_headsign","direction_id","shape_id"]),
+    "stg.GTFS_CalendarDates": lambda: load_gtfs_header_csv(GTFS_CALDATES,"GTFS_CalendarDates","stg", usecols=["service_id","date","exception_type"]),
+    "stg.GTFS_Calendar": lambda: load_gtfs_header_csv(GTFS_CALENDAR, "GTFS_Calendar", "stg", usecols=["service_id"] + service_schedule.WEEKDAYS + ["start_date","end_date"]),
+}
 
 
 # =========================================================
 # 2/B) 100E route_id-k -> trip_id-k -> csak azokra stop_times
 # =========================================================
-print("\n--- 2/B. CSAK 100E stop_times betöltés ---")
-
-# Paraméterezés helyett FIX string: nincs többé :public hiba
-routes_100e = pd.read_sql(
-    f"""
-    SELECT DISTINCT route_id, route_short_name, route_desc
-    FROM stg.GTFS_Routes
-    WHERE LTRIM(RTRIM(route_short_name)) = '{TARGET_SHORTNAME}'
-       OR LTRIM(RTRIM(route_desc)) = '{TARGET_SHORTNAME}'
-       OR route_desc LIKE '%{TARGET_SHORTNAME}%'
-    """,
-    engine
-)
-
-if routes_100e.empty:
-    # Gyors fallback: ha mégsem található így, akkor inkább ne álljunk meg -> töltsünk mindent (lassabb, de beadásbiztos)
-    print("⚠️ Nem találtam 100E route-ot a routes táblában (route_short_name/route_desc).")
-    print("⚠️ Fallback: FULL stop_times betöltés (lassabb, de biztosan tovább megy).")
-
-    # FULL stop_times betöltés chunkolva
-    total = 0
-    for chunk in pd.read_csv(
-        p(GTFS_STOP_TIMES),
-        header=0,
-        usecols=["trip_id","arrival_time","departure_time","stop_id","stop_sequence"],
-        dtype=str,
-        encoding="utf-8",
-        on_bad_lines="skip",
-        chunksize=STOP_TIMES_READ_CHUNK
-    ):
-        chunk = chunk.replace({r"\N": None, "": None})
-        chunk.to_sql("GTFS_StopTimes", con=engine, schema="stg", if_exists="append",
-                     index=False, chunksize=TO_SQL_CHUNK)
-        total += len(chunk)
-        print(f"   ... +{len(chunk)} sor (FULL stop_times összesen: {total})")
-    print(f"✅ FULL stop_times kész: {total} sor.")
-else:
-    route_ids = routes_100e["route_id"].astype(str).str.strip().dropna().unique().tolist()
-    print("100E route_id(k):", route_ids[:10])
-
-    # trip_id-k az adott route_id-khez
-    # (IN lista stringgel: gyors, nincs paraméter marker gond)
-    route_ids_sql = ",".join("'" + rid.replace("'", "''") + "'" for rid in route_ids)
-    trip_ids_df = pd.read_sql(
-        f"SELECT DISTINCT trip_id FROM stg.GTFS_Trips WHERE route_id IN ({route_ids_sql})",
+def load_stop_times_100e(build_segments=True):
+    """-> (betöltött stop_times sorok, SegmentBuilder vagy None, ha a szakaszok az SQL ágon mennek)"""
+    # Paraméterezés helyett FIX string: nincs többé :public hiba
+    routes_100e = pd.read_sql(
+        f"""
+        SELECT DISTINCT route_id, route_short_name, route_desc
+        FROM stg.GTFS_Routes
+        WHERE LTRIM(RTRIM(route_short_name)) = '{TARGET_SHORTNAME}'
+           OR LTRIM(RTRIM(route_desc)) = '{TARGET_SHORTNAME}'
+           OR route_desc LIKE '%{TARGET_SHORTNAME}%'
+        """,
         engine
     )
 
-    trip_set = set(trip_ids_df["trip_id"].astype(str).tolist())
-    print(f"✅ 100E trip_id-k száma: {len(trip_set)}")
-
-    if len(trip_set) == 0:
-        print("⚠️ 0 trip_id jött vissza a 100E-hez -> Fallback: FULL stop_times betöltés (beadásbiztos).")
-        total = 0
-        for chunk in pd.read_csv(
-            p(GTFS_STOP_TIMES),
-            header=0,
-            usecols=["trip_id","arrival_time","departure_time","stop_id","stop_sequence"],
-            dtype=str,
-            encoding="utf-8",
-            on_bad_lines="skip",
-            chunksize=STOP_TIMES_READ_CHUNK
-        ):
-            chunk = chunk.replace({r"\N": None, "": None})
-            chunk.to_sql("GTFS_StopTimes", con=engine, schema="stg", if_exists="append",
-                         index=False, chunksize=TO_SQL_CHUNK)
-            total += len(chunk)
-            print(f"   ... +{len(chunk)} sor (FULL stop_times összesen: {total})")
-        print(f"✅ FULL stop_times kész: {total} sor.")
+    segments = None
+    if routes_100e.empty:
+        # Gyors fallback: ha mégsem található így, akkor inkább ne álljunk meg -> töltsünk mindent (lassabb, de beadásbiztos)
+        print("⚠️ Nem találtam 100E route-ot a routes táblában (route_short_name/route_desc).")
+        print("⚠️ Fallback: FULL stop_times betöltés (lassabb, de biztosan tovább megy).")
+        segments = segment_builder() if build_segments else None
+        total = stream_stop_times(segments=segments)
     else:
-        load_stop_times_100e_only(trip_set)
+        route_ids = routes_100e["route_id"].astype(str).str.strip().dropna().unique().tolist()
+        print("100E route_id(k):", route_ids[:10])
+
+        # trip_id-k az adott route_id-khez
+        # (IN lista stringgel: gyors, nincs paraméter marker gond)
+        route_ids_sql = ",".join("'" + rid.replace("'", "''") + "'" for rid in route_ids)
+        trip_ids_df = pd.read_sql(
+            f"SELECT DISTINCT trip_id FROM stg.GTFS_Trips WHERE route_id IN ({route_ids_sql})",
+            engine
+        )
 
+        trip_set = set(trip_ids_df["trip_id"].astype(str).tolist())
+        print(f"✅ 100E trip_id-k száma: {len(trip_set)}")
 
-# =========================================================
-# 3) Dim_Date
-# =========================================================
-print("\n--- 3. Dim_Date ---")
-generate_dim_date_fallback()
+        if len(trip_set) == 0:
+            print("⚠️ 0 trip_id jött vissza a 100E-hez -> Fallback: FULL stop_times betöltés (beadásbiztos).")
+            segments = segment_builder() if build_segments else None
+            total = stream_stop_times(segments=segments)
+        else:
+            segments = segment_builder(route_ids) if build_segments else None
+            total = stream_stop_times(trip_set, segments=segments)
+
+    # ha a stop_times nem trip_id szerint csoportosított, a chunkonkénti számítás nem pontos -> SQL ág
+    if segments is not None and segments.out_of_order:
+        print(f"⚠️ {segments.out_of_order} trip több helyen szerepel a stop_times-ban -> szakaszok SQL-lel újra.")
+        with engine.begin() as conn:
+            run_stmt(conn, "DELETE FROM dw.Fact_ScheduledSegments;")
+        segments = None
+    return total, segments
 
 
 # =========================================================
-# 4) DW feltöltés
+# 4) DW feltöltés (SQL táblánként)
 # =========================================================
-with engine.begin() as conn:
-    print("\n--- 4. DW feltöltés ---")
-
-    print("→ dw.Dim_Airport")
-    run_stmt(conn, """
+DW_SQL = {
+    "dw.Dim_Airport": ("→ dw.Dim_Airport", """
         INSERT INTO dw.Dim_Airport (AirportID, Name, City, Country, IATA)
-        SELECT DISTINCT CAST(AirportID AS INT), Name, City, Country, IATA
-        FROM stg.OpenFlights_Airports
-        WHERE AirportID IS NOT NULL AND ISNUMERIC(AirportID)=1;
-    """)
+        SELECT DISTINCT AirportID, Name, City, Country, IATA
+        FROM stg.OpenFlights_Airports;
+    """),
 
-    print("→ dw.Dim_Stop")
-    run_stmt(conn, """
+    "dw.Dim_Stop": ("→ dw.Dim_Stop", """
         INSERT INTO dw.Dim_Stop (StopID, StopName)
         SELECT DISTINCT stop_id, stop_name
         FROM stg.GTFS_Stops
         WHERE stop_id IS NOT NULL;
-    """)
+    """),
 
-    print("→ dw.Dim_Airline")
-    run_stmt(conn, """
+    "dw.Dim_Airline": ("→ dw.Dim_Airline", """
         INSERT INTO dw.Dim_Airline (AirlineID, Name, IATA, Country)
-        SELECT DISTINCT CAST(AirlineID AS INT), Name, IATA, Country
-        FROM stg.OpenFlights_Airlines
-        WHERE AirlineID IS NOT NULL AND ISNUMERIC(AirlineID)=1;
-    """)
+        SELECT DISTINCT AirlineID, Name, IATA, Country
+        FROM stg.OpenFlights_Airlines;
+    """),
 
     # ✅ PK-duplikáció elleni védelem: 1 sor / route_id
-    print("→ dw.Dim_RouteLine (PK FIX: deduplikálás)")
-    run_stmt(conn, """
+    "dw.Dim_RouteLine": ("→ dw.Dim_RouteLine (PK FIX: deduplikálás)", """
         WITH x AS (
             SELECT
                 LTRIM(RTRIM(route_id)) AS RouteID,
@@ -454,118 +594,215 @@ with engine.begin() as conn:
         SELECT RouteID, RouteShortName, RouteDesc
         FROM x
         WHERE rn = 1;
-    """)
+    """),
 
-    print("→ dw.Fact_FlightRoutes (BUD szűréssel)")
-    run_stmt(conn, """
+    "dw.Fact_FlightRoutes": ("→ dw.Fact_FlightRoutes (BUD szűréssel)", """
         INSERT INTO dw.Fact_FlightRoutes (SourceAirportID, DestAirportID, AirlineID)
-        SELECT
-            TRY_CAST(r.SourceID AS INT),
-            TRY_CAST(r.DestID AS INT),
-            CAST(a.AirlineID AS INT)
+        SELECT r.SourceID, r.DestID, a.AirlineID
         FROM stg.OpenFlights_Routes r
         INNER JOIN stg.OpenFlights_Airlines a
             ON (r.Airline = a.IATA OR r.Airline = a.ICAO)
         WHERE (r.SourceAirport = 'BUD' OR r.DestAirport = 'BUD')
-          AND ISNUMERIC(r.SourceID)=1 AND ISNUMERIC(r.DestID)=1
-          AND ISNUMERIC(a.AirlineID)=1;
-    """)
+          AND r.SourceID IS NOT NULL AND r.DestID IS NOT NULL;
+    """),
 
-    print("→ dw.Bridge_ServiceDate")
-    run_stmt(conn, """
+    "dw.Bridge_ServiceDate": ("→ dw.Bridge_ServiceDate", """
         INSERT INTO dw.Bridge_ServiceDate (ServiceID, DateKey, IsActive)
         SELECT
             cd.service_id,
             d.DateKey,
-            CASE WHEN cd.exception_type = '1' THEN 1 ELSE 0 END
+            CASE WHEN cd.exception_type = 1 THEN 1 ELSE 0 END
         FROM stg.GTFS_CalendarDates cd
         JOIN dw.Dim_Date d
-          ON d.DateKey = TRY_CAST(cd.[date] AS INT);
-    """)
-
-    # Menetrendi szakaszok: ha stop_times 100E-only, akkor ez is az lesz
-    print("→ dw.Fact_ScheduledSegments")
-    run_stmt(conn, f"""
-        WITH base AS (
-            SELECT
-                t.route_id AS RouteID,
-                t.service_id AS ServiceID,
-                st.trip_id AS TripID,
-                st.stop_id AS FromStopID,
-                LEAD(st.stop_id) OVER (PARTITION BY st.trip_id ORDER BY TRY_CAST(st.stop_sequence AS INT)) AS ToStopID,
-                st.departure_time AS FromDepTime,
-                LEAD(st.arrival_time) OVER (PARTITION BY st.trip_id ORDER BY TRY_CAST(st.stop_sequence AS INT)) AS ToArrTime
-            FROM stg.GTFS_StopTimes st
-            JOIN stg.GTFS_Trips t ON t.trip_id = st.trip_id
-            WHERE TRY_CAST(st.stop_sequence AS INT) IS NOT NULL
-        )
-        INSERT INTO dw.Fact_ScheduledSegments
-        (RouteID, ServiceID, TripID, FromStopID, ToStopID, FromDepTimeSec, ToArrTimeSec, ScheduledDurSec)
-        SELECT
-            RouteID,
-            ServiceID,
-            TripID,
-            FromStopID,
-            ToStopID,
-
-            (TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),3) AS INT) * 3600
-             + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),2) AS INT) * 60
-             + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),1) AS INT)
-            ) AS FromDepTimeSec,
-
-            (TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),3) AS INT) * 3600
-             + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),2) AS INT) * 60
-             + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),1) AS INT)
-            ) AS ToArrTimeSec,
-
-            CASE
-              WHEN
-                (TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),3) AS INT) * 3600
-                 + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),2) AS INT) * 60
-                 + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),1) AS INT))
-                <
-                (TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),3) AS INT) * 3600
-                 + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),2) AS INT) * 60
-                 + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),1) AS INT))
-              THEN
-                (TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),3) AS INT) * 3600
-                 + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),2) AS INT) * 60
-                 + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),1) AS INT)) + 86400
-                -
-                (TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),3) AS INT) * 3600
-                 + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),2) AS INT) * 60
-                 + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),1) AS INT))
-              ELSE
-                (TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),3) AS INT) * 3600
-                 + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),2) AS INT) * 60
-                 + TRY_CAST(PARSENAME(REPLACE(ToArrTime,':','.'),1) AS INT))
-                -
-                (TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),3) AS INT) * 3600
-                 + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),2) AS INT) * 60
-                 + TRY_CAST(PARSENAME(REPLACE(FromDepTime,':','.'),1) AS INT))
-            END AS ScheduledDurSec
-        FROM base
-        WHERE ToStopID IS NOT NULL
-          AND FromDepTime IS NOT NULL
-          AND ToArrTime IS NOT NULL;
-    """)
-
-print("✅ DW feltöltés kész.")
+          ON d.DateKey = cd.[date];
+    """),
+}
 
 
 # =========================================================
-# 5) Ellenőrzések
+# 2-4) Taskok: táblánként egy, a DEPENDS szerinti függőségekkel
 # =========================================================
-with engine.connect() as conn:
-    print("\n--- 5. Ellenőrzések ---")
-    checks = [
-        ("stg.GTFS_StopTimes", "SELECT COUNT(*) FROM stg.GTFS_StopTimes"),
-        ("dw.Dim_RouteLine", "SELECT COUNT(*) FROM dw.Dim_RouteLine"),
-        ("dw.Fact_ScheduledSegments", "SELECT COUNT(*) FROM dw.Fact_ScheduledSegments"),
-        ("dw.Bridge_ServiceDate", "SELECT COUNT(*) FROM dw.Bridge_ServiceDate"),
-    ]
-    for name, sql in checks:
-        c = conn.execute(sqlalchemy.text(sql)).scalar()
-        print(f"{name}: {c}")
-
-print("\n=== KÉSZ. Power BI: Refresh ===")
+def build_dag(manifest, fps, dirty):
+    """Csak az újratöltendő táblák taskjai; a nem szereplő (változatlan) függőség kész táblának számít.
+    Minden task a saját tranzakciójában ír, a végén a manifestbe a tábla sorszámát."""
+    dag = etl_dag.DAG()
+    # a manifest írások ne fussanak egymásba (ugyanaz a stg.Load_Manifest tábla)
+    mark_lock = threading.Lock()
+
+    def mark(table, rows=None):
+        with mark_lock, engine.begin() as conn:
+            if rows is None:
+                rows = table_rows(conn, [table])[table]
+            manifest.mark(conn, table, fps[table], rows)
+
+    def stg_task(table, load):
+        def run():
+            rows = load()
+            mark(table, rows)
+            return rows
+        return run
+
+    def stop_times_task():
+        print("→ CSAK 100E stop_times betöltés")
+        rows, segments = load_stop_times_100e(build_segments="dw.Fact_ScheduledSegments" in dirty)
+        mark("stg.GTFS_StopTimes", rows)
+        return segments
+
+    def dim_date_task():
+        with METRICS.stage("dw.Dim_Date") as st:
+            st.rows = rows = generate_dim_date_fallback()
+        mark("dw.Dim_Date", rows)
+
+    def sql_task(table, label, sql):
+        def run():
+            print(label)
+            with METRICS.stage(table), engine.begin() as conn:
+                run_stmt(conn, sql)
+            mark(table)
+        return run
+
+    def air_network_task():
+        # BUD elérhetőség 0 / 1 / 2 átszállással (air_network.py): a két tábla egy számításból jön
+        print("→ dw.Fact_AirConnections + dw.Fact_AirReach (CSR gráf)")
+        with METRICS.stage("dw.Fact_AirConnections") as st, engine.begin() as conn:
+            st.rows, dests = air_network.build(conn, DATA_FOLDER)
+        print(f"   ✅ {st.rows} kapcsolat sor, {dests} elérhető cél")
+        mark("dw.Fact_AirConnections")
+
+    def air_reach_task():
+        if "dw.Fact_AirConnections" not in dag:
+            air_network_task()
+        mark("dw.Fact_AirReach")
+
+    def segments_task():
+        # Menetrendi szakaszok: ha stop_times 100E-only, akkor ez is az lesz
+        segments = dag.result("stg.GTFS_StopTimes")
+        if segments is not None:
+            print(f"→ dw.Fact_ScheduledSegments: már kész a stop_times olvasás közben ({segments.rows} sor)")
+        else:
+            print("→ dw.Fact_ScheduledSegments (SQL)")
+            with METRICS.stage("dw.Fact_ScheduledSegments"), engine.begin() as conn:
+                build_segments_sql(conn)
+        mark("dw.Fact_ScheduledSegments")
+
+    def trip_schedule_task():
+        # üzemnap x trip x megálló abszolút időkkel (service_schedule.py), a tábla törlése, utána naponként INSERT
+        print("→ dw.Fact_TripSchedule")
+        with METRICS.stage("dw.Fact_TripSchedule") as st, engine.begin() as conn:
+            st.rows, days = service_schedule.build(conn)
+        print(f"   ✅ {st.rows} sor, {days} üzemnap")
+        mark("dw.Fact_TripSchedule")
+
+    tasks = {table: stg_task(table, load) for table, load in STG_LOADERS.items()}
+    tasks["stg.GTFS_StopTimes"] = stop_times_task
+    tasks["dw.Dim_Date"] = dim_date_task
+    tasks.update({table: sql_task(table, label, sql) for table, (label, sql) in DW_SQL.items()})
+    tasks["dw.Fact_AirConnections"] = air_network_task
+    tasks["dw.Fact_AirReach"] = air_reach_task
+    tasks["dw.Fact_ScheduledSegments"] = segments_task
+    tasks["dw.Fact_TripSchedule"] = trip_schedule_task
+
+    for table, deps in DEPENDS.items():
+        if table in dirty:
+            dag.add(table, tasks[table], deps)
+    return dag
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="BudAirportBI statikus ETL (OpenFlights + GTFS -> stg / dw)")
+    ap.add_argument("--force", action="store_true", help="manifesttől függetlenül minden újratöltése")
+    ap.add_argument("--task", action="append", default=[], metavar="TÁBLA",
+                    help="csak ez a tábla és ami ráépül (pl. --task stg.GTFS_Trips); többször is megadható")
+    ap.add_argument("--workers", type=int, default=ETL_WORKERS, help="párhuzamos taskok száma")
+    ap.add_argument("--serial", action="store_true", help="egy szálon, a régi sorrendben")
+    args = ap.parse_args(sys.argv[1:] if argv is None else argv)
+    workers = 1 if args.serial else args.workers
+    unknown = [t for t in args.task if t not in DEPENDS]
+    if unknown:
+        raise SystemExit(f"❌ Ismeretlen task: {', '.join(unknown)} (választható: {', '.join(DEPENDS)})")
+
+    print("=== BudAirportBI - ETL (GTFS header alapján + 100E-only stop_times + PK fix) ===")
+    t0 = time.perf_counter()
+    METRICS.poll_start()   # egy ETL futás = egy ciklus a metrikákban
+    manifest = Manifest(engine)
+    with METRICS.stage("setup"):
+        setup_tables(manifest)
+
+    # =========================================================
+    # 1) Mi változott? (manifest) + ÜRÍTÉS csak ott
+    # =========================================================
+    with METRICS.stage("plan"):
+        manifest.load()
+        fps, dirty = plan(manifest, args.force)
+        if args.task:
+            # kézi újrafuttatás: a megadott táblák + minden, ami rájuk épül (a manifesttől függetlenül)
+            dirty = etl_dag.downstream(DEPENDS, args.task)
+        manifest.save_files()
+
+    if not dirty:
+        METRICS.flush(reloaded=[], total_sec=round(time.perf_counter() - t0, 2))
+        print(f"\n✅ Minden forrás változatlan, nincs mit újratölteni. ({time.perf_counter() - t0:.1f}s)")
+        return
+    print(f"\nÚjratöltés: {', '.join(t for t in fps if t in dirty)}")
+    skipped = [t for t in fps if t not in dirty]
+    if skipped:
+        print(f"Változatlan (kihagyva): {', '.join(skipped)}")
+
+    with METRICS.stage("truncate"), engine.begin() as conn:
+        print("\n--- 1. ÜRÍTÉS ---")
+        for table in fps:
+            if table not in dirty:
+                continue
+            manifest.forget(conn, table)
+            run_stmt(conn, f"TRUNCATE TABLE {table};" if table.startswith("stg.") else f"DELETE FROM {table};")
+            if table in stg_types.TYPES:
+                stg_types.clear_rejects(conn, table)
+
+    print("✅ Ürítés kész.")
+
+    # =========================================================
+    # 2-4) STAGING + Dim_Date + DW: függőségi gráf, a független lépések párhuzamosan (etl_dag.py)
+    # =========================================================
+    print(f"\n--- 2-4. STAGING + DW ({workers} szálon) ---")
+    dag = build_dag(manifest, fps, dirty)
+    try:
+        dag.run(workers)
+    finally:
+        dag.report()
+        bulk_load.summary()
+
+    print("✅ DW feltöltés kész.")
+
+    # =========================================================
+    # 5) Ellenőrzések
+    # =========================================================
+    counts = {}
+    with METRICS.stage("checks"), engine.connect() as conn:
+        print("\n--- 5. Ellenőrzések ---")
+        checks = [
+            ("stg.GTFS_StopTimes", "SELECT COUNT(*) FROM stg.GTFS_StopTimes"),
+            ("dw.Dim_RouteLine", "SELECT COUNT(*) FROM dw.Dim_RouteLine"),
+            ("dw.Fact_ScheduledSegments", "SELECT COUNT(*) FROM dw.Fact_ScheduledSegments"),
+            ("dw.Bridge_ServiceDate", "SELECT COUNT(*) FROM dw.Bridge_ServiceDate"),
+            ("dw.Fact_TripSchedule", "SELECT COUNT(*) FROM dw.Fact_TripSchedule"),
+            ("dw.Fact_AirReach", "SELECT COUNT(*) FROM dw.Fact_AirReach"),
+            ("stg.Load_Rejects", "SELECT COUNT(*) FROM stg.Load_Rejects"),
+        ]
+        for name, sql in checks:
+            c = conn.execute(sqlalchemy.text(sql)).scalar()
+            counts[name] = c
+            print(f"{name}: {c}")
+
+    path, cp = dag.critical_path()
+    METRICS.flush(reloaded=[t for t in fps if t in dirty], rows=counts, total_sec=round(time.perf_counter() - t0, 2),
+                  critical_path=path, critical_path_sec=round(cp, 2),
+                  tasks={name: round(t.sec, 3) for name, t in dag.tasks.items()})
+    print(f"\n=== KÉSZ ({time.perf_counter() - t0:.1f}s). Power BI: Refresh ===")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception:
+        # a félbemaradt futás is látszódjon (hibák lépés és típus szerint)
+        METRICS.flush(ok=False)
+        raise
@@ -0,0 +1,244 @@
+import json
+from typing import Dict, List, Optional, Union
+import pandas as pd
+
+from arrivals_parse import ARRIVAL_COLS, epoch_to_dt, service_date, parse_arrivals, headway_rows
+
+try:
+    import msgspec
+except ImportError:     # msgspec nélkül: json.loads + a dict alapú parse (arrivals_parse / vehicle_positions)
+    msgspec = None
+
+# =========================================================
+# FUTÁR válaszok típusos dekódolása (arrivals-and-departures-for-stop, vehicles-for-route)
+# =========================================================
+# Eddig minden válasz teljesen dict-fává dekódolódott (json.loads / r.json()), benne a soha nem használt
+# references ágakkal (agencies, routes, stops, alerts), utána .get() láncok jártak végig rajta.
+# Itt (msgspec) a JSON közvetlenül kis, típusos rekordokba dekódolódik:
+#   - csak a használt mezők vannak deklarálva, minden más ágat a dekóder objektum építése nélkül átugrik
+#     (a references-ből csak a trips[*].routeId marad)
+#   - strict=False: "123" / 123.0 is elfogadott számnak, serviceDate lehet "20251214" vagy epoch
+#   - ha a válasz nem a várt alakú (ValidationError), a régi dict alapú út fut, ugyanazzal az eredménnyel
+# Kimenet:
+#   - arrival_rows(...)    -> (érkezés sorok, headway sorok), mint arrivals_parse.parse_arrivals (élő poll)
+#   - ArrivalColumns       -> oszlopos batch (oszloponként egy lista), több snapshotból egy DataFrame (backfill)
+#   - vehicle_rows(...)    -> mint vehicle_positions.parse_vehicles
+# A bemenet lehet bytes (nyers válasz / fájl) vagy már dekódolt dict (pl. snapshot archívumból): ilyenkor a
+# dict alapú út fut.
+#
+# payload = futar_decode.decode_arrivals(body)
+# rows, head_rows = futar_decode.arrival_rows(payload, snap_dt, raw_name, route_id=..., stop_id=...)
+
+DecodeError = ValueError    # msgspec.DecodeError / ValidationError és json.JSONDecodeError is ValueError
+
+if msgspec is not None:
+    # ---------- arrivals-and-departures-for-stop ----------
+    class TripRef(msgspec.Struct):
+        routeId: Optional[str] = None
+
+    class StopTime(msgspec.Struct):
+        tripId: Optional[str] = None
+        departureTime: Optional[int] = None
+        predictedDepartureTime: Optional[int] = None
+        serviceDate: Union[int, str, None] = None
+
+    class ArrivalDeparture(msgspec.Struct):
+        routeId: Optional[str] = None
+        tripId: Optional[str] = None
+        scheduledArrivalTime: Optional[int] = None
+        scheduledDepartureTime: Optional[int] = None
+        predictedArrivalTime: Optional[int] = None
+        predictedDepartureTime: Optional[int] = None
+        serviceDate: Union[int, str, None] = None
+
+    class StopEntry(msgspec.Struct):
+        stopId: Optional[str] = None
+        stopTimes: Optional[List[StopTime]] = None
+        arrivalsAndDepartures: Optional[List[ArrivalDeparture]] = None
+
+    class ArrivalRefs(msgspec.Struct):
+        trips: Optional[Dict[str, TripRef]] = None
+
+    class ArrivalData(msgspec.Struct):
+        entry: Optional[StopEntry] = None
+        references: Optional[ArrivalRefs] = None
+
+    class ArrivalsResponse(msgspec.Struct):
+        data: Optional[ArrivalData] = None
+
+    # ---------- vehicles-for-route ----------
+    class Location(msgspec.Struct):
+        lat: Optional[float] = None
+        lon: Optional[float] = None
+
+    class Vehicle(msgspec.Struct):
+        vehicleId: Optional[str] = None
+        routeId: Optional[str] = None
+        tripId: Optional[str] = None
+        stopId: Optional[str] = None
+        stopSequence: Optional[int] = None
+        stopDistancePercent: Optional[int] = None
+        bearing: Optional[float] = None
+        location: Optional[Location] = None
+        status: Optional[str] = None
+        lastUpdateTime: Optional[int] = None
+        serviceDate: Union[int, str, None] = None
+        licensePlate: Optional[str] = None
+
+    class VehicleData(msgspec.Struct):
+        list: Optional[List[Vehicle]] = None
+
+    class VehiclesResponse(msgspec.Struct):
+        data: Optional[VehicleData] = None
+
+    _arr_decoder = msgspec.json.Decoder(ArrivalsResponse, strict=False)
+    _veh_decoder = msgspec.json.Decoder(VehiclesResponse, strict=False)
+
+def _decode(body, decoder):
+    if isinstance(body, (dict, list)):
+        return body
+    if decoder is not None:
+        try:
+            return decoder.decode(body)
+        except msgspec.ValidationError:
+            pass        # érvényes JSON, de más alakú: dict alapú út
+    return json.loads(body)
+
+def decode_arrivals(body):
+    """nyers arrivals válasz (bytes / str) -> ArrivalsResponse (vagy dict, ha nincs msgspec / más alakú)"""
+    return _decode(body, _arr_decoder if msgspec is not None else None)
+
+def decode_vehicles(body):
+    """nyers vehicles-for-route válasz -> VehiclesResponse (vagy dict)"""
+    return _decode(body, _veh_decoder if msgspec is not None else None)
+
+# ---------- arrivals -> rekordok ----------
+def _arrival_records(payload, route_id):
+    """ArrivalsResponse -> (stopId, routeId, tripId, ServiceDate, sched, pred) a route_id-ra, parse_arrivals szabályai szerint"""
+    data = payload.data
+    entry = data.entry if data is not None else None
+    if entry is None:
+        return
+    stop = entry.stopId
+    if entry.arrivalsAndDepartures:
+        for a in entry.arrivalsAndDepartures:
+            if a.routeId != route_id:
+                continue
+            sched = epoch_to_dt(a.scheduledArrivalTime) or epoch_to_dt(a.scheduledDepartureTime)
+            pred = epoch_to_dt(a.predictedArrivalTime) or epoch_to_dt(a.predictedDepartureTime)
+            yield stop, a.routeId, a.tripId, service_date(a.serviceDate, sched), sched, pred
+        return
+    refs = data.references.trips if data.references is not None else None
+    refs = refs or {}
+    for s in entry.stopTimes or ():
+        ref = refs.get(s.tripId)
+        rid = ref.routeId if ref is not None else None
+        if rid != route_id:
+            continue
+        sched = epoch_to_dt(s.departureTime)
+        pred = epoch_to_dt(s.predictedDepartureTime) or sched
+        yield stop, rid, s.tripId, service_date(s.serviceDate, sched), sched, pred
+
+def arrival_rows(payload, snap_dt, raw_name, route_id, stop_id=None):
+    """decode_arrivals eredménye (vagy bytes / dict) -> (érkezés sorok, headway sorok), mint parse_arrivals"""
+    if not (msgspec is not None and isinstance(payload, msgspec.Struct)):
+        payload = decode_arrivals(payload)
+        if isinstance(payload, dict):
+            return parse_arrivals(payload, snap_dt, raw_name, route_id=route_id, stop_id=stop_id)
+    rows, pred_times = [], []
+    for stop, rid, trip, sdate, sched, pred in _arrival_records(payload, route_id):
+        if pred:
+            pred_times.append(pred)
+        rows.append({
+            "SnapshotDT": snap_dt,
+            "StopId": stop,
+            "RouteIdRT": rid,
+            "TripId": trip,
+            "ServiceDate": sdate,
+            "ScheduledArrivalDT": sched,
+            "PredictedArrivalDT": pred,
+            "DelaySec": int((pred - sched).total_seconds()) if sched and pred else None,
+            "RawFile": raw_name,
+        })
+    if stop_id is None and payload.data is not None and payload.data.entry is not None:
+        stop_id = payload.data.entry.stopId
+    return rows, headway_rows(pred_times, snap_dt, stop_id, route_id, raw_name)
+
+class ArrivalColumns:
+    """Oszlopos batch több snapshot érkezés soraiból (ARRIVAL_COLS + ServiceDate) + a headway sorok"""
+    COLS = ARRIVAL_COLS + ["ServiceDate"]
+
+    def __init__(self):
+        self.cols = {c: [] for c in self.COLS}
+        self.head_rows = []
+
+    def __len__(self):
+        return len(self.cols["SnapshotDT"])
+
+    def add(self, payload, snap_dt, raw_name, route_id, stop_id=None):
+        """egy snapshot (bytes / dict / ArrivalsResponse) hozzáadása; -> a hozzáadott érkezés sorok száma"""
+        if not (msgspec is not None and isinstance(payload, msgspec.Struct)):
+            payload = decode_arrivals(payload)
+        if isinstance(payload, dict):
+            rows, head_rows = parse_arrivals(payload, snap_dt, raw_name, route_id=route_id, stop_id=stop_id)
+            for c in self.COLS:
+                self.cols[c].extend(r.get(c) for r in rows)
+            self.head_rows.extend(head_rows)
+            return len(rows)
+
+        c = self.cols
+        n0, pred_times = len(self), []
+        for stop, rid, trip, sdate, sched, pred in _arrival_records(payload, route_id):
+            c["StopId"].append(stop)
+            c["RouteIdRT"].append(rid)
+            c["TripId"].append(trip)
+            c["ServiceDate"].append(sdate)
+            c["ScheduledArrivalDT"].append(sched)
+            c["PredictedArrivalDT"].append(pred)
+            c["DelaySec"].append(int((pred - sched).total_seconds()) if sched and pred else None)
+            if pred:
+                pred_times.append(pred)
+        n = len(c["StopId"]) - n0
+        c["SnapshotDT"].extend([snap_dt] * n)
+        c["RawFile"].extend([raw_name] * n)
+        if stop_id is None and payload.data is not None and payload.data.entry is not None:
+            stop_id = payload.data.entry.stopId
+        self.head_rows.extend(headway_rows(pred_times, snap_dt, stop_id, route_id, raw_name))
+        return n
+
+    def frame(self):
+        return pd.DataFrame(self.cols, columns=self.COLS)
+
+# ---------- vehicles -> sorok ----------
+def vehicle_rows(payload, snap_dt, raw_name):
+    """decode_vehicles eredménye (vagy bytes / dict) -> jármű sorok, mint vehicle_positions.parse_vehicles"""
+    if not (msgspec is not None and isinstance(payload, msgspec.Struct)):
+        payload = decode_vehicles(payload)
+        if isinstance(payload, dict):
+            import vehicle_positions    # körkörös import elkerülése (vehicle_positions is ezt a modult használja)
+            return vehicle_positions.parse_vehicles(payload, snap_dt, raw_name)
+    rows = []
+    vehicles = payload.data.list if payload.data is not None else None
+    for v in vehicles or ():
+        if not v.vehicleId:
+            continue
+        loc = v.location
+        last = epoch_to_dt(v.lastUpdateTime)
+        rows.append({
+            "SnapshotDT": snap_dt,
+            "VehicleId": v.vehicleId,
+            "RouteIdRT": v.routeId,
+            "TripId": v.tripId,
+            "StopId": v.stopId,
+            "StopSequence": v.stopSequence,
+            "StopDistancePercent": v.stopDistancePercent,
+            "Bearing": v.bearing,
+            "Lat": loc.lat if loc is not None else None,
+            "Lon": loc.lon if loc is not None else None,
+            "Status": v.status,
+            "LastUpdateDT": last,
+            "ServiceDate": service_date(v.serviceDate, last),
+            "LicensePlate": v.licensePlate,
+            "RawFile": raw_name,
+        })
+    return rows
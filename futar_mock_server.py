@@ -0,0 +1,227 @@
+import os, sys, glob, time, random, bisect, argparse, threading, json
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import snapshot_archive
+from arrivals_parse import LEGACY_STOP_ID, LEGACY_ROUTE_ID
+
+# =========================================================
+# Helyi FUTÁR helyettesítő: az archivált válaszok visszajátszása terheléses teszthez
+# =========================================================
+# Két végpont, ugyanazon az úton, mint a futar.bkk.hu:
+#   /api/query/v1/ws/otp/api/where/arrivals-and-departures-for-stop.json?stopId=...
+#   /api/query/v1/ws/otp/api/where/vehicles-for-route.json?routeId=...
+# Forrás: a bkk_100e_arr_*.json (arrivals) és bkk_100e_*.json (vehicles) fájlok, vagy archív stream.
+#
+# Virtuális óra: az archívum első snapshotjától indul, --speed-szer gyorsabban telik; minden kérés a
+# virtuális időpont előtti legutolsó snapshotot kapja (a végén elölről kezdi).
+# Bármilyen stopId / routeId kérhető (skálázás N célra): a 100E válaszban a megálló és a vonal azonosítót
+# a kértre cseréljük, és célonként eltolt snapshotot adunk, hogy ne legyen mind egyforma.
+# Hibainjektálás: --error-rate (HTTP 500/503), --slow-rate (--slow-ms késleltetés), --latency-ms (+- jitter).
+#
+# python futar_mock_server.py --speed 10 --latency-ms 40 --error-rate 0.02
+#   -> FUTAR_BASE_URL=http://127.0.0.1:8765/api/query/v1/ws/otp/api/where python realtime_poller_async.py
+# python futar_mock_server.py --make-targets 200 targets.csv   -> 200 szintetikus cél a pollernek
+# GET /stats -> kiszolgált kérések, hibák, kérés/s (JSON)
+
+DATA_FOLDER = r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data"
+ARR_SRC = os.path.join(DATA_FOLDER, "arrivals", "RealTime_JSON")
+VEH_SRC = os.path.join(DATA_FOLDER, "RealTime_JSON")
+
+HOST = "127.0.0.1"
+PORT = 8765
+API_PREFIX = "/api/query/v1/ws/otp/api/where/"
+VEHICLE_ROUTE_ID = "BKK_1005"
+
+class Replay:
+    """Egy végpont snapshotjai időrendben: (ts, nyers JSON bájtok)"""
+    def __init__(self, items):
+        items.sort(key=lambda x: x[0])
+        self.ts = [t.timestamp() for t, _ in items]
+        self.bodies = [b for _, b in items]
+
+    def __len__(self):
+        return len(self.bodies)
+
+    @classmethod
+    def from_folder(cls, folder, want):
+        items = []
+        for path in glob.glob(os.path.join(folder, "bkk_100e_*.json")):
+            parsed = snapshot_archive.split_raw_name(path)
+            if not parsed or parsed[0] != want:
+                continue
+            with open(path, "rb") as f:
+                # tömörítve tároljuk (a kiírt fájlok indent-tel vannak), a válasz is kisebb
+                items.append((parsed[1], json.dumps(json.loads(f.read()), separators=(",", ":")).encode("utf-8")))
+        return cls(items)
+
+    @classmethod
+    def from_archive(cls, stream):
+        reader = snapshot_archive.ArchiveReader(stream)
+        items = [(ts, json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+                 for ts, payload in reader.between(datetime(1970, 1, 2), datetime(9999, 1, 1))]
+        return cls(items)
+
+    def pick(self, virtual_ts, shift=0):
+        i = max(bisect.bisect_right(self.ts, virtual_ts) - 1, 0)
+        return self.bodies[(i + shift) % len(self.bodies)]
+
+
+class MockState:
+    def __init__(self, arrivals, vehicles, speed=1.0, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, slow_rate=0.0, slow_ms=15_000, seed=None):
+        self.arrivals, self.vehicles = arrivals, vehicles
+        self.speed = speed
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.error_rate, self.slow_rate, self.slow_ms = error_rate, slow_rate, slow_ms
+        self.rng = random.Random(seed)
+        self.t0_real = time.time()
+        starts = [r.ts[0] for r in (arrivals, vehicles) if len(r)]
+        ends = [r.ts[-1] for r in (arrivals, vehicles) if len(r)]
+        self.t0_virtual = min(starts) if starts else 0.0
+        self.span = max(max(ends) - self.t0_virtual, 1.0) if ends else 1.0
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "ok": 0, "errors": 0, "slow": 0, "bytes": 0, "by_endpoint": {}}
+
+    def virtual_ts(self):
+        # a végén elölről: a visszajátszás tetszőleges ideig futhat
+        return self.t0_virtual + ((time.time() - self.t0_real) * self.speed) % self.span
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def snapshot_stats(self):
+        with self.lock:
+            st = json.loads(json.dumps(self.stats))
+        up = time.time() - self.t0_real
+        st.update(uptime_sec=round(up, 1), req_per_sec=round(st["requests"] / up, 1) if up else 0.0,
+                  virtual_time=datetime.fromtimestamp(self.virtual_ts()).isoformat(timespec="seconds"))
+        return st
+
+
+def _shift(target):
+    # célonként stabil eltolás, hogy a szintetikus célok ne ugyanazt a snapshotot kapják
+    return sum(target.encode("utf-8")) % 97 if target else 0
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"   # keep-alive: a poller requests.Session-je újrahasznosítja
+        disable_nagle_algorithm = True  # különben keep-alive mellett ~40 ms késleltetett ACK / kérés
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, body, ctype="application/json;charset=UTF-8"):
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/stats":
+                return self._send(200, json.dumps(state.snapshot_stats(), indent=2).encode("utf-8"))
+            if not url.path.startswith(API_PREFIX):
+                return self._send(404, b'{"code":404,"text":"not found"}')
+
+            endpoint = url.path[len(API_PREFIX):]
+            q = {k: v[0] for k, v in parse_qs(url.query).items()}
+            state.count("requests")
+            with state.lock:
+                eps = state.stats["by_endpoint"]
+                eps[endpoint] = eps.get(endpoint, 0) + 1
+                roll = state.rng.random()
+                delay = state.latency_ms + state.rng.uniform(-state.jitter_ms, state.jitter_ms)
+
+            if roll < state.slow_rate:
+                state.count("slow")
+                delay += state.slow_ms
+            if delay > 0:
+                time.sleep(delay / 1000)
+            if roll >= 1 - state.error_rate:
+                state.count("errors")
+                return self._send(503 if roll > 1 - state.error_rate / 2 else 500,
+                                  b'{"code":500,"text":"injected error"}')
+
+            if endpoint == "arrivals-and-departures-for-stop.json" and len(state.arrivals):
+                stop_id = q.get("stopId", LEGACY_STOP_ID)
+                route_id = q.get("routeId")
+                body = state.arrivals.pick(state.virtual_ts(), _shift(stop_id))
+                if stop_id != LEGACY_STOP_ID:
+                    body = body.replace(f'"{LEGACY_STOP_ID}"'.encode(), json.dumps(stop_id).encode())
+                if route_id and route_id != LEGACY_ROUTE_ID:
+                    body = body.replace(f'"{LEGACY_ROUTE_ID}"'.encode(), json.dumps(route_id).encode())
+            elif endpoint == "vehicles-for-route.json" and len(state.vehicles):
+                route_id = q.get("routeId", VEHICLE_ROUTE_ID)
+                body = state.vehicles.pick(state.virtual_ts(), _shift(route_id))
+                if route_id != VEHICLE_ROUTE_ID:
+                    body = body.replace(f'"{VEHICLE_ROUTE_ID}"'.encode(), json.dumps(route_id).encode())
+            else:
+                return self._send(404, b'{"code":404,"text":"unknown endpoint"}')
+
+            state.count("ok")
+            state.count("bytes", len(body))
+            self._send(200, body)
+
+    return Handler
+
+def make_targets(n, path):
+    """n szintetikus (stopId, routeId) cél a realtime_poller_async.py-nek (targets.csv formátum).
+    A poller routeId nélkül kérdez, így a válaszban a 100E marad: a célok a 100E-t figyelik N megállóban"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("stopId,routeId\n")
+        f.write(f"{LEGACY_STOP_ID},{LEGACY_ROUTE_ID}\n")
+        for i in range(1, n):
+            f.write(f"MOCK_S{i:05d},{LEGACY_ROUTE_ID}\n")
+    print(f"✅ {n} cél -> {path}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="FUTÁR API helyettesítő: archivált válaszok visszajátszása")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--arrivals", default=ARR_SRC, help="bkk_100e_arr_*.json mappa vagy archive:<stream>")
+    ap.add_argument("--vehicles", default=VEH_SRC, help="bkk_100e_*.json mappa vagy archive:<stream>")
+    ap.add_argument("--speed", type=float, default=1.0, help="virtuális idő gyorsítása (10 = 10x)")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--jitter-ms", type=float, default=0.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="HTTP 500/503 aránya (0..1)")
+    ap.add_argument("--slow-rate", type=float, default=0.0, help="lassú válaszok aránya (0..1)")
+    ap.add_argument("--slow-ms", type=float, default=15_000.0, help="lassú válasz plusz késése")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--make-targets", nargs=2, metavar=("N", "CSV"), help="szintetikus célok fájlba, majd kilép")
+    args = ap.parse_args(argv)
+
+    if args.make_targets:
+        return make_targets(int(args.make_targets[0]), args.make_targets[1])
+
+    def load(src, want):
+        if src.startswith("archive:"):
+            return Replay.from_archive(src[len("archive:"):])
+        return Replay.from_folder(src, want)
+
+    t0 = time.perf_counter()
+    arrivals = load(args.arrivals, "bkk_100e_arr")
+    vehicles = load(args.vehicles, "bkk_100e")
+    state = MockState(arrivals, vehicles, args.speed, args.latency_ms, args.jitter_ms,
+                      args.error_rate, args.slow_rate, args.slow_ms, args.seed)
+    print(f"--- FUTÁR mock: {len(arrivals)} arrivals + {len(vehicles)} vehicles snapshot "
+          f"({time.perf_counter() - t0:.1f}s) | speed={args.speed}x | latency={args.latency_ms}±{args.jitter_ms}ms "
+          f"| error={args.error_rate:.0%} | slow={args.slow_rate:.0%} ---")
+    print(f"FUTAR_BASE_URL=http://{args.host}:{args.port}{API_PREFIX.rstrip('/')}")
+    print(f"Statisztika: http://{args.host}:{args.port}/stats | Leállítás: CTRL+C")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nLeállítás...")
+    finally:
+        server.server_close()
+        print(json.dumps(state.snapshot_stats(), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
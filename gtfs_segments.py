@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# dw.Fact_ScheduledSegments számítása stop_times chunkokból (SQL LEAD + PARSENAME helyett)
+# =========================================================
+# Ugyanazt adja, mint az etl_static.py SQL ága:
+#   - a típusos stop_times chunkokból (stg_types.py: stop_sequence INT, arrival_sec / departure_sec),
+#     trip-enként stop_sequence szerint rendezve
+#   - (From = aktuális megálló indulása, To = következő megálló érkezése)
+#   - időpontok másodpercben, 24:00 feletti GTFS idők is (pl. 25:10:00 -> 90600); hiányzó idő -> nincs szakasz
+#   - negatív időtartam esetén +86400
+#   - csak a stg.GTFS_Trips-ben szereplő trip-ek (az SQL is JOIN-olt)
+#
+# A stop_times.txt gyakorlatilag mindig trip_id szerint csoportosítva van: egy chunk utolsó
+# trip-je átlóghat a következőbe, ezért azt visszatartjuk a következő chunkig (carry).
+# Ha egy már lezárt trip később újra felbukkan, azt az out_of_order számolja: ilyenkor a hívó
+# az SQL ágra vált (az stg.GTFS_StopTimes úgyis megvan).
+
+SEGMENT_COLS = ["RouteID", "ServiceID", "TripID", "FromStopID", "ToStopID",
+                "FromDepTimeSec", "ToArrTimeSec", "ScheduledDurSec"]
+
+_TIME_RE = r"^\s*(\d+):(\d+):(\d+)\s*$"
+
+def time_to_sec(s: pd.Series) -> pd.Series:
+    """'HH:MM:SS' -> másodperc (Int64, hibás/üres -> <NA>); minden különböző string csak egyszer parse-olódik"""
+    codes, uniques = pd.factorize(s)
+    parts = pd.Series(uniques, dtype=object).str.extract(_TIME_RE).astype(float)
+    secs = (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy()
+    out = np.full(len(codes), np.nan)
+    ok = codes >= 0
+    out[ok] = secs[codes[ok]]
+    return pd.Series(out, index=s.index).astype("Int64")
+
+def segments_from_sorted(st: pd.DataFrame, trip_map: pd.DataFrame) -> pd.DataFrame:
+    """st: teljes trip-ek sorai (trip_id, stop_sequence szerint rendezve, seq int) -> szakaszok"""
+    if st.empty:
+        return pd.DataFrame(columns=SEGMENT_COLS)
+
+    trip = st["trip_id"].to_numpy()
+    same_trip = trip[:-1] == trip[1:]          # i. sor és i+1. sor ugyanabban a trip-ben -> szakasz
+    frm = st.iloc[:-1][same_trip]
+    to = st.iloc[1:][same_trip]
+
+    dep = pd.array(frm["departure_sec"], dtype="Int64").to_numpy(dtype="float64", na_value=np.nan)
+    arr = pd.array(to["arrival_sec"], dtype="Int64").to_numpy(dtype="float64", na_value=np.nan)
+    keep = ~np.isnan(dep) & ~np.isnan(arr)
+    dep, arr = dep[keep], arr[keep]
+    dur = arr - dep
+    dur = np.where(dur < 0, dur + 86400, dur)
+
+    seg = pd.DataFrame({
+        "TripID": frm["trip_id"].to_numpy()[keep],
+        "FromStopID": frm["stop_id"].to_numpy()[keep],
+        "ToStopID": to["stop_id"].to_numpy()[keep],
+        "FromDepTimeSec": pd.array(dep, dtype="Int64"),
+        "ToArrTimeSec": pd.array(arr, dtype="Int64"),
+        "ScheduledDurSec": pd.array(dur, dtype="Int64"),
+    })
+    seg = seg.merge(trip_map, left_on="TripID", right_on="trip_id", how="inner")
+    seg = seg.rename(columns={"route_id": "RouteID", "service_id": "ServiceID"})
+    return seg[SEGMENT_COLS]
+
+
+class SegmentBuilder:
+    """Chunkonként etetve (feed) adja vissza a lezárt trip-ek szakaszait; a végén finish()."""
+
+    def __init__(self, trip_map: pd.DataFrame):
+        # trip_id -> route_id, service_id (stg.GTFS_Trips); trip-enként egy sor, mint az SQL JOIN-nál feltételezve
+        self.trip_map = trip_map[["trip_id", "route_id", "service_id"]].drop_duplicates("trip_id")
+        self._carry = None
+        self._done = set()
+        self.out_of_order = 0
+        self.rows = 0
+
+    def _prepare(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        # a stop_sequence már egész (a hibásak a staging-nél kiestek, stg.Load_Rejects)
+        ok = chunk["stop_sequence"].notna() & chunk["trip_id"].notna() & chunk["stop_id"].notna()
+        st = chunk.loc[ok, ["trip_id", "stop_id", "arrival_sec", "departure_sec"]].copy()
+        st["seq"] = chunk.loc[ok, "stop_sequence"].astype("int64")
+        return st
+
+    def feed(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        st = self._prepare(chunk)
+        if self._carry is not None:
+            st = pd.concat([self._carry, st], ignore_index=True)
+            self._carry = None
+        if st.empty:
+            return pd.DataFrame(columns=SEGMENT_COLS)
+
+        # az utolsó trip átlóghat a következő chunkba
+        last = st["trip_id"].iat[-1]
+        tail = st["trip_id"].to_numpy() == last
+        self._carry = st[tail]
+        return self._emit(st[~tail])
+
+    def finish(self) -> pd.DataFrame:
+        st, self._carry = self._carry, None
+        if st is None or st.empty:
+            return pd.DataFrame(columns=SEGMENT_COLS)
+        return self._emit(st)
+
+    def _emit(self, st: pd.DataFrame) -> pd.DataFrame:
+        trips = pd.unique(st["trip_id"])
+        if self._done:
+            self.out_of_order += int(pd.Series(trips).isin(self._done).sum())
+        self._done.update(trips)
+
+        st = st.sort_values(["trip_id", "seq"], kind="stable")
+        seg = segments_from_sorted(st, self.trip_map)
+        self.rows += len(seg)
+        return seg
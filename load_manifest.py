@@ -0,0 +1,115 @@
+import os
+import hashlib
+import sqlalchemy
+
+import backend
+
+# =========================================================
+# Betöltési manifest: mi van bent a stg / dw táblákban, és miből lett
+# =========================================================
+# stg.Load_SourceFile: forrásfájlonként méret + mtime + sha256. Ha a méret és az mtime egyezik,
+#                      nem hash-elünk újra (egy no-op futás így nem olvassa végig a stop_times-t).
+# stg.Load_Manifest:   táblánként (stg és dw is) egy ujjlenyomat (a forrásfájlok / függő táblák
+#                      ujjlenyomatából) + a betöltött sorok száma.
+# Egy tábla akkor aktuális, ha az ujjlenyomata és a sorszáma is egyezik a manifestben tárolttal.
+# A manifest a DB-ben van, nem fájlban: ha az adatbázis újra lett húzva, vele együtt tűnik el.
+
+HASH_BLOCK = 1 << 20
+MISSING = "MISSING"
+
+def _text(stmt):
+    return sqlalchemy.text(backend.sql(stmt))
+
+def file_state(path, known=None):
+    """(méret, mtime_ns, sha256) vagy None, ha nincs ilyen fájl"""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return known
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return (st.st_size, st.st_mtime_ns, h.hexdigest())
+
+def fingerprint(*parts):
+    return hashlib.sha256("\n".join(str(x) for x in parts).encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    def __init__(self, engine):
+        self.engine = engine
+        self.files = {}     # FileName -> (méret, mtime_ns, sha256)
+        self.tables = {}    # TableName -> (Fingerprint, RowsLoaded)
+        self._changed_files = {}
+
+    def ensure_tables(self, conn):
+        conn.execute(_text("""
+        IF OBJECT_ID('stg.Load_SourceFile','U') IS NULL
+        CREATE TABLE stg.Load_SourceFile (
+            FileName VARCHAR(260) NOT NULL PRIMARY KEY,
+            SizeBytes BIGINT NOT NULL,
+            MTimeNs BIGINT NOT NULL,
+            Sha256 CHAR(64) NOT NULL,
+            CheckedAt DATETIME2(0) NOT NULL
+        );"""))
+        conn.execute(_text("""
+        IF OBJECT_ID('stg.Load_Manifest','U') IS NULL
+        CREATE TABLE stg.Load_Manifest (
+            TableName VARCHAR(128) NOT NULL PRIMARY KEY,
+            Fingerprint CHAR(64) NOT NULL,
+            RowsLoaded BIGINT NOT NULL,
+            LoadedAt DATETIME2(0) NOT NULL
+        );"""))
+
+    def load(self):
+        with self.engine.connect() as conn:
+            for name, size, mtime, sha in conn.execute(_text(
+                    "SELECT FileName, SizeBytes, MTimeNs, Sha256 FROM stg.Load_SourceFile")):
+                self.files[name] = (int(size), int(mtime), sha.strip())
+            for name, fp, rows in conn.execute(_text(
+                    "SELECT TableName, Fingerprint, RowsLoaded FROM stg.Load_Manifest")):
+                self.tables[name] = (fp.strip(), int(rows))
+
+    def file_sha(self, name, path):
+        state = file_state(path, self.files.get(name))
+        if state is None:
+            return MISSING
+        if state != self.files.get(name):
+            self.files[name] = state
+            self._changed_files[name] = state
+        return state[2]
+
+    def save_files(self):
+        if not self._changed_files:
+            return
+        with self.engine.begin() as conn:
+            for name, (size, mtime, sha) in self._changed_files.items():
+                conn.execute(_text("DELETE FROM stg.Load_SourceFile WHERE FileName = :n"), {"n": name})
+                conn.execute(_text("""
+                    INSERT INTO stg.Load_SourceFile (FileName, SizeBytes, MTimeNs, Sha256, CheckedAt)
+                    VALUES (:n, :s, :m, :h, SYSDATETIME())"""), {"n": name, "s": size, "m": mtime, "h": sha})
+        self._changed_files.clear()
+
+    def is_current(self, table, fp, rows):
+        return self.tables.get(table) == (fp, rows)
+
+    def forget(self, conn, table):
+        """Ürítés előtt: ha a betöltés félúton elhasal, a tábla a következő futásnál is újratöltődik"""
+        conn.execute(_text("DELETE FROM stg.Load_Manifest WHERE TableName = :t"), {"t": table})
+        self.tables.pop(table, None)
+
+    def mark(self, conn, table, fp, rows):
+        conn.execute(_text("DELETE FROM stg.Load_Manifest WHERE TableName = :t"), {"t": table})
+        conn.execute(_text("""
+            INSERT INTO stg.Load_Manifest (TableName, Fingerprint, RowsLoaded, LoadedAt)
+            VALUES (:t, :f, :r, SYSDATETIME())"""), {"t": table, "f": fp, "r": int(rows)})
+        self.tables[table] = (fp, int(rows))
+
+
+def table_rows(conn, tables):
+    """{tábla: sorszám} egyetlen lekérdezéssel"""
+    tables = list(tables)
+    sql = "\nUNION ALL\n".join(f"SELECT '{t}', COUNT_BIG(*) FROM {t}" for t in tables)
+    return {name: int(n) for name, n in conn.execute(_text(sql))}
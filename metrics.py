@@ -0,0 +1,252 @@
+import os, json, time, bisect, threading
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# =========================================================
+# Metrikák az ETL-hez és a realtime ciklusokhoz: Prometheus szöveg + JSON log
+# =========================================================
+# Lépésenként (fetch, decode, parse, file_write, db_write, ... ETL-nél táblánként) mért idő, sorok, bájtok,
+# hibák típus szerint, és pollereknél a késés az ütemezetthez képest (poll lag).
+#   <METRICS_FOLDER>\<job>.prom   - Prometheus text format, minden flush() után atomikusan felülírva
+#                                   (node_exporter textfile collector olvashatja, vagy kézzel megnézhető)
+#   <METRICS_FOLDER>\<job>.jsonl  - egy JSON sor / poll ciklus (ETL-nél / futás): lépés idők, sorok, hibák
+#   http://127.0.0.1:<METRICS_PORT>/metrics - ha METRICS_PORT meg van adva: ugyanaz HTTP-n (minden job)
+#
+# Használat:
+#   m = metrics.Metrics("ingest_100e")
+#   m.poll_start()
+#   with m.stage("fetch") as st:
+#       body = ...; st.bytes = len(body)
+#   m.flush(rows=...)                      -> JSON sor + .prom
+#   time.sleep(m.next_poll(sec))           -> a következő poll az előző indulása + sec-kor esedékes;
+#                                             poll lag = tényleges indulás - esedékesség (lassú ciklus -> nő)
+#
+# Riasztáshoz: budairportbi_last_success_timestamp_seconds (time() - ez > pl. 5 perc -> lemaradt az ingest),
+# budairportbi_poll_lag_seconds, budairportbi_errors_total.
+
+METRICS_FOLDER = os.environ.get(
+    "BUDAIRPORTBI_METRICS",
+    r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data\metrics",
+)
+METRICS_PORT = int(os.environ["BUDAIRPORTBI_METRICS_PORT"]) if os.environ.get("BUDAIRPORTBI_METRICS_PORT") else None
+PREFIX = "budairportbi"
+# lépés idő hisztogram határai (mp): a ms-os parse-tól a perces ETL lépésekig
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_registry = {}
+_server = None
+
+def _esc(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**kv):
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in kv.items()) + "}"
+
+class _Stage:
+    def __init__(self, metrics, name):
+        self.metrics, self.name = metrics, name
+        self.rows = None
+        self.bytes = None
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        sec = time.perf_counter() - self.t0
+        self.metrics.observe(self.name, sec, self.rows, self.bytes)
+        if exc is not None:
+            self.metrics.error(self.name, exc)
+        return False  # a hibát nem nyeljük el, a hívó kezeli, mint eddig
+
+class Metrics:
+    def __init__(self, job, folder=None, port=METRICS_PORT):
+        self.job = job
+        self.folder = folder or METRICS_FOLDER
+        self.lock = threading.Lock()
+        self.hist = {}       # lépés -> [bucket darabok..., +Inf], összeg, darab
+        self.rows = {}
+        self.bytes = {}
+        self.errors = {}     # (lépés, típus) -> darab
+        self.polls = {"ok": 0, "error": 0}
+        self.gauges = {}
+        self.cycle = {}      # az aktuális ciklus: lépés -> mp
+        self.cycle_errors = []
+        self.cycle_t0 = None
+        self.last_start = None
+        self.next_due = None
+        _registry[job] = self
+        if port:
+            serve(port)
+
+    # ---------- mérés ----------
+    def stage(self, name):
+        """with m.stage("parse") as st: ...; st.rows = n; st.bytes = b"""
+        return _Stage(self, name)
+
+    def observe(self, name, sec, rows=None, nbytes=None):
+        with self.lock:
+            h = self.hist.get(name)
+            if h is None:
+                h = self.hist[name] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            h[0][bisect.bisect_left(BUCKETS, sec)] += 1
+            h[1] += sec
+            h[2] += 1
+            if rows is not None:
+                self.rows[name] = self.rows.get(name, 0) + rows
+            if nbytes is not None:
+                self.bytes[name] = self.bytes.get(name, 0) + nbytes
+            self.cycle[name] = self.cycle.get(name, 0.0) + sec
+
+    def error(self, name, err):
+        """err: kivétel (típusa lesz a címke; HTTP hibánál a státusz kód) vagy szöveg (pl. "HTTP503")"""
+        code = getattr(getattr(err, "response", None), "status_code", None)
+        kind = err if isinstance(err, str) else (f"HTTP{code}" if code else type(err).__name__)
+        with self.lock:
+            self.errors[(name, kind)] = self.errors.get((name, kind), 0) + 1
+            self.cycle_errors.append({"stage": name, "type": kind, "msg": "" if isinstance(err, str) else str(err)[:200]})
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    # ---------- poll ciklus ----------
+    def poll_start(self):
+        """Ciklus eleje; -> késés mp-ben az ütemezett időponthoz képest (első ciklusnál 0)"""
+        now = time.time()
+        lag = max(now - self.next_due, 0.0) if self.next_due is not None else 0.0
+        with self.lock:
+            self.cycle, self.cycle_errors = {}, []
+            self.cycle_t0 = self.last_start = now
+            self.gauges["poll_lag_seconds"] = lag
+            self.gauges["poll_lag_max_seconds"] = max(self.gauges.get("poll_lag_max_seconds", 0.0), lag)
+        return lag
+
+    def next_poll(self, sec):
+        """A következő poll az előző indulása után sec mp-cel esedékes (ez a tervezett ütem);
+        -> sec (time.sleep(m.next_poll(...))). A ciklus saját ideje + az alvás túlfutása lesz a lag."""
+        self.next_due = (self.last_start or time.time()) + sec
+        self.gauge("next_poll_seconds", sec)
+        return sec
+
+    def flush(self, ok=None, **fields):
+        """Ciklus / futás vége: JSON sor a .jsonl-be és a .prom frissítése.
+        ok: sikeres volt-e (alap: nem volt hiba a ciklusban); fields: további mezők a JSON sorba"""
+        now = time.time()
+        with self.lock:
+            if ok is None:
+                ok = not self.cycle_errors
+            self.polls["ok" if ok else "error"] += 1
+            if ok:
+                self.gauges["last_success_timestamp_seconds"] = now
+            rec = {
+                "ts": datetime.now().isoformat(timespec="milliseconds"),
+                "job": self.job,
+                "ok": ok,
+                "cycle_sec": round(now - self.cycle_t0, 4) if self.cycle_t0 else None,
+                "lag_sec": round(self.gauges.get("poll_lag_seconds", 0.0), 3),
+                "stages": {k: round(v, 4) for k, v in self.cycle.items()},
+                "errors": self.cycle_errors,
+            }
+            rec.update(fields)
+            self.cycle, self.cycle_errors, self.cycle_t0 = {}, [], None
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(os.path.join(self.folder, f"{self.job}.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+            self.write_prom()
+        except OSError as e:
+            # a metrika írás hibája ne állítsa meg a gyűjtést
+            print(f"⚠️ metrika írás HIBA: {e}")
+        return rec
+
+    # ---------- export ----------
+    def families(self):
+        """metrika család -> minta sorok (Prometheus text format)"""
+        job = self.job
+        fam = {}
+        add = lambda name, labels, value: fam.setdefault(name, []).append(f"{PREFIX}_{name}{labels} {value}")
+        with self.lock:
+            for name, (buckets, total, count) in sorted(self.hist.items()):
+                acc = 0
+                for le, n in zip(BUCKETS + ("+Inf",), buckets):
+                    acc += n
+                    fam.setdefault("stage_duration_seconds", []).append(
+                        f"{PREFIX}_stage_duration_seconds_bucket{_labels(job=job, stage=name, le=le)} {acc}")
+                fam["stage_duration_seconds"].append(
+                    f"{PREFIX}_stage_duration_seconds_sum{_labels(job=job, stage=name)} {total:.6f}")
+                fam["stage_duration_seconds"].append(
+                    f"{PREFIX}_stage_duration_seconds_count{_labels(job=job, stage=name)} {count}")
+            for name, n in sorted(self.rows.items()):
+                add("rows_total", _labels(job=job, stage=name), n)
+            for name, n in sorted(self.bytes.items()):
+                add("bytes_total", _labels(job=job, stage=name), n)
+            for (name, kind), n in sorted(self.errors.items()):
+                add("errors_total", _labels(job=job, stage=name, type=kind), n)
+            for status, n in self.polls.items():
+                add("polls_total", _labels(job=job, status=status), n)
+            for name, v in sorted(self.gauges.items()):
+                add(name, _labels(job=job), f"{v:.3f}")
+        return fam
+
+    def write_prom(self):
+        path = os.path.join(self.folder, f"{self.job}.prom")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(prom_text([self]))
+        os.replace(tmp, path)
+
+_HELP = {
+    "stage_duration_seconds": ("histogram", "lépés futásideje"),
+    "rows_total": ("counter", "feldolgozott sorok lépésenként"),
+    "bytes_total": ("counter", "feldolgozott bájtok lépésenként"),
+    "errors_total": ("counter", "hibák lépés és típus szerint"),
+    "polls_total": ("counter", "lezárt ciklusok / futások státusz szerint"),
+    "poll_lag_seconds": ("gauge", "az utolsó poll késése az ütemezetthez képest"),
+    "poll_lag_max_seconds": ("gauge", "a legnagyobb poll késés indulás óta"),
+    "next_poll_seconds": ("gauge", "a következő pollig választott várakozás"),
+    "last_success_timestamp_seconds": ("gauge", "az utolsó sikeres ciklus vége (unix idő)"),
+}
+
+def prom_text(items=None):
+    """Prometheus text format (alap: a processz összes Metrics példánya); családonként egy HELP / TYPE"""
+    items = list(_registry.values()) if items is None else items
+    merged = {}
+    for m in items:
+        for name, lines in m.families().items():
+            merged.setdefault(name, []).extend(lines)
+    out = []
+    for name, lines in merged.items():
+        kind, help_ = _HELP.get(name, ("gauge", name))
+        out.append(f"# HELP {PREFIX}_{name} {help_}")
+        out.append(f"# TYPE {PREFIX}_{name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+def serve(port, host="127.0.0.1"):
+    """GET /metrics a processz összes Metrics-ével (háttér szál; többszöri hívásra egyszer indul)"""
+    global _server
+    if _server is not None:
+        return _server
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = prom_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    _server = ThreadingHTTPServer((host, port), Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    print(f"   metrikák: http://{host}:{port}/metrics")
+    return _server
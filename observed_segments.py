@@ -0,0 +1,212 @@
+import sys, time, argparse
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+import backend
+import bulk_load
+import futar_decode
+import vehicle_positions
+
+# =========================================================
+# dw.Fact_ObservedSegments: tényleges megálló -> megálló menetidők a jármű pályákból
+# =========================================================
+# A vehicles-for-route minden járműnél megadja a trip-et, a következő megállót (stopId) és annak
+# sorszámát (stopSequence), valamint a jármű utolsó jelentésének idejét (lastUpdateTime).
+# Ha ugyanazon a trip-en a következő megálló A -> B-re vált, a jármű A-n az előző és az aktuális
+# jelentés között haladt át: áthaladási idő = a kettő közepe, hibahatár = a fél különbség.
+# Két egymást követő (sorszám +1) áthaladás egy megfigyelt szakasz, kulcsa mint a
+# dw.Fact_ScheduledSegments-ben: (TripID, FromStopID, ToStopID), + üzemnap.
+#
+# Egyetlen, időrendben haladó menet: a jelentéseket chunkonként kapja, járművenként csak az utolsó
+# jelentést és az utolsó áthaladást viszi tovább, így a futásidő az archívum méretével lineáris.
+#
+# python observed_segments.py                   -> stg.RealTime_VehiclePositions utolsó 14 napja
+# python observed_segments.py --days 0          -> a teljes tábla
+# python observed_segments.py --archive bkk_100e / --delta bkk_100e_delta / <JSON mappa>
+#                                               -> közvetlenül a nyers archívumból (DB pozíciók nélkül)
+
+SERVER = vehicle_positions.SERVER
+DATABASE = vehicle_positions.DATABASE
+DRIVER = vehicle_positions.DRIVER
+
+RT_PREFIX = "BKK_"
+READ_CHUNK = 200_000          # ennyi pozíció sor egy feed()-ben
+SNAPSHOTS_PER_CHUNK = 2_000   # nyers archívumból ennyi snapshot egy feed()-ben
+MAX_GAP_SEC = 900             # ennél ritkább jelentések között nem becslünk áthaladást
+
+OBSERVED_COLS = ["ServiceDate", "TripID", "FromStopID", "ToStopID", "VehicleId",
+                 "FromPassDT", "ToPassDT", "ObservedDurSec", "MaxErrSec", "ScheduledDurSec"]
+
+OBSERVED_DDL = """
+IF OBJECT_ID('dw.Fact_ObservedSegments','U') IS NULL
+CREATE TABLE dw.Fact_ObservedSegments (
+    ServiceDate DATE NOT NULL,
+    TripID VARCHAR(100) NOT NULL,
+    FromStopID VARCHAR(50) NOT NULL,
+    ToStopID VARCHAR(50) NOT NULL,
+    VehicleId VARCHAR(50) NULL,
+    FromPassDT DATETIME2(0) NOT NULL,
+    ToPassDT DATETIME2(0) NOT NULL,
+    ObservedDurSec INT NOT NULL,
+    MaxErrSec INT NOT NULL,
+    ScheduledDurSec INT NULL,
+    CONSTRAINT PK_Fact_ObservedSegments PRIMARY KEY (ServiceDate, TripID, FromStopID, ToStopID)
+);
+"""
+
+_ROW_COLS = ["VehicleId", "TripId", "StopId", "StopSequence", "LastUpdateDT", "ServiceDate"]
+_PASS_COLS = ["VehicleId", "TripId", "ServiceDate", "Seq", "StopId", "PassDT", "ErrSec"]
+
+def _strip(s: pd.Series) -> pd.Series:
+    return s.str.replace(r"^" + RT_PREFIX, "", regex=True)
+
+class TrajectoryProcessor:
+    def __init__(self):
+        self.carry_rows = pd.DataFrame(columns=_ROW_COLS)
+        self.carry_pass = pd.DataFrame(columns=_PASS_COLS)
+        self.rows = 0
+        self.passages = 0
+
+    def _prepare(self, df):
+        df = df[_ROW_COLS].dropna(subset=["VehicleId", "TripId", "StopId", "StopSequence", "LastUpdateDT"])
+        df = df.astype({"StopSequence": "int64"})
+        df["LastUpdateDT"] = pd.to_datetime(df["LastUpdateDT"])
+        return df
+
+    def feed(self, df):
+        """Időrendben érkező pozíció sorok (vehicle_positions.POSITION_COLS) -> megfigyelt szakaszok"""
+        df = self._prepare(df)
+        self.rows += len(df)
+        if df.empty:
+            return pd.DataFrame(columns=OBSERVED_COLS[:-1])
+
+        # ugyanaz a jelentés több snapshotban is szerepel (a jármű azóta nem jelentett): egyszer kell
+        df = pd.concat([self.carry_rows, df], ignore_index=True) if len(self.carry_rows) else df
+        df = (df.drop_duplicates(["VehicleId", "LastUpdateDT"])
+                .sort_values(["VehicleId", "LastUpdateDT"], kind="stable")
+                .reset_index(drop=True))
+
+        prev = df.groupby("VehicleId", sort=False).shift(1)
+        gap = (df["LastUpdateDT"] - prev["LastUpdateDT"]).dt.total_seconds()
+        changed = ((prev["TripId"] == df["TripId"]) & (prev["StopId"] != df["StopId"])
+                   & (df["StopSequence"] > prev["StopSequence"]) & (gap <= MAX_GAP_SEC))
+        p, c = prev[changed], df[changed]
+        passed = pd.DataFrame({
+            "VehicleId": c["VehicleId"],
+            "TripId": c["TripId"],
+            "ServiceDate": c["ServiceDate"],
+            "Seq": p["StopSequence"].astype("int64"),
+            "StopId": p["StopId"],
+            "PassDT": p["LastUpdateDT"] + (c["LastUpdateDT"] - p["LastUpdateDT"]) / 2,
+            "ErrSec": np.ceil(gap[changed] / 2).astype("int64"),
+        })
+        self.passages += len(passed)
+        self.carry_rows = df.groupby("VehicleId", sort=False).tail(1)
+
+        # áthaladások: az előző chunkból járművenként az utolsó + az újak, járművenként időrendben
+        allp = pd.concat([self.carry_pass, passed], ignore_index=True) if len(self.carry_pass) else passed
+        allp = allp.sort_values(["VehicleId", "PassDT"], kind="stable").reset_index(drop=True)
+        if len(allp):
+            self.carry_pass = allp.groupby("VehicleId", sort=False).tail(1)
+        prevp = allp.groupby("VehicleId", sort=False).shift(1)
+        seg = (prevp["TripId"] == allp["TripId"]) & (allp["Seq"] == prevp["Seq"] + 1)
+        a, b = prevp[seg], allp[seg]
+        return pd.DataFrame({
+            "ServiceDate": b["ServiceDate"],
+            "TripID": _strip(b["TripId"]),
+            "FromStopID": _strip(a["StopId"]),
+            "ToStopID": _strip(b["StopId"]),
+            "VehicleId": b["VehicleId"],
+            "FromPassDT": a["PassDT"].dt.floor("s"),
+            "ToPassDT": b["PassDT"].dt.floor("s"),
+            "ObservedDurSec": (b["PassDT"] - a["PassDT"]).dt.total_seconds().round().astype("int64"),
+            "MaxErrSec": a["ErrSec"].astype("int64") + b["ErrSec"].astype("int64"),
+        })
+
+def add_scheduled(engine, obs):
+    """ScheduledDurSec a dw.Fact_ScheduledSegments-ből (TripID, FromStopID, ToStopID)"""
+    obs = obs.copy()
+    obs["ScheduledDurSec"] = pd.array([pd.NA] * len(obs), dtype="Int64")
+    if obs.empty:
+        return obs
+    trips = sorted(obs["TripID"].unique())
+    frames = []
+    for i in range(0, len(trips), 500):
+        part = trips[i:i + 500]
+        marks = ", ".join("?" for _ in part)
+        frames.append(pd.read_sql(
+            f"SELECT TripID, FromStopID, ToStopID, ScheduledDurSec FROM dw.Fact_ScheduledSegments WHERE TripID IN ({marks})",
+            engine, params=tuple(part)))
+    sched = pd.concat(frames, ignore_index=True).drop_duplicates(["TripID", "FromStopID", "ToStopID"])
+    if sched.empty:
+        return obs
+    obs = obs.drop(columns="ScheduledDurSec").merge(sched, on=["TripID", "FromStopID", "ToStopID"], how="left")
+    obs["ScheduledDurSec"] = obs["ScheduledDurSec"].astype("Int64")
+    return obs
+
+def write(engine, obs, from_date=None):
+    """Az érintett üzemnapok újraírása (from_date előtti napokhoz nem nyúl: azokról csak részadat van)"""
+    if from_date is not None:
+        obs = obs[obs["ServiceDate"] >= from_date]
+    # egy trip szakaszát két jármű is jelentheti (pl. csere) -> az első áthaladás marad
+    obs = (obs.sort_values("FromPassDT")
+              .drop_duplicates(["ServiceDate", "TripID", "FromStopID", "ToStopID"]))
+    dates = sorted(obs["ServiceDate"].unique())
+    with engine.begin() as conn:
+        conn.exec_driver_sql(backend.sql(OBSERVED_DDL))
+        if dates:
+            conn.exec_driver_sql("DELETE FROM dw.Fact_ObservedSegments WHERE ServiceDate = ?",
+                                 [(d,) for d in dates])
+        bulk_load.insert(conn, obs[OBSERVED_COLS], "Fact_ObservedSegments", "dw", report=False)
+    return len(obs), len(dates)
+
+# ---------- források ----------
+def chunks_from_db(engine, days):
+    sql = "SELECT " + ", ".join(_ROW_COLS) + " FROM stg.RealTime_VehiclePositions"
+    params = None
+    if days:
+        sql += " WHERE LastUpdateDT >= ?"
+        params = (datetime.combine(datetime.now().date() - timedelta(days=days), datetime.min.time()),)
+    sql += " ORDER BY LastUpdateDT"
+    return pd.read_sql(sql, engine, params=params, chunksize=READ_CHUNK)
+
+def chunks_from_archive(srcs, archives, deltas):
+    rows, n = [], 0
+    for snap_dt, name, data in vehicle_positions.iter_snapshots(srcs, archives, deltas):
+        rows.extend(futar_decode.vehicle_rows(data, snap_dt, name))
+        n += 1
+        if n % SNAPSHOTS_PER_CHUNK == 0:
+            yield vehicle_positions.positions_frame(rows)
+            rows = []
+    if rows:
+        yield vehicle_positions.positions_frame(rows)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Megfigyelt szakasz menetidők -> dw.Fact_ObservedSegments")
+    ap.add_argument("src", nargs="*", help="bkk_100e_*.json mappa(k); ha nincs forrás: stg.RealTime_VehiclePositions")
+    ap.add_argument("--archive", action="append", default=[], metavar="STREAM")
+    ap.add_argument("--delta", action="append", default=[], metavar="STREAM")
+    ap.add_argument("--days", type=int, default=14, help="DB forrásnál az időablak napokban (0 = minden)")
+    args = ap.parse_args(argv)
+
+    engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+    t0 = time.perf_counter()
+    from_archive = bool(args.src or args.archive or args.delta)
+    chunks = (chunks_from_archive(args.src, args.archive, args.delta) if from_archive
+              else chunks_from_db(engine, args.days))
+
+    proc = TrajectoryProcessor()
+    parts = [proc.feed(chunk) for chunk in chunks]
+    obs = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=OBSERVED_COLS[:-1])
+    obs = add_scheduled(engine, obs)
+    from_date = None if from_archive or not args.days else datetime.now().date() - timedelta(days=args.days)
+    n, days = write(engine, obs, from_date)
+
+    dt = time.perf_counter() - t0
+    matched = int(obs["ScheduledDurSec"].notna().sum())
+    print(f"✅ dw.Fact_ObservedSegments: {n} szakasz ({days} üzemnap, {matched} menetrendi párral) | "
+          f"{proc.rows} jelentés, {proc.passages} áthaladás | {dt:.1f}s ({proc.rows / dt if dt else 0:,.0f} sor/s)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,11 +4,32 @@ import json
 import os
 from datetime import datetime
 
+import adaptive_scheduler
+import metrics
+import backend
+import db_writer
+import snapshot_archive
+import vehicle_delta_store
+import vehicle_positions
+
 # --- KONFIGURÁCIÓ ---
 # Ide mentjük a JSON fájlokat
 DATA_FOLDER = r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data"
 RAW_FOLDER = os.path.join(DATA_FOLDER, "RealTime_JSON")
 
+# "files": egy JSON fájl / poll (régi mód) | "archive": tömör szegmens archívum (snapshot_archive.py)
+# "delta": kulcskép + járművenkénti változások (vehicle_delta_store.py)
+RAW_STORAGE = "files"
+# archive/delta módban a Power BI (Folder connector) ezt az egy fájlt olvassa: mindig a legfrissebb állapot
+LATEST_FILE = os.path.join(RAW_FOLDER, "bkk_100e_latest.json")
+# minden snapshot a DB-be is: stg.RealTime_VehiclePositions + stg.RealTime_FleetState (vehicle_positions.py)
+WRITE_DB = True
+# a DB írás háttér szálon megy (db_writer.py): a poll nem vár a DB-re; ha a DB nem elérhető, ide spoolol
+SPOOL_FILE = os.path.join(DATA_FOLDER, "spool", "collector_100e.jsonl")
+# True: jármű nélkül (üzemszünet) ritkább poll, hibánál exponenciális visszalépés (adaptive_scheduler.py)
+ADAPTIVE_POLL = True
+POLL_SEC = 30
+
 # Létrehozzuk a mappát, ha nem létezik
 if not os.path.exists(RAW_FOLDER):
     os.makedirs(RAW_FOLDER)
@@ -16,40 +37,125 @@ if not os.path.exists(RAW_FOLDER):
 # BKK API URL (A 100E Repülőtéri busz járműveit kérjük le)
 # A 'bkk-web' kulcsot használjuk, ami publikus.
 ROUTE_ID = "BKK_1005" # 100E járat belső azonosítója
-URL = f"https://futar.bkk.hu/api/query/v1/ws/otp/api/where/vehicles-for-route.json?routeId={ROUTE_ID}&related=false&key=bkk-web&appVersion=1.1.abc"
+# FUTAR_BASE_URL környezeti változóval átirányítható (pl. futar_mock_server.py terheléses teszthez)
+BASE = os.environ.get("FUTAR_BASE_URL", "https://futar.bkk.hu/api/query/v1/ws/otp/api/where").rstrip("/")
+URL = f"{BASE}/vehicles-for-route.json?routeId={ROUTE_ID}&related=false&key=bkk-web&appVersion=1.1.abc"
+
+_archive = None
+_writer = None
+_tables_ok = False
+# lépésenkénti idők / sorok / hibák / poll lag -> Data\metrics\collector_100e.prom + .jsonl (metrics.py)
+METRICS = metrics.Metrics("collector_100e")
+
+def write_snapshots(conn, items):
+    """db_writer batch: több poll jármű sorai egy tranzakcióban (a táblák létrehozása az első sikeres írásnál)"""
+    global _tables_ok
+    if not _tables_ok:
+        vehicle_positions.ensure_tables(conn=conn)
+    vehicle_positions.insert_positions(conn, [r for it in items for r in it["rows"]])
+    # csak sikeres írás után: egy visszagörgetett tranzakcióval a DDL is visszagörgetődik
+    _tables_ok = True
+
+def write_db(data, snap_dt, filename):
+    """parse + a sorok a háttér írónak (db_writer); -> sorok"""
+    with METRICS.stage("parse") as st:
+        rows = vehicle_positions.parse_vehicles(data, snap_dt, filename)
+        st.rows = len(rows)
+    if rows:
+        _writer.put({"rows": rows})
+    return len(rows)
+
+def save_snapshot(data, snap_dt):
+    global _archive
+    timestamp = snap_dt.strftime("%Y%m%d_%H%M%S")
+    filename = f"bkk_100e_{timestamp}.json"
+
+    if RAW_STORAGE in ("archive", "delta"):
+        if _archive is None:
+            if RAW_STORAGE == "delta":
+                _archive = vehicle_delta_store.DeltaWriter("bkk_100e_delta")
+            else:
+                _archive = snapshot_archive.ArchiveWriter("bkk_100e")
+        _archive.append(snap_dt, data)
+        # atomikus csere, hogy a Power BI soha ne lásson félig írt fájlt
+        tmp = LATEST_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, LATEST_FILE)
+        return filename
 
-print(f"--- BKK Real-Time Figyelő Indítása (Mentés ide: {RAW_FOLDER}) ---")
-print("Megállításhoz nyomj CTRL+C-t!")
+    filepath = os.path.join(RAW_FOLDER, filename)
+    # Mentés fájlba
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    return filename
 
 def get_realtime_data():
     try:
-        response = requests.get(URL, timeout=10)
+        with METRICS.stage("fetch") as st:
+            response = requests.get(URL, timeout=10)
+            st.bytes = len(response.content)
         if response.status_code == 200:
-            data = response.json()
-            
+            with METRICS.stage("decode"):
+                data = response.json()
+
             # Időbélyeg a fájlnévhez
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"bkk_100e_{timestamp}.json"
-            filepath = os.path.join(RAW_FOLDER, filename)
-            
-            # Mentés fájlba
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4)
-            
+            snap_dt = datetime.now().replace(microsecond=0)
+            with METRICS.stage("file_write"):
+                filename = save_snapshot(data, snap_dt)
+
+            db_info = ""
+            if _writer is not None:
+                try:
+                    n = write_db(data, snap_dt, filename)
+                    db_info = f" | DB: {n} sor ({'ok' if _writer.db_ok else 'spool'})"
+                except Exception as e:
+                    # a nyers mentés megvan, a vehicle_positions.py később pótolja (RawFile alapján)
+                    db_info = f" | DB HIBA: {e}"
+
             # Kiírjuk, hány buszt találtunk éppen
             bus_count = len(data.get('data', {}).get('list', []))
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Mentve: {filename} ({bus_count} db jármű a vonalon)")
+            # a DB hiba nem rontja el a ciklust (a nyers mentés megvan), de a hibák között számít
+            METRICS.flush(ok=True, vehicles=bus_count, file=filename)
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Mentve: {filename} ({bus_count} db jármű a vonalon){db_info}")
+            return data
         else:
+            METRICS.error("fetch", f"HTTP{response.status_code}")
             print(f"HIBA: A szerver {response.status_code} kóddal válaszolt.")
-            
+
     except Exception as e:
         print(f"Hálózati HIBA: {e}")
+    METRICS.flush(ok=False)
+    return None
 
 # --- FŐCIKLUS ---
-# 30 másodpercenként fut
-try:
-    while True:
-        get_realtime_data()
-        time.sleep(30) # Várakozás
-except KeyboardInterrupt:
-    print("\nLeállítás...")
\ No newline at end of file
+# 30 másodpercenként fut (ADAPTIVE_POLL: üzemszünetben ritkábban, hiba után visszalépéssel)
+def main():
+    global _writer
+    sched = adaptive_scheduler.AdaptiveScheduler(f"vehicles {ROUTE_ID}", base_sec=POLL_SEC)
+    if WRITE_DB:
+        # DB írás a poll ciklustól függetlenül; DB leállásnál spool, utána automatikus visszajátszás
+        engine = backend.make_engine(vehicle_positions.SERVER, vehicle_positions.DATABASE, vehicle_positions.DRIVER)
+        _writer = db_writer.WriteBehind("collector_100e", engine, write_snapshots, SPOOL_FILE, metrics=METRICS)
+    print(f"--- BKK Real-Time Figyelő Indítása (Mentés ide: {RAW_FOLDER if RAW_STORAGE == 'files' else snapshot_archive.ARCHIVE_ROOT}) ---")
+    print("Megállításhoz nyomj CTRL+C-t!")
+    try:
+        while True:
+            METRICS.poll_start()
+            data = get_realtime_data()
+            if not ADAPTIVE_POLL:
+                time.sleep(METRICS.next_poll(POLL_SEC)) # Várakozás
+            elif data is None:
+                time.sleep(METRICS.next_poll(sched.on_failure()))
+            else:
+                time.sleep(METRICS.next_poll(sched.on_success(active=adaptive_scheduler.vehicles_active(data))))
+    finally:
+        # a sorban maradt snapshotok kiírása (ha a DB nem elérhető: spool, a következő indulás visszajátssza)
+        if _writer is not None:
+            _writer.close()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nLeállítás...")
@@ -1,44 +1,53 @@
-import os, time, json, urllib, requests
+import os, time, json, requests
 from datetime import datetime
 import pandas as pd
-import sqlalchemy
+
+import backend
+import bulk_load
+import adaptive_scheduler
+import bunching_detector
+import db_writer
+import futar_decode
+import metrics
+import snapshot_archive
+import trip_arrivals
+from arrivals_parse import ARRIVAL_COLS, HEADWAY_COLS, raw_file_name
 
 # ========= ÁLLÍTSD BE =========
 STOP_ID_RT = "BKK_F00950"  # <-- IDE írd be a FUTÁR stopId-t (BKK_Fxxxxx)
 ROUTE_ID_RT = "BKK_1005"   # 100E routeId a FUTÁR-ban
 POLL_SEC = 30
+# True: a következő poll ideje a várható érkezésekből + hibánál exponenciális visszalépés (adaptive_scheduler.py)
+# False: fix POLL_SEC
+ADAPTIVE_POLL = True
 
 DATA_FOLDER = r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data\arrivals"
 RAW_FOLDER = os.path.join(DATA_FOLDER, "RealTime_JSON")
 os.makedirs(RAW_FOLDER, exist_ok=True)
+# "files": egy JSON fájl / poll (régi mód) | "archive": tömör szegmens archívum (snapshot_archive.py)
+RAW_STORAGE = "files"
+# a trip szintű stg.RealTime_TripArrivals mindig frissül (trip_arrivals.py);
+# a pollonkénti nyers stg.RealTime_StopArrivals append kikapcsolható (az SP-k és a backfill skip ezt olvassák)
+WRITE_RAW_ARRIVALS = True
+# a DB írás háttér szálon megy (db_writer.py); ha a DB nem elérhető, ide spoolol, és később visszajátssza
+SPOOL_FILE = os.path.join(DATA_FOLDER, "spool", "ingest_100e.jsonl")
+# bus bunching / gap riasztások a menetrendi headway-hez mérve -> stg.RealTime_HeadwayAlerts (bunching_detector.py)
+DETECT_BUNCHING = True
 
 SERVER = r"(localdb)\mssqllocaldb"
 DATABASE = "BudAirportBI"
 DRIVER = "ODBC Driver 17 for SQL Server"
 
-BASE = "https://futar.bkk.hu/api/query/v1/ws/otp/api/where"
+# FUTAR_BASE_URL: pl. a helyi futar_mock_server.py (http://127.0.0.1:8765/api/query/v1/ws/otp/api/where)
+BASE = os.environ.get("FUTAR_BASE_URL", "https://futar.bkk.hu/api/query/v1/ws/otp/api/where").rstrip("/")
 KEY = "bkk-web"
 APPV = "1.1.abc"
 
-ARR_URL = (
-    f"{BASE}/arrivals-and-departures-for-stop.json"
-    f"?stopId={STOP_ID_RT}&minutesBefore=0&minutesAfter=60&key={KEY}&appVersion={APPV}"
-)
-
 # ========= DB =========
-connection_string = f"DRIVER={{{DRIVER}}};SERVER={SERVER};DATABASE={DATABASE};Trusted_Connection=yes;"
-params = urllib.parse.quote_plus(connection_string)
-engine = sqlalchemy.create_engine(f"mssql+pyodbc:///?odbc_connect={params}", fast_executemany=True)
-
-def epoch_to_dt(x):
-    if x is None:
-        return None
-    x = int(x)
-    if x > 10**12:
-        x //= 1000
-    return datetime.fromtimestamp(x)
-
-def ensure_tables():
+# backend.py: SQL Server LocalDB (alap) vagy beágyazott DuckDB (BUDAIRPORTBI_BACKEND=duckdb)
+engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+
+def ensure_tables(conn=None):
     # Minimál: ha nincs, hozza létre
     ddl1 = """
     IF OBJECT_ID('stg.RealTime_StopArrivals','U') IS NULL
@@ -50,7 +59,8 @@ def ensure_tables():
         ScheduledArrivalDT DATETIME2(0) NULL,
         PredictedArrivalDT DATETIME2(0) NULL,
         DelaySec INT NULL,
-        RawFile NVARCHAR(260) NULL
+        RawFile NVARCHAR(260) NULL,
+        LoadID INT IDENTITY(1,1) NOT NULL    -- betöltési sorszám: az inkrementális agg vízjele (agg_incremental_15m.sql)
     );
     """
     ddl2 = """
@@ -60,136 +70,140 @@ def ensure_tables():
         StopId VARCHAR(50) NULL,
         RouteIdRT VARCHAR(50) NULL,
         HeadwaySec INT NULL,
-        RawFile NVARCHAR(260) NULL
+        RawFile NVARCHAR(260) NULL,
+        LoadID INT IDENTITY(1,1) NOT NULL
     );
     """
+    if conn is None:
+        with engine.begin() as conn:
+            return ensure_tables(conn)
+    conn.exec_driver_sql(backend.sql(ddl1))
+    conn.exec_driver_sql(backend.sql(ddl2))
+    trip_arrivals.ensure_table(conn)
+    bunching_detector.ensure_table(conn)
+
+def arrivals_url(stop_id: str) -> str:
+    return (
+        f"{BASE}/arrivals-and-departures-for-stop.json"
+        f"?stopId={stop_id}&minutesBefore=0&minutesAfter=60&key={KEY}&appVersion={APPV}"
+    )
+
+ARR_URL = arrivals_url(STOP_ID_RT)
+
+def fetch_raw(url=ARR_URL, session=None):
+    # session: közös (keep-alive) requests.Session a több megállós pollerből
+    r = (session or requests).get(url, timeout=20)
+    r.raise_for_status()
+    return r.content
+
+def fetch_json(url=ARR_URL, session=None):
+    return json.loads(fetch_raw(url, session))
+
+_archives = {}
+
+def save_raw(raw_name, snap_dt, data):
+    # data: a nyers válasz bájtjai (így változatlanul, újrakódolás nélkül mentődik) vagy dict
+    if RAW_STORAGE == "archive":
+        stream = snapshot_archive.split_raw_name(raw_name)[0]
+        w = _archives.get(stream) or _archives.setdefault(stream, snapshot_archive.ArchiveWriter(stream))
+        w.append(snap_dt, data)
+        return
+    if isinstance(data, (bytes, bytearray)):
+        with open(os.path.join(RAW_FOLDER, raw_name), "wb") as f:
+            f.write(data)
+        return
+    with open(os.path.join(RAW_FOLDER, raw_name), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def _write(conn, rows, head_rows, alerts=()):
+    if rows:
+        trip_arrivals.upsert(conn, rows)
+    if rows and WRITE_RAW_ARRIVALS:
+        bulk_load.insert(conn, pd.DataFrame(rows, columns=ARRIVAL_COLS), "RealTime_StopArrivals", "stg", report=False)
+    if head_rows:
+        bulk_load.insert(conn, pd.DataFrame(head_rows, columns=HEADWAY_COLS), "RealTime_StopHeadway", "stg", report=False)
+    if alerts:
+        bunching_detector.upsert(conn, alerts)
+
+def write_rows(rows, head_rows):
     with engine.begin() as conn:
-        conn.exec_driver_sql(ddl1)
-        conn.exec_driver_sql(ddl2)
+        _write(conn, rows, head_rows)
 
-def fetch_json():
-    r = requests.get(ARR_URL, timeout=20)
-    r.raise_for_status()
-    return r.json()
+_tables_ok = False
 
-def normalize_route(x: str) -> str:
-    # biztos ami biztos: "BKK_1005" vs "1005"
-    if not x:
-        return ""
-    return x.replace(" ", "")
+def write_snapshots(conn, items):
+    """db_writer batch: több poll sorai egy tranzakcióban (a táblák létrehozása az első sikeres írásnál)"""
+    global _tables_ok
+    if not _tables_ok:
+        ensure_tables(conn)
+    # a riasztások előtti spool elemekben nincs "alerts" kulcs
+    _write(conn, [r for it in items for r in it["rows"]], [h for it in items for h in it["head_rows"]],
+           [a for it in items for a in it.get("alerts", ())])
+    # csak sikeres írás után: egy visszagörgetett tranzakcióval a DDL is visszagörgetődik
+    _tables_ok = True
 
 def main():
-    ensure_tables()
-    print(f"--- Real-time ARRIVALS (Stop={STOP_ID_RT}, Route={ROUTE_ID_RT}, poll={POLL_SEC}s) ---")
-    print(f"Mentés ide: {RAW_FOLDER}")
+    sched = adaptive_scheduler.AdaptiveScheduler(f"{STOP_ID_RT}/{ROUTE_ID_RT}", base_sec=POLL_SEC)
+    # lépésenkénti idők / sorok / hibák / poll lag -> Data\metrics\ingest_100e.prom + .jsonl (metrics.py)
+    m = metrics.Metrics("ingest_100e")
+    # DB írás a poll ciklustól függetlenül; DB leállásnál spool, utána automatikus visszajátszás
+    writer = db_writer.WriteBehind("ingest_100e", engine, write_snapshots, SPOOL_FILE, metrics=m)
+    # a menetrendi alap csak ehhez a megálló + vonal párhoz töltődik be (üzemnaponként egyszer, háttér szálon:
+    # a poll ütem nem függ a DB-től; amíg nincs kész, menetrend nélküli szabály)
+    detector = None
+    if DETECT_BUNCHING:
+        pair = (bunching_detector.strip_rt(STOP_ID_RT), bunching_detector.strip_rt(ROUTE_ID_RT))
+        detector = bunching_detector.Detector(bunching_detector.Baseline(engine, pairs={pair}, background=True))
+    print(f"--- Real-time ARRIVALS (Stop={STOP_ID_RT}, Route={ROUTE_ID_RT}, "
+          f"poll={'adaptív' if ADAPTIVE_POLL else f'{POLL_SEC}s'}) ---")
+    print(f"Mentés ide: {RAW_FOLDER if RAW_STORAGE == 'files' else snapshot_archive.ARCHIVE_ROOT}")
     print("Leállítás: CTRL+C")
 
-    while True:
-        snap_dt = datetime.now().replace(microsecond=0)
-        ts = snap_dt.strftime("%Y%m%d_%H%M%S")
-        raw_name = f"bkk_100e_arr_{ts}.json"
-        raw_path = os.path.join(RAW_FOLDER, raw_name)
-
-        try:
-            data = fetch_json()
-        except Exception as e:
-            print(f"[{snap_dt.strftime('%H:%M:%S')}] HIBA: {e}")
-            time.sleep(POLL_SEC)
-            continue
-
-        with open(raw_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        entry = (data.get("data") or {}).get("entry") or {}
-        refs  = (data.get("data") or {}).get("references") or {}
-        trips_ref = refs.get("trips") or {}
-
-        rows = []
-        pred_times = []
-
-        aad = entry.get("arrivalsAndDepartures")
-        if isinstance(aad, list) and len(aad) > 0:
-            # --- ESET 1: arrivalsAndDepartures (ha valamikor ilyen jön) ---
-            for a in aad:
-                rid = a.get("routeId")
-                if rid != "BKK_1005":
-                    continue
-                
-                sched = epoch_to_dt(a.get("scheduledArrivalTime")) or epoch_to_dt(a.get("scheduledDepartureTime"))
-                pred  = epoch_to_dt(a.get("predictedArrivalTime")) or epoch_to_dt(a.get("predictedDepartureTime"))
-
-                delay = None
-                if sched and pred:
-                    delay = int((pred - sched).total_seconds())
-
-                if pred:
-                    pred_times.append(pred)
-
-                rows.append({
-                    "SnapshotDT": snap_dt,
-                    "StopId": entry.get("stopId"),
-                    "RouteIdRT": rid,
-                    "TripId": a.get("tripId"),
-                    "ScheduledArrivalDT": sched,
-                    "PredictedArrivalDT": pred,
-                    "DelaySec": delay,
-                    "RawFile": raw_name
-                })
-
-        else:
-            # --- ESET 2: stopTimes (NÁLAD EZ JÖN) ---
-            st = entry.get("stopTimes") or []
-            for s in st:
-                trip_id = s.get("tripId")
-                rid = (trips_ref.get(trip_id) or {}).get("routeId")  # <- innen jön, és a fájlban BKK_1005 :contentReference[oaicite:3]{index=3}
-                if rid != "BKK_1005":
-                    continue
-                
-                # stopTimes-ban ezek a mezők vannak: departureTime / predictedDepartureTime (epoch sec)
-                sched = epoch_to_dt(s.get("departureTime"))  # scheduled
-                pred  = epoch_to_dt(s.get("predictedDepartureTime")) or sched  # ha nincs predicted, legyen sched
-
-                delay = None
-                if sched and pred:
-                    delay = int((pred - sched).total_seconds())
-
-                if pred:
-                    pred_times.append(pred)
-
-                rows.append({
-                    "SnapshotDT": snap_dt,
-                    "StopId": entry.get("stopId"),
-                    "RouteIdRT": rid,
-                    "TripId": trip_id,
-                    "ScheduledArrivalDT": sched,
-                    "PredictedArrivalDT": pred,
-                    "DelaySec": delay,
-                    "RawFile": raw_name
-                })
-
-
-                # headway: a következő predikciók közti különbség
-                head_rows = []
-                pred_times = sorted([t for t in pred_times if t is not None])
-                for i in range(1, len(pred_times)):
-                    hw = int((pred_times[i] - pred_times[i-1]).total_seconds())
-                    # szűrés: 1 perc .. 60 perc között
-                    if 60 <= hw <= 3600:
-                        head_rows.append({
-                            "SnapshotDT": snap_dt,
-                            "StopId": STOP_ID_RT,
-                            "RouteIdRT": ROUTE_ID_RT,
-                            "HeadwaySec": hw,
-                            "RawFile": raw_name
-                        })
-
-        if rows:
-            pd.DataFrame(rows).to_sql("RealTime_StopArrivals", con=engine, schema="stg", if_exists="append", index=False)
-        if head_rows:
-            pd.DataFrame(head_rows).to_sql("RealTime_StopHeadway", con=engine, schema="stg", if_exists="append", index=False)
-
-        print(f"[{snap_dt.strftime('%H:%M:%S')}] 100E rows={len(rows)} | headways={len(head_rows)} | file={raw_name}")
-        time.sleep(POLL_SEC)
+    try:
+        while True:
+            lag = m.poll_start()
+            snap_dt = datetime.now().replace(microsecond=0)
+            ts = snap_dt.strftime("%Y%m%d_%H%M%S")
+            raw_name = raw_file_name(ts, STOP_ID_RT, ROUTE_ID_RT)
+
+            try:
+                with m.stage("fetch") as st:
+                    body = fetch_raw()
+                    st.bytes = len(body)
+                with m.stage("decode"):
+                    # típusos dekódolás (futar_decode.py): a nem használt references ágak kimaradnak
+                    payload = futar_decode.decode_arrivals(body)
+            except Exception as e:
+                print(f"[{snap_dt.strftime('%H:%M:%S')}] HIBA: {e}")
+                m.flush(ok=False)
+                time.sleep(m.next_poll(sched.on_failure(type(e).__name__) if ADAPTIVE_POLL else POLL_SEC))
+                continue
+
+            with m.stage("file_write"):
+                save_raw(raw_name, snap_dt, body)
+
+            with m.stage("parse") as st:
+                rows, head_rows = futar_decode.arrival_rows(payload, snap_dt, raw_name, route_id=ROUTE_ID_RT, stop_id=STOP_ID_RT)
+                st.rows = len(rows)
+            alerts = []
+            if detector is not None:
+                with m.stage("detect") as st:
+                    alerts = detector.observe(rows, snap_dt)
+                    st.rows = len(alerts)
+                m.gauge("headway_alerts_open", sum(len(s.open) for s in detector.state.values()))
+            writer.put({"rows": rows, "head_rows": head_rows, "alerts": alerts})
+
+            rec = m.flush(rows=len(rows), headways=len(head_rows), alerts=len(alerts), file=raw_name,
+                          write_queue=writer.q.qsize())
+            print(f"[{snap_dt.strftime('%H:%M:%S')}] 100E rows={len(rows)} | headways={len(head_rows)} | file={raw_name} | "
+                  f"{rec['cycle_sec']:.2f}s (lag {lag:.1f}s) | DB {'ok' if writer.db_ok else 'spool'}")
+            if ADAPTIVE_POLL:
+                time.sleep(m.next_poll(sched.on_success(adaptive_scheduler.next_arrival_sec(rows, snap_dt), active=bool(rows))))
+            else:
+                time.sleep(m.next_poll(POLL_SEC))
+    finally:
+        # a sorban maradt snapshotok kiírása (ha a DB nem elérhető: spool, a következő indulás visszajátssza)
+        writer.close()
 
 if __name__ == "__main__":
     try:
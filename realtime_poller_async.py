@@ -0,0 +1,150 @@
+import os, sys, csv, time, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+
+import adaptive_scheduler
+import db_writer
+import futar_decode
+import metrics
+import realtime_ingest_100e as rt
+
+# ========= ÁLLÍTSD BE =========
+# Figyelt (stopId, routeId) párok. Felülírható egy CSV-vel (fejléc: stopId,routeId),
+# vagy parancssorból: python realtime_poller_async.py BKK_F00950:BKK_1005 BKK_089411:BKK_2005
+TARGETS = [
+    (rt.STOP_ID_RT, rt.ROUTE_ID_RT),
+]
+TARGETS_FILE = os.path.join(rt.DATA_FOLDER, "targets.csv")
+
+POLL_SEC = rt.POLL_SEC   # minden célra külön-külön ennyi a ciklusidő (ADAPTIVE_POLL-nál az alap)
+ADAPTIVE_POLL = rt.ADAPTIVE_POLL
+MAX_INFLIGHT = 16        # egyszerre futó HTTP kérések felső korlátja (= connection pool méret)
+REPORT_SEC = 5           # ennyi időnként állapot sor + .prom frissítés
+# a DB írás háttér szálon megy (db_writer.py, mint a realtime_ingest_100e-ben): snapshotonként put(),
+# a szál batch-ekben ír; ha a DB nem elérhető, ide spoolol, és később visszajátssza
+SPOOL_FILE = os.path.join(rt.DATA_FOLDER, "spool", "poller_async.jsonl")
+
+def load_targets(argv=None):
+    """Célok: parancssor > targets.csv > TARGETS"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv:
+        targets = [tuple(a.split(":", 1)) for a in argv if ":" in a]
+    elif os.path.exists(TARGETS_FILE):
+        with open(TARGETS_FILE, newline="", encoding="utf-8") as f:
+            targets = [(r["stopId"].strip(), r["routeId"].strip()) for r in csv.DictReader(f)
+                       if (r.get("stopId") or "").strip() and (r.get("routeId") or "").strip()]
+    else:
+        targets = list(TARGETS)
+
+    # duplikátumok ki, sorrend marad
+    return list(dict.fromkeys(targets))
+
+def make_session():
+    # egy közös Session: keep-alive kapcsolatok a futar.bkk.hu felé, pool = MAX_INFLIGHT
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_INFLIGHT, pool_block=True)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+class Poller:
+    def __init__(self, targets, writer, m=None):
+        self.targets = targets
+        self.writer = writer
+        self.m = m
+        self.session = make_session()
+        self.sem = asyncio.Semaphore(MAX_INFLIGHT)
+        self.stats = {"polls": 0, "errors": 0, "late": 0}
+
+    async def poll_target(self, stop_id, route_id, first_due):
+        url = rt.arrivals_url(stop_id)
+        sched = adaptive_scheduler.AdaptiveScheduler(f"{stop_id}/{route_id}", base_sec=POLL_SEC)
+        next_due = first_due
+
+        while True:
+            delay = next_due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            snap_dt = datetime.now().replace(microsecond=0)
+            raw_name = rt.raw_file_name(snap_dt.strftime("%Y%m%d_%H%M%S"), stop_id, route_id)
+
+            interval = POLL_SEC
+            try:
+                async with self.sem:
+                    body = await asyncio.to_thread(rt.fetch_raw, url, self.session)
+                payload = futar_decode.decode_arrivals(body)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[{snap_dt.strftime('%H:%M:%S')}] HIBA ({stop_id}/{route_id}): {e}")
+                if ADAPTIVE_POLL:
+                    interval = sched.on_failure(type(e).__name__)
+            else:
+                self.stats["polls"] += 1
+                await asyncio.to_thread(rt.save_raw, raw_name, snap_dt, body)
+                rows, head_rows = futar_decode.arrival_rows(payload, snap_dt, raw_name, route_id=route_id, stop_id=stop_id)
+                # nem blokkol: tele sornál / DB leállásnál a snapshot a spoolba kerül
+                self.writer.put({"rows": rows, "head_rows": head_rows})
+                if ADAPTIVE_POLL:
+                    interval = sched.on_success(adaptive_scheduler.next_arrival_sec(rows, snap_dt), active=bool(rows))
+
+            # fix ütem: a következő időpont a tervezetthez képest, nem a válaszidőhöz képest.
+            # Ha lemaradtunk (pl. lassú API), a kimaradt ütemeket átugorjuk, nem torlódnak fel.
+            next_due += interval
+            now = time.monotonic()
+            if next_due <= now:
+                self.stats["late"] += 1
+                next_due += ((now - next_due) // interval + 1) * interval
+
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(REPORT_SEC)
+            st, w = self.stats, self.writer
+            if self.m is not None:
+                try:
+                    self.m.write_prom()
+                except OSError as e:
+                    print(f"⚠️ metrika írás HIBA: {e}")
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] polls={st['polls']} | errors={st['errors']} | late={st['late']} "
+                  f"| DB {'ok' if w.db_ok else 'spool'} (írva={w.stats['written'] + w.stats['replayed']}, "
+                  f"sorban={w.q.qsize()}, spool={w.stats['spooled']})")
+
+    async def run(self):
+        # a célokat egyenletesen elosztjuk a POLL_SEC ablakban, hogy ne egyszerre induljon mind
+        start = time.monotonic()
+        step = POLL_SEC / max(len(self.targets), 1)
+        tasks = [asyncio.create_task(self.poll_target(stop_id, route_id, start + i * step))
+                 for i, (stop_id, route_id) in enumerate(self.targets)]
+        tasks.append(asyncio.create_task(self.reporter()))
+        await asyncio.gather(*tasks)
+
+def main():
+    targets = load_targets()
+    # a táblák az első sikeres írásnál jönnek létre (rt.write_snapshots), így leállt DB mellett is indul
+    m = metrics.Metrics("poller_async")
+    writer = db_writer.WriteBehind("poller_async", rt.engine, rt.write_snapshots, SPOOL_FILE, metrics=m)
+    print(f"--- Real-time ARRIVALS async ({len(targets)} cél, poll={POLL_SEC}s, max {MAX_INFLIGHT} párhuzamos kérés) ---")
+    for stop_id, route_id in targets[:10]:
+        print(f"   {stop_id} / {route_id}")
+    if len(targets) > 10:
+        print(f"   ... (+{len(targets) - 10})")
+    print(f"Mentés ide: {rt.RAW_FOLDER if rt.RAW_STORAGE == 'files' else rt.snapshot_archive.ARCHIVE_ROOT}")
+    print("Leállítás: CTRL+C")
+
+    loop = asyncio.new_event_loop()
+    # to_thread a loop default executorát használja: HTTP + fájlírás férjen el benne (a DB írás a db_writer szálán)
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=MAX_INFLIGHT + 2))
+    try:
+        loop.run_until_complete(Poller(targets, writer, m).run())
+    finally:
+        loop.close()
+        # a sorban maradt snapshotok kiírása (ha a DB nem elérhető: spool, a következő indulás visszajátssza)
+        writer.close()
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nLeállítás...")
@@ -0,0 +1,197 @@
+import sys, time, argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+import backend
+import bulk_load
+
+# =========================================================
+# dw.Fact_TripSchedule: a menetrend naptári napokra kibontva (üzemnap x trip x megálló, abszolút időkkel)
+# =========================================================
+# A dw.Bridge_ServiceDate csak (ServiceID, DateKey) párokat ad: a "melyik 100E trip volt ütemezve X megállóban
+# D napon" kérdéshez eddig a bridge + stg.GTFS_Trips + stg.GTFS_StopTimes hármas join kellett lekérdezéskor.
+# Itt egyszer, az ETL-ben készül el:
+#   - aktív (üzemnap, service_id) párok: a stg.GTFS_Calendar heti mintája start_date..end_date között
+#     (ha van calendar.txt), erre jön a stg.GTFS_CalendarDates: exception_type 1 = hozzáadás, 2 = törlés
+#   - GTFS idők másodpercben, 24:00 felettiek is (25:10:00 -> 90600 -> az üzemnap utáni nap 01:10)
+#   - abszolút idő = az üzemnap "dél - 12 óra" pillanata + másodperc (GTFS szabály: óraátállításos napon ez
+#     nem éjfél), helyi (TIMEZONE) naiv időként, mint a realtime táblák (epoch_to_dt)
+#   - napokra particionálva: naponként egy vektoros kiválasztás + DELETE / INSERT, egy nap külön is újraépíthető
+# Realtime párosítás egy kulcsos kereséssel (a PK eleje), pl. stg.RealTime_TripArrivals-ra:
+#   ... JOIN dw.Fact_TripSchedule s ON s.ServiceDate = a.ServiceDate
+#        AND s.TripID = <TripId BKK_ nélkül> AND s.StopID = <StopId BKK_ nélkül>
+#
+# python service_schedule.py                                -> a teljes naptár
+# python service_schedule.py --from 2025-12-10 --to 2025-12-20
+
+SERVER = r"(localdb)\mssqllocaldb"
+DATABASE = "BudAirportBI"
+DRIVER = "ODBC Driver 17 for SQL Server"
+
+TIMEZONE = "Europe/Budapest"   # agency_timezone (BKK)
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+SCHEDULE_COLS = ["ServiceDate", "TripID", "StopID", "StopSequence", "RouteID", "ServiceID",
+                 "ArrivalSec", "DepartureSec", "ScheduledArrivalDT", "ScheduledDepartureDT"]
+
+SCHEDULE_DDL = """
+IF OBJECT_ID('dw.Fact_TripSchedule','U') IS NULL
+CREATE TABLE dw.Fact_TripSchedule (
+    ServiceDate DATE NOT NULL,
+    TripID VARCHAR(100) NOT NULL,
+    StopID VARCHAR(50) NOT NULL,
+    StopSequence INT NOT NULL,
+    RouteID VARCHAR(80) NULL,
+    ServiceID VARCHAR(50) NOT NULL,
+    ArrivalSec INT NULL,
+    DepartureSec INT NULL,
+    ScheduledArrivalDT DATETIME2(0) NULL,
+    ScheduledDepartureDT DATETIME2(0) NULL,
+    CONSTRAINT PK_Fact_TripSchedule PRIMARY KEY (ServiceDate, TripID, StopID, StopSequence)
+);
+"""
+
+# ---------- naptár ----------
+def _ymd(s: pd.Series) -> pd.Series:
+    # a stg-ben INT (20251214, stg_types.py)
+    return pd.to_datetime(s.astype("Int64").astype("string"), format="%Y%m%d", errors="coerce")
+
+def active_services(calendar: pd.DataFrame, cal_dates: pd.DataFrame, d_from=None, d_to=None) -> pd.DataFrame:
+    """-> (ServiceDate datetime64, service_id) párok, egyedi; calendar lehet üres (BKK: csak calendar_dates)"""
+    parts = []
+    if calendar is not None and not calendar.empty:
+        cal = calendar.assign(start=_ymd(calendar["start_date"]), end=_ymd(calendar["end_date"]))
+        cal = cal.dropna(subset=["service_id", "start", "end"])
+        cal = cal[cal["end"] >= cal["start"]]
+        # minden service-hez a start..end napok, egy np.repeat-tel
+        n = ((cal["end"] - cal["start"]).dt.days + 1).to_numpy()
+        first = np.cumsum(n) - n
+        day = np.repeat(cal["start"].to_numpy(), n) + (np.arange(n.sum()) - np.repeat(first, n)).astype("timedelta64[D]")
+        mask = cal[WEEKDAYS].fillna(0).astype("int64").to_numpy() == 1
+        wd = pd.DatetimeIndex(day).weekday.to_numpy()
+        on = mask[np.repeat(np.arange(len(cal)), n), wd]
+        parts.append(pd.DataFrame({"ServiceDate": day[on], "service_id": np.repeat(cal["service_id"].to_numpy(), n)[on]}))
+    base = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["ServiceDate", "service_id"])
+    base["ServiceDate"] = pd.to_datetime(base["ServiceDate"])
+
+    cd = cal_dates.assign(ServiceDate=_ymd(cal_dates["date"]), kind=cal_dates["exception_type"])
+    cd = cd.dropna(subset=["service_id", "ServiceDate"])
+    added = cd.loc[cd["kind"] == 1, ["ServiceDate", "service_id"]]
+    removed = cd.loc[cd["kind"] == 2, ["ServiceDate", "service_id"]]
+
+    out = pd.concat([base, added], ignore_index=True).drop_duplicates()
+    if not removed.empty:
+        out = out.merge(removed.drop_duplicates().assign(_rm=True), on=["ServiceDate", "service_id"], how="left")
+        out = out[out["_rm"].isna()].drop(columns="_rm")
+    if d_from is not None:
+        out = out[out["ServiceDate"] >= pd.Timestamp(d_from)]
+    if d_to is not None:
+        out = out[out["ServiceDate"] <= pd.Timestamp(d_to)]
+    return out.sort_values(["ServiceDate", "service_id"]).reset_index(drop=True)
+
+# ---------- trip-ek megállói ----------
+def trip_stop_times(trips: pd.DataFrame, stop_times: pd.DataFrame) -> pd.DataFrame:
+    """stg sorok (típusos stop_times) -> service_id, trip_id, route_id, stop_id, seq, arr/dep mp;
+    service_id, trip_id, seq szerint"""
+    st = stop_times.dropna(subset=["trip_id", "stop_id", "stop_sequence"])
+    st = st.assign(seq=st["stop_sequence"].astype("int64"),
+                   arr=st["arrival_sec"].astype("Int64"), dep=st["departure_sec"].astype("Int64"))
+    # nem időpontos megállónál (üres idő) a másik időt használjuk, ha van
+    st["arr"] = st["arr"].fillna(st["dep"])
+    st["dep"] = st["dep"].fillna(st["arr"])
+    tm = trips.dropna(subset=["trip_id", "service_id"]).drop_duplicates("trip_id")
+    out = st[["trip_id", "stop_id", "seq", "arr", "dep"]].merge(
+        tm[["trip_id", "route_id", "service_id"]], on="trip_id", how="inner")
+    # ugyanaz a (trip, megálló, sorszám) kétszer: az első marad (PK)
+    out = out.drop_duplicates(["trip_id", "stop_id", "seq"])
+    return out.sort_values(["service_id", "trip_id", "seq"], kind="stable").reset_index(drop=True)
+
+def _abs_times(day: pd.Timestamp, sec: pd.Series) -> pd.Series:
+    # dél - 12 óra helyi idő szerint (DST napon 23:00 vagy 01:00 a naptári napon / előtte) + mp, vissza helyi naivra
+    base = (day + pd.Timedelta(hours=12)).tz_localize(TIMEZONE) - pd.Timedelta(hours=12)
+    return (base + pd.to_timedelta(sec.astype("float64"), unit="s")).dt.tz_convert(TIMEZONE).dt.tz_localize(None).dt.floor("s")
+
+def expand_day(day, services, tst, groups) -> pd.DataFrame:
+    """Egy üzemnap: az aznap aktív service-ek trip-jeinek megállói (groups: service_id -> tst sor indexek)"""
+    idx = [groups[s] for s in services if s in groups]
+    if not idx:
+        return pd.DataFrame(columns=SCHEDULE_COLS)
+    rows = tst.take(np.concatenate(idx))
+    day = pd.Timestamp(day)
+    return pd.DataFrame({
+        "ServiceDate": day.date(),
+        "TripID": rows["trip_id"].to_numpy(),
+        "StopID": rows["stop_id"].to_numpy(),
+        "StopSequence": rows["seq"].to_numpy(),
+        "RouteID": rows["route_id"].to_numpy(),
+        "ServiceID": rows["service_id"].to_numpy(),
+        "ArrivalSec": rows["arr"].to_numpy(),
+        "DepartureSec": rows["dep"].to_numpy(),
+        "ScheduledArrivalDT": _abs_times(day, rows["arr"]).to_numpy(),
+        "ScheduledDepartureDT": _abs_times(day, rows["dep"]).to_numpy(),
+    }).astype({"ArrivalSec": "Int64", "DepartureSec": "Int64"})
+
+# ---------- DB ----------
+def _read(conn, sql, dtype=str):
+    return pd.read_sql(backend.sql(sql), conn, dtype=dtype)
+
+def read_calendar(conn):
+    """stg.GTFS_Calendar (ha nincs ilyen tábla: üres frame)"""
+    exists = conn.exec_driver_sql(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = 'stg' AND table_name = 'GTFS_Calendar'").scalar()
+    if not exists:
+        return pd.DataFrame(columns=["service_id"] + WEEKDAYS + ["start_date", "end_date"])
+    return _read(conn, "SELECT service_id, " + ", ".join(WEEKDAYS) + ", start_date, end_date FROM stg.GTFS_Calendar", None)
+
+def build(conn, d_from=None, d_to=None):
+    """dw.Fact_TripSchedule újraépítése a [d_from, d_to] napokra (None = a naptár egésze); -> (sorok, napok)"""
+    conn.exec_driver_sql(backend.sql(SCHEDULE_DDL))
+    pairs = active_services(
+        read_calendar(conn),
+        _read(conn, "SELECT service_id, [date], exception_type FROM stg.GTFS_CalendarDates", None),
+        d_from, d_to)
+    tst = trip_stop_times(
+        _read(conn, "SELECT trip_id, route_id, service_id FROM stg.GTFS_Trips"),
+        _read(conn, "SELECT trip_id, arrival_sec, departure_sec, stop_id, stop_sequence FROM stg.GTFS_StopTimes", None))
+    groups = tst.groupby("service_id", sort=False).indices
+
+    # a teljes kért tartomány törlése előre: a már aktív service nélküli (vagy a naptárból kiesett) napok
+    # régi sorai se maradjanak meg
+    where, params = [], []
+    if d_from is not None:
+        where.append("ServiceDate >= ?")
+        params.append(d_from)
+    if d_to is not None:
+        where.append("ServiceDate <= ?")
+        params.append(d_to)
+    conn.exec_driver_sql("DELETE FROM dw.Fact_TripSchedule" + (" WHERE " + " AND ".join(where) if where else ""),
+                         tuple(params))
+
+    total = days = 0
+    for day, g in pairs.groupby("ServiceDate", sort=True):
+        df = expand_day(day, g["service_id"].tolist(), tst, groups)
+        if df.empty:
+            continue
+        total += bulk_load.insert(conn, df[SCHEDULE_COLS], "Fact_TripSchedule", "dw", report=False)
+        days += 1
+    return total, days
+
+def _date(s):
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Naptári napokra kibontott menetrend -> dw.Fact_TripSchedule")
+    ap.add_argument("--from", dest="d_from", type=_date, default=None, help="első üzemnap (YYYY-MM-DD)")
+    ap.add_argument("--to", dest="d_to", type=_date, default=None, help="utolsó üzemnap (YYYY-MM-DD)")
+    args = ap.parse_args(sys.argv[1:] if argv is None else argv)
+
+    engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        n, days = build(conn, args.d_from, args.d_to)
+    dt = time.perf_counter() - t0
+    print(f"✅ dw.Fact_TripSchedule: {n} sor, {days} üzemnap | {dt:.1f}s ({n / dt if dt else 0:,.0f} sor/s)")
+
+if __name__ == "__main__":
+    main()
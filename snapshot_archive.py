@@ -0,0 +1,391 @@
+import os, re, sys, json, glob, zlib, bisect, struct, threading
+from datetime import datetime
+
+# =========================================================
+# Tömör, hozzáfűzős snapshot archívum a FUTÁR nyers JSON-okhoz
+# =========================================================
+# Egy "stream" (pl. bkk_100e, bkk_100e_arr) szegmens fájlokból áll:
+#   <root>/<stream>/seg_YYYYMMDD_HHMMSS.bin  - rekordok egymás után
+#   <root>/<stream>/seg_YYYYMMDD_HHMMSS.idx  - index: snapshot idő -> byte offset
+#
+# Rekord (.bin):  fejléc <qII> = (ts_ms, flags, hossz) + zlib(tömör JSON)
+# Index   (.idx): <qQII> = (ts_ms, offset, hossz, flags), fix 24 byte / snapshot
+#
+# A .bin önleíró, így az .idx bármikor újraépíthető belőle (rebuild_index).
+# Szegmensváltás: naponta, vagy ha a szegmens eléri a SEGMENT_MAX_BYTES méretet.
+
+ARCHIVE_ROOT = os.path.join(r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data", "archive")
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+ZLIB_LEVEL = 6
+
+REC_HDR = struct.Struct("<qII")
+IDX_ENT = struct.Struct("<qQII")
+
+FLAG_NONE = 0
+
+# bkk_100e_20251211_010637.json / bkk_100e_arr_20251214_213817.json -> (stream, időbélyeg)
+RAW_NAME_RE = re.compile(r"^(?P<stream>.+)_(?P<ts>\d{8}_\d{6})\.json$")
+
+def dt_to_ms(dt: datetime) -> int:
+    return int(round(dt.timestamp() * 1000))
+
+def ms_to_dt(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000)
+
+def encode_payload(payload) -> bytes:
+    if isinstance(payload, (bytes, bytearray)):
+        raw = bytes(payload)
+    else:
+        raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, ZLIB_LEVEL)
+
+def payload_bytes(blob: bytes) -> bytes:
+    # a tömör JSON bájtjai (típusos dekódoláshoz, futar_decode.py)
+    return zlib.decompress(blob)
+
+def decode_payload(blob: bytes):
+    return json.loads(payload_bytes(blob))
+
+def split_raw_name(filename):
+    """'bkk_100e_arr_20251214_213817.json' -> ('bkk_100e_arr', datetime) vagy None"""
+    m = RAW_NAME_RE.match(os.path.basename(filename))
+    if not m:
+        return None
+    return m.group("stream"), datetime.strptime(m.group("ts"), "%Y%m%d_%H%M%S")
+
+
+class Segment:
+    """Egy .bin + .idx pár. Az index fájl kicsi, igény szerint egyben beolvassuk."""
+
+    def __init__(self, bin_path):
+        self.bin_path = bin_path
+        self.idx_path = bin_path[:-4] + ".idx"
+        self._entries = None
+
+    @property
+    def name(self):
+        return os.path.basename(self.bin_path)[:-4]
+
+    def entries(self):
+        if self._entries is None:
+            with open(self.idx_path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % IDX_ENT.size
+            # normál esetben már időrendben van; visszafelé írt migráció után is legyen az
+            self._entries = sorted(IDX_ENT.iter_unpack(data[:usable]), key=lambda e: e[0])
+        return self._entries
+
+    def bounds(self):
+        """(első ts_ms, utolsó ts_ms) - csak az index első és utolsó bejegyzését olvassa"""
+        if self._entries is not None:
+            e = self._entries
+            return (e[0][0], e[-1][0]) if e else None
+        size = os.path.getsize(self.idx_path) if os.path.exists(self.idx_path) else 0
+        size -= size % IDX_ENT.size
+        if size == 0:
+            return None
+        with open(self.idx_path, "rb") as f:
+            first = IDX_ENT.unpack(f.read(IDX_ENT.size))
+            f.seek(size - IDX_ENT.size)
+            last = IDX_ENT.unpack(f.read(IDX_ENT.size))
+        return first[0], last[0]
+
+    def read(self, f, offset, length):
+        f.seek(offset + REC_HDR.size)
+        return f.read(length)
+
+
+def rebuild_index(bin_path):
+    """.idx újraépítése a .bin-ből; a csonka (félbeszakadt) utolsó rekordot levágja"""
+    idx_path = bin_path[:-4] + ".idx"
+    entries = []
+    good_end = 0
+    with open(bin_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos + REC_HDR.size <= size:
+            ts_ms, flags, length = REC_HDR.unpack(f.read(REC_HDR.size))
+            if pos + REC_HDR.size + length > size:
+                break
+            entries.append((ts_ms, pos, length, flags))
+            pos += REC_HDR.size + length
+            f.seek(pos)
+            good_end = pos
+    if good_end < size:
+        with open(bin_path, "r+b") as f:
+            f.truncate(good_end)
+    with open(idx_path, "wb") as f:
+        for e in entries:
+            f.write(IDX_ENT.pack(*e))
+    return len(entries)
+
+
+class ArchiveWriter:
+    """Egy stream írója. Szálbiztos (az async poller több szálból is írhat bele)."""
+
+    def __init__(self, stream, root=None, max_bytes=SEGMENT_MAX_BYTES):
+        self.stream = stream
+        self.folder = os.path.join(root or ARCHIVE_ROOT, stream)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._bin = None
+        self._idx = None
+        self._seg_day = None
+        self._last_ts = None
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _open(self, ts_ms):
+        self.close()
+        dt = ms_to_dt(ts_ms)
+        bin_path = os.path.join(self.folder, f"seg_{dt.strftime('%Y%m%d_%H%M%S')}.bin")
+        if os.path.exists(bin_path):
+            # újraindítás ugyanarra a másodpercre: index rendbetétele, aztán folytatás
+            rebuild_index(bin_path)
+        self._bin = open(bin_path, "ab")
+        self._idx = open(bin_path[:-4] + ".idx", "ab")
+        self._seg_day = dt.date()
+
+    def _resume(self):
+        # induláskor a legutolsó szegmenst folytatjuk, ha még aznapi és van benne hely
+        segs = sorted(glob.glob(os.path.join(self.folder, "seg_*.bin")))
+        if not segs:
+            return
+        bin_path = segs[-1]
+        if rebuild_index(bin_path) == 0:
+            return
+        b = Segment(bin_path).bounds()
+        self._last_ts = b[1]
+        if ms_to_dt(b[1]).date() == datetime.now().date() and os.path.getsize(bin_path) < self.max_bytes:
+            self._bin = open(bin_path, "ab")
+            self._idx = open(bin_path[:-4] + ".idx", "ab")
+            self._seg_day = ms_to_dt(b[1]).date()
+
+    def append(self, ts: datetime, payload, flags=FLAG_NONE):
+        ts_ms = dt_to_ms(ts)
+        blob = encode_payload(payload)
+        with self.lock:
+            if self._bin is None and self._last_ts is None:
+                self._resume()
+            need_new = (
+                self._bin is None
+                or self._seg_day != ms_to_dt(ts_ms).date()
+                or self._bin.tell() >= self.max_bytes
+                # időben visszafelé írás (pl. migráció régi fájlokból): új szegmens
+                or (self._last_ts is not None and ts_ms < self._last_ts)
+            )
+            if need_new:
+                self._open(ts_ms)
+
+            offset = self._bin.tell()
+            self._bin.write(REC_HDR.pack(ts_ms, flags, len(blob)))
+            self._bin.write(blob)
+            self._bin.flush()
+            # előbb az adat, utána az index: összeomláskor legfeljebb indexeletlen farok marad
+            self._idx.write(IDX_ENT.pack(ts_ms, offset, len(blob), flags))
+            self._idx.flush()
+            self._last_ts = ts_ms
+        return len(blob)
+
+    def close(self):
+        for f in (self._bin, self._idx):
+            if f is not None:
+                f.close()
+        self._bin = self._idx = None
+
+
+class ArchiveReader:
+    """Lekérdezések az indexen keresztül: at(T), between(T1, T2) - teljes beolvasás nélkül."""
+
+    def __init__(self, stream, root=None):
+        self.stream = stream
+        self.folder = os.path.join(root or ARCHIVE_ROOT, stream)
+        self.segments = [Segment(p) for p in sorted(glob.glob(os.path.join(self.folder, "seg_*.bin")))]
+        self._bounds = {}
+
+    def _seg_bounds(self, seg):
+        if seg.bin_path not in self._bounds:
+            self._bounds[seg.bin_path] = seg.bounds()
+        return self._bounds[seg.bin_path]
+
+    def _candidates(self, lo_ms, hi_ms):
+        out = []
+        for seg in self.segments:
+            b = self._seg_bounds(seg)
+            if b and b[0] <= hi_ms and b[1] >= lo_ms:
+                out.append(seg)
+        return out
+
+    def between(self, t1: datetime, t2: datetime, decode=True):
+        """(ts, payload) párok t1 <= ts <= t2 között, időrendben"""
+        for ts, flags, payload in self.records(t1, t2, decode=decode):
+            yield ts, payload
+
+    def records(self, t1: datetime, t2: datetime, decode=True):
+        """Mint a between, de a rekord flags mezőjével együtt: (ts, flags, payload)"""
+        lo, hi = dt_to_ms(t1), dt_to_ms(t2)
+        hits = []
+        for seg in self._candidates(lo, hi):
+            ents = seg.entries()
+            keys = [e[0] for e in ents]
+            i = bisect.bisect_left(keys, lo)
+            j = bisect.bisect_right(keys, hi)
+            hits.extend((ents[k], seg) for k in range(i, j))
+        hits.sort(key=lambda h: h[0][0])
+
+        handles = {}
+        try:
+            for (ts_ms, offset, length, flags), seg in hits:
+                f = handles.get(seg.bin_path)
+                if f is None:
+                    f = handles[seg.bin_path] = open(seg.bin_path, "rb")
+                blob = seg.read(f, offset, length)
+                yield ms_to_dt(ts_ms), flags, (decode_payload(blob) if decode else blob)
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def at(self, t: datetime, decode=True):
+        """Az állapot T időpontban: a legutolsó snapshot, amire ts <= T. (ts, payload) vagy None"""
+        best = self.locate(t)
+        if best is None:
+            return None
+        (ts_ms, offset, length, flags), seg = best
+        with open(seg.bin_path, "rb") as f:
+            blob = seg.read(f, offset, length)
+        return ms_to_dt(ts_ms), (decode_payload(blob) if decode else blob)
+
+    def locate(self, t: datetime, flag_mask=None):
+        """Index bejegyzés (ts_ms, offset, hossz, flags) + szegmens a legutolsó ts <= T snapshotra.
+        flag_mask: csak olyan bejegyzés, aminek flags & flag_mask != 0 (pl. kulcskép)"""
+        t_ms = dt_to_ms(t)
+        best = None
+        for seg in self.segments:
+            b = self._seg_bounds(seg)
+            if not b or b[0] > t_ms:
+                continue
+            if best is not None and b[1] <= best[0][0]:
+                continue
+            ents = seg.entries()
+            keys = [e[0] for e in ents]
+            k = bisect.bisect_right(keys, t_ms) - 1
+            while k >= 0 and flag_mask is not None and not (ents[k][3] & flag_mask):
+                k -= 1
+            if k >= 0 and (best is None or ents[k][0] > best[0][0]):
+                best = (ents[k], seg)
+        return best
+
+    def latest(self, decode=True):
+        ends = [b[1] for b in (self._seg_bounds(s) for s in self.segments) if b]
+        return self.at(ms_to_dt(max(ends)), decode=decode) if ends else None
+
+    def count(self):
+        return sum(len(seg.entries()) for seg in self.segments)
+
+
+# =========================================================
+# Migráció: egy-fájl-per-poll JSON-ok -> archívum
+# =========================================================
+def migrate_folder(src_folder, root=None, delete=False):
+    """A src_folder összes bkk_*_YYYYMMDD_HHMMSS.json fájlját stream-enként időrendben archiválja"""
+    groups = {}
+    for path in glob.glob(os.path.join(src_folder, "*.json")):
+        parsed = split_raw_name(path)
+        if parsed is None:
+            continue
+        stream, ts = parsed
+        groups.setdefault(stream, []).append((ts, path))
+
+    for stream, items in sorted(groups.items()):
+        items.sort()
+        reader = ArchiveReader(stream, root)
+        have = set()
+        if reader.segments:
+            for seg in reader.segments:
+                have.update(e[0] for e in seg.entries())
+
+        writer = ArchiveWriter(stream, root)
+        n = skipped = bad = 0
+        raw_bytes = packed_bytes = 0
+        try:
+            for ts, path in items:
+                if dt_to_ms(ts) in have:
+                    skipped += 1
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        raw = f.read()
+                    data = json.loads(raw)
+                except (OSError, ValueError) as e:
+                    bad += 1
+                    print(f"   ⚠️ Hibás fájl, kihagyva: {os.path.basename(path)} ({e})")
+                    continue
+                raw_bytes += len(raw)
+                packed_bytes += writer.append(ts, data)
+                n += 1
+        finally:
+            writer.close()
+
+        ratio = (raw_bytes / packed_bytes) if packed_bytes else 0
+        print(f"→ {stream}: {n} snapshot archiválva, {skipped} már bent volt, {bad} hibás "
+              f"({raw_bytes/1e6:.1f} MB -> {packed_bytes/1e6:.1f} MB, {ratio:.0f}x)")
+
+        if delete and n:
+            # csak azt töröljük, ami visszaolvasva is megvan
+            stored = set()
+            for seg in ArchiveReader(stream, root).segments:
+                stored.update(e[0] for e in seg.entries())
+            removed = 0
+            for ts, path in items:
+                if dt_to_ms(ts) in stored:
+                    os.remove(path)
+                    removed += 1
+            print(f"   🗑️ {removed} régi JSON fájl törölve.")
+
+def main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="FUTÁR snapshot archívum (migráció / lekérdezés)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    m = sub.add_parser("migrate", help="bkk_100e_*.json / bkk_100e_arr_*.json fájlok archívumba")
+    m.add_argument("src", nargs="+", help="forrás mappa(k), pl. Data/RealTime_JSON Data/arrivals/RealTime_JSON")
+    m.add_argument("--root", default=None)
+    m.add_argument("--delete", action="store_true", help="sikeres archiválás után a JSON fájlok törlése")
+
+    q = sub.add_parser("at", help="állapot egy időpontban")
+    q.add_argument("stream")
+    q.add_argument("time", help="YYYY-mm-ddTHH:MM:SS")
+    q.add_argument("--root", default=None)
+
+    r = sub.add_parser("range", help="snapshotok két időpont között")
+    r.add_argument("stream")
+    r.add_argument("t1")
+    r.add_argument("t2")
+    r.add_argument("--root", default=None)
+
+    x = sub.add_parser("reindex", help=".idx fájlok újraépítése a .bin-ekből")
+    x.add_argument("stream")
+    x.add_argument("--root", default=None)
+
+    args = ap.parse_args(argv)
+
+    if args.cmd == "migrate":
+        for src in args.src:
+            print(f"--- Migráció: {src} -> {args.root or ARCHIVE_ROOT} ---")
+            migrate_folder(src, args.root, delete=args.delete)
+    elif args.cmd == "at":
+        hit = ArchiveReader(args.stream, args.root).at(datetime.fromisoformat(args.time))
+        if hit is None:
+            print("Nincs snapshot ennél korábban.")
+        else:
+            json.dump(hit[1], sys.stdout, ensure_ascii=False, indent=2)
+            print(f"\n# ts={hit[0]}")
+    elif args.cmd == "range":
+        reader = ArchiveReader(args.stream, args.root)
+        for ts, blob in reader.between(datetime.fromisoformat(args.t1), datetime.fromisoformat(args.t2), decode=False):
+            print(f"{ts}  {len(blob)} byte")
+    elif args.cmd == "reindex":
+        for seg in ArchiveReader(args.stream, args.root).segments:
+            print(f"{seg.name}: {rebuild_index(seg.bin_path)} rekord")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+import backend
+import bulk_load
+from gtfs_segments import time_to_sec
+
+# =========================================================
+# Típusos staging: a forrás stringek egyszer, a pandas olvasásnál konvertálva (+ stg.Load_Rejects)
+# =========================================================
+# Eddig minden betöltő dtype=str-rel olvasott, a stg táblák VARCHAR / NVARCHAR oszlopokat kaptak
+# (OpenFlights_Routes.SourceID, GTFS_StopTimes.stop_sequence / idők, CalendarDates.date ...), és a dw
+# INSERT-ek minden futáskor minden soron TRY_CAST / PARSENAME-mel bontották őket, joinokban és window
+# ORDER BY-okban is. Itt a konverzió egyszer, vektorosan történik, betöltés előtt:
+#   int       - csak egész szám string (TRY_CAST(x AS INT) szabálya) -> INT
+#   float     - szám -> FLOAT
+#   gtfs_time - 'HH:MM:SS' (24:00 felett is) -> másodperc INT (az oszlop új néven: arrival_time -> arrival_sec)
+#   yyyymmdd  - érvényes naptári nap -> INT (20251214, a dw.Dim_Date.DateKey formája)
+# Hibás érték: kötelező oszlopnál a sor nem töltődik be, egyébként NULL lesz; mindkettő a
+# stg.Load_Rejects-be kerül (tábla, forrás, oszlop, nyers érték, a teljes nyers sor, ok, Action = ROW / NULL).
+# Kötelező oszlop üres értéke is ROW reject (a dw oldalon úgyis kiesett volna).
+# A stg táblák így natív INT / másodperc oszlopokat kapnak, a dw SQL sima típusos join és rendezés.
+
+# tábla -> oszlop -> (típus, kötelező)
+TYPES = {
+    "stg.OpenFlights_Airports": {"AirportID": ("int", True), "Lat": ("float", False), "Lon": ("float", False)},
+    "stg.OpenFlights_Routes":   {"AirlineID": ("int", False), "SourceID": ("int", False), "DestID": ("int", False)},
+    "stg.OpenFlights_Airlines": {"AirlineID": ("int", True)},
+    "stg.GTFS_Stops":           {"stop_lat": ("float", False), "stop_lon": ("float", False)},
+    "stg.GTFS_StopTimes":       {"stop_sequence": ("int", True),
+                                 "arrival_time": ("gtfs_time", False), "departure_time": ("gtfs_time", False)},
+    "stg.GTFS_CalendarDates":   {"date": ("yyyymmdd", True), "exception_type": ("int", True)},
+    "stg.GTFS_Calendar":        {**{d: ("int", False) for d in
+                                    ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]},
+                                 "start_date": ("yyyymmdd", True), "end_date": ("yyyymmdd", True)},
+}
+# a konvertált oszlop neve a stg táblában (ha más, mint a forrásban)
+RENAME = {"arrival_time": "arrival_sec", "departure_time": "departure_sec"}
+
+REJECT_COLS = ["TableName", "SourceFile", "ColumnName", "RawValue", "RawRow", "Reason", "Action"]
+
+REJECTS_DDL = """
+IF OBJECT_ID('stg.Load_Rejects','U') IS NULL
+CREATE TABLE stg.Load_Rejects (
+    TableName VARCHAR(100) NOT NULL,
+    SourceFile NVARCHAR(260) NULL,
+    ColumnName VARCHAR(100) NOT NULL,
+    RawValue NVARCHAR(255) NULL,
+    RawRow NVARCHAR(1000) NULL,
+    Reason VARCHAR(50) NOT NULL,
+    Action VARCHAR(4) NOT NULL
+);
+"""
+
+_INT_RE = r"^\s*[+-]?\d+\s*$"
+
+# ---------- konverziók: nyers string Series -> típusos Series (hibás / üres -> NA) ----------
+def to_int(s: pd.Series) -> pd.Series:
+    ok = s.str.match(_INT_RE, na=False)
+    return pd.to_numeric(s.where(ok), errors="coerce").astype("Int64")
+
+def to_float(s: pd.Series) -> pd.Series:
+    return pd.to_numeric(s, errors="coerce").astype("float64")
+
+def to_yyyymmdd(s: pd.Series) -> pd.Series:
+    d = pd.to_datetime(s.str.strip(), format="%Y%m%d", errors="coerce")
+    return (d.dt.year * 10000 + d.dt.month * 100 + d.dt.day).astype("Int64")
+
+CONVERT = {"int": to_int, "float": to_float, "gtfs_time": time_to_sec, "yyyymmdd": to_yyyymmdd}
+
+def stg_column(col):
+    return RENAME.get(col, col)
+
+def conform(df: pd.DataFrame, table: str, source=None):
+    """nyers (str) frame -> (típusos frame a stg táblához, reject sorok REJECT_COLS szerint)"""
+    spec = TYPES.get(table)
+    if not spec or df.empty:
+        return df.rename(columns=RENAME), pd.DataFrame(columns=REJECT_COLS)
+    raw = df
+    out = df.copy()
+    drop_row = np.zeros(len(df), dtype=bool)
+    bad = []    # (oszlop, maszk, ok)
+    for col, (kind, required) in spec.items():
+        if col not in raw.columns:
+            continue
+        val = CONVERT[kind](raw[col])
+        failed = (raw[col].notna() & val.isna()).to_numpy()
+        if failed.any():
+            bad.append((col, failed, f"nem {kind}"))
+        if required:
+            empty = raw[col].isna().to_numpy()
+            if empty.any():
+                bad.append((col, empty, "üres (kötelező)"))
+            drop_row |= failed | empty
+        out[col] = val
+
+    rejects = pd.DataFrame(columns=REJECT_COLS)
+    if bad:
+        parts = []
+        for col, mask, reason in bad:
+            rows = raw[mask]
+            parts.append(pd.DataFrame({
+                "TableName": table,
+                "SourceFile": source,
+                "ColumnName": col,
+                "RawValue": rows[col].astype("string").str.slice(0, 255).to_numpy(),
+                "RawRow": rows.astype("string").fillna("").agg(",".join, axis=1).str.slice(0, 1000).to_numpy(),
+                "Reason": reason,
+                "Action": np.where(drop_row[mask], "ROW", "NULL"),
+            }))
+        rejects = pd.concat(parts, ignore_index=True)[REJECT_COLS]
+    if drop_row.any():
+        out = out[~drop_row]
+    return out.rename(columns=RENAME), rejects
+
+# ---------- DB ----------
+def ensure_table(conn):
+    conn.exec_driver_sql(backend.sql(REJECTS_DDL))
+
+def clear_rejects(conn, table):
+    conn.exec_driver_sql("DELETE FROM stg.Load_Rejects WHERE TableName = ?", (table,))
+
+def write_rejects(target, rejects: pd.DataFrame):
+    """reject sorok -> stg.Load_Rejects (target: engine vagy a hívó kapcsolata); -> sorok"""
+    if rejects is None or rejects.empty:
+        return 0
+    return bulk_load.insert(target, rejects[REJECT_COLS], "Load_Rejects", "stg", report=False)
+
+def untyped(conn, table):
+    """régi (string oszlopos) stg tábla? -> True, ha egy típusos oszlopa hiányzik vagy szöveg típusú"""
+    schema, name = table.split(".")
+    types = {r[0].lower(): str(r[1]).lower() for r in conn.exec_driver_sql(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_schema = ? AND table_name = ?",
+        (schema, name))}
+    if not types:
+        return False        # nincs ilyen tábla: a setup létrehozza
+    # hiányzó oszlop (pl. arrival_sec) is régi sémát jelent
+    return any(types.get(stg_column(c).lower(), "varchar") in ("varchar", "nvarchar", "char", "nchar", "text")
+               for c in TYPES[table])
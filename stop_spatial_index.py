@@ -0,0 +1,268 @@
+import os, sys, time, argparse
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+import backend
+
+# =========================================================
+# GTFS megállók térbeli rács indexe + 100E útvonal-előrehaladás
+# =========================================================
+# StopGrid:     a megállók helyi méteres (equirectangular) koordinátákban, CELL_M méretű rácscellákba
+#               rendezve (cella kulcs szerint rendezett tömbök). nearest(lat, lon) egy hívásban egy
+#               egész batch-re: a 3x3 szomszéd cella jelöltjei közül a legközelebbi; ha az sincs
+#               CELL_M-en belül, annál a pár pontnál teljes keresés.
+# RoutePattern: egy irány megállósora (a leggyakoribb stop_id sorrend a stg.GTFS_StopTimes-ban);
+#               locate() minden pontot a legközelebbi szakaszra vetít: melyik két megálló között,
+#               a szakasz hány %-ánál (a térkép "distance %"-a), és a teljes útvonal hányadánál jár.
+#
+# A FUTÁR azonosítók "BKK_" prefixesek (BKK_F00950), a GTFS-ben prefix nélkül (F00950).
+#
+# python stop_spatial_index.py                 -> stg.RealTime_VehiclePositions annotálása, sebesség kiírása
+# python stop_spatial_index.py --out pos.csv   -> az annotált sorok CSV-be
+
+DATA_FOLDER = r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data"
+GTFS_STOPS = os.path.join(DATA_FOLDER, "stops.txt")
+
+SERVER = r"(localdb)\mssqllocaldb"
+DATABASE = "BudAirportBI"
+DRIVER = "ODBC Driver 17 for SQL Server"
+
+ROUTE_ID = "1005"          # 100E a GTFS-ben (FUTÁR: BKK_1005)
+RT_PREFIX = "BKK_"
+CELL_M = 250.0
+EARTH_R = 6_371_000.0
+LOCATE_CHUNK = 200_000     # RoutePattern.locate ennyi pontot vetít egyszerre (pont x szakasz mátrix)
+
+def strip_rt(stop_id):
+    return stop_id[len(RT_PREFIX):] if isinstance(stop_id, str) and stop_id.startswith(RT_PREFIX) else stop_id
+
+class _Projection:
+    """lat/lon -> helyi méter (x kelet, y észak); városi léptékben bőven elég pontos"""
+    def __init__(self, lat0, lon0):
+        self.lat0, self.lon0 = lat0, lon0
+        self.kx = np.radians(1.0) * EARTH_R * np.cos(np.radians(lat0))
+        self.ky = np.radians(1.0) * EARTH_R
+
+    def __call__(self, lat, lon):
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        return (lon - self.lon0) * self.kx, (lat - self.lat0) * self.ky
+
+
+class StopGrid:
+    def __init__(self, stop_ids, lat, lon, cell_m=CELL_M):
+        ok = ~(np.isnan(np.asarray(lat, dtype=np.float64)) | np.isnan(np.asarray(lon, dtype=np.float64)))
+        self.stop_ids = np.asarray(stop_ids, dtype=object)[ok]
+        lat = np.asarray(lat, dtype=np.float64)[ok]
+        lon = np.asarray(lon, dtype=np.float64)[ok]
+        self.cell_m = cell_m
+        self.proj = _Projection(float(lat.mean()), float(lon.mean()))
+        x, y = self.proj(lat, lon)
+        self.x0, self.y0 = x.min() - cell_m, y.min() - cell_m
+        cx, cy = self._cells(x, y)
+        self.nx = int(cx.max()) + 2
+
+        # cella kulcs szerint rendezve: egy cella megállói egy összefüggő szelet (CSR)
+        key = cy * self.nx + cx
+        order = np.argsort(key, kind="stable")
+        self.x, self.y, self.stop_ids = x[order], y[order], self.stop_ids[order]
+        key = key[order]
+        self.keys, starts, counts = np.unique(key, return_index=True, return_counts=True)
+        # kitöltött (cellák x max/cella) jelölt mátrix, -1 = üres hely
+        width = int(counts.max())
+        self.slots = np.full((len(self.keys), width), -1, dtype=np.int64)
+        col = np.arange(len(key)) - np.repeat(starts, counts)
+        self.slots[np.repeat(np.arange(len(self.keys)), counts), col] = np.arange(len(key))
+
+    def _cells(self, x, y):
+        return (np.floor((x - self.x0) / self.cell_m).astype(np.int64),
+                np.floor((y - self.y0) / self.cell_m).astype(np.int64))
+
+    @classmethod
+    def from_stops_txt(cls, path=GTFS_STOPS, **kw):
+        df = pd.read_csv(path, usecols=["stop_id", "stop_lat", "stop_lon"], dtype={"stop_id": str}, encoding="utf-8")
+        return cls(df["stop_id"].values, df["stop_lat"].values, df["stop_lon"].values, **kw)
+
+    @classmethod
+    def from_db(cls, engine, **kw):
+        df = pd.read_sql("SELECT stop_id, stop_lat, stop_lon FROM stg.GTFS_Stops", engine)
+        return cls(df["stop_id"].values, df["stop_lat"].values, df["stop_lon"].values, **kw)
+
+    def nearest(self, lat, lon):
+        """-> (megálló index tömb, távolság méterben); érvénytelen koordinátánál -1 / NaN"""
+        x, y = self.proj(lat, lon)
+        n = len(x)
+        best = np.full(n, -1, dtype=np.int64)
+        best_d2 = np.full(n, np.inf)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        cx, cy = self._cells(np.where(valid, x, self.x0), np.where(valid, y, self.y0))
+
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                key = (cy + dy) * self.nx + (cx + dx)
+                pos = np.minimum(np.searchsorted(self.keys, key), len(self.keys) - 1)
+                hit = valid & (self.keys[pos] == key)
+                if not hit.any():
+                    continue
+                rows = np.flatnonzero(hit)
+                cand = self.slots[pos[rows]]                          # (hit, width)
+                safe = np.where(cand >= 0, cand, 0)
+                d2 = (self.x[safe] - x[rows, None]) ** 2 + (self.y[safe] - y[rows, None]) ** 2
+                d2[cand < 0] = np.inf
+                j = d2.argmin(axis=1)
+                dmin = d2[np.arange(len(rows)), j]
+                better = dmin < best_d2[rows]
+                best[rows[better]] = cand[better, j[better]]
+                best_d2[rows[better]] = dmin[better]
+
+        # a 3x3 környezet csak CELL_M távolságig garantál pontos eredményt
+        far = np.flatnonzero(valid & (best_d2 > self.cell_m ** 2))
+        for i in range(0, len(far), 4096):
+            rows = far[i:i + 4096]
+            d2 = (self.x[None, :] - x[rows, None]) ** 2 + (self.y[None, :] - y[rows, None]) ** 2
+            j = d2.argmin(axis=1)
+            best[rows] = j
+            best_d2[rows] = d2[np.arange(len(rows)), j]
+
+        dist = np.sqrt(best_d2)
+        dist[best < 0] = np.nan
+        return best, dist
+
+    def nearest_ids(self, lat, lon):
+        idx, dist = self.nearest(lat, lon)
+        ids = np.where(idx >= 0, self.stop_ids[np.maximum(idx, 0)], None)
+        return ids, dist
+
+
+class RoutePattern:
+    def __init__(self, stop_ids, lat, lon, proj=None):
+        self.stop_ids = np.asarray(stop_ids, dtype=object)
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        self.proj = proj or _Projection(float(lat.mean()), float(lon.mean()))
+        x, y = self.proj(lat, lon)
+        self.ax, self.ay = x[:-1], y[:-1]
+        self.vx, self.vy = np.diff(x), np.diff(y)
+        self.seg_len = np.hypot(self.vx, self.vy)
+        self.cum = np.concatenate([[0.0], np.cumsum(self.seg_len)])
+        self.length = float(self.cum[-1])
+
+    def locate(self, lat, lon):
+        """-> dict tömbökkel: seg (a szakasz from-megállójának indexe), frac (0..1 a szakaszon),
+        progress (0..1 a teljes útvonalon), off_m (távolság az útvonaltól)"""
+        x, y = self.proj(lat, lon)
+        n = len(x)
+        seg = np.zeros(n, dtype=np.int64)
+        frac = np.zeros(n)
+        off = np.full(n, np.nan)
+        L2 = np.maximum(self.seg_len ** 2, 1e-9)
+        for i in range(0, n, LOCATE_CHUNK):
+            px, py = x[i:i + LOCATE_CHUNK, None], y[i:i + LOCATE_CHUNK, None]
+            t = np.clip(((px - self.ax) * self.vx + (py - self.ay) * self.vy) / L2, 0.0, 1.0)
+            d2 = (self.ax + t * self.vx - px) ** 2 + (self.ay + t * self.vy - py) ** 2
+            j = np.nanargmin(np.where(np.isnan(d2), np.inf, d2), axis=1)
+            r = np.arange(len(j))
+            seg[i:i + LOCATE_CHUNK] = j
+            frac[i:i + LOCATE_CHUNK] = t[r, j]
+            off[i:i + LOCATE_CHUNK] = np.sqrt(d2[r, j])
+        progress = (self.cum[seg] + frac * self.seg_len[seg]) / self.length if self.length else np.zeros(n)
+        return {"seg": seg, "frac": frac, "progress": progress, "off_m": off}
+
+
+def patterns_from_db(engine, route_id=ROUTE_ID):
+    """{direction_id: RoutePattern} a leggyakoribb megállósorból irányonként, + trip_id -> direction_id"""
+    st = pd.read_sql(
+        "SELECT st.trip_id, st.stop_id, st.stop_sequence, t.direction_id, s.stop_lat, s.stop_lon "
+        "FROM stg.GTFS_StopTimes st "
+        "JOIN stg.GTFS_Trips t ON t.trip_id = st.trip_id "
+        "JOIN stg.GTFS_Stops s ON s.stop_id = st.stop_id "
+        "WHERE t.route_id = ?", engine, params=(route_id,))
+    st["seq"] = pd.to_numeric(st["stop_sequence"], errors="coerce")
+    st = st.dropna(subset=["seq"]).sort_values(["trip_id", "seq"], kind="stable")
+    trip_dir = st.drop_duplicates("trip_id").set_index("trip_id")["direction_id"].to_dict()
+
+    coords = st.drop_duplicates("stop_id").set_index("stop_id")[["stop_lat", "stop_lon"]]
+    seqs = st.groupby("trip_id", sort=False)["stop_id"].agg(tuple)
+    patterns = {}
+    for direction, trips in st.drop_duplicates("trip_id").groupby("direction_id")["trip_id"]:
+        stops = Counter(seqs.loc[trips.values]).most_common(1)[0][0]
+        c = coords.loc[list(stops)]
+        patterns[direction] = RoutePattern(stops, c["stop_lat"].values, c["stop_lon"].values)
+    return patterns, trip_dir
+
+def annotate(df, grid, patterns=None, trip_dir=None):
+    """Jármű pozíciók (Lat, Lon, [TripId, StopId]) -> új oszlopok:
+    NearestStopId, NearestStopDistM; ha van útvonal: Direction, SegFromStopId, SegToStopId,
+    SegPercent (a szakasz hány %-ánál), RouteProgress (0..1), OffRouteM"""
+    out = df.copy()
+    lat, lon = out["Lat"].to_numpy(dtype=np.float64), out["Lon"].to_numpy(dtype=np.float64)
+    ids, dist = grid.nearest_ids(lat, lon)
+    out["NearestStopId"] = [RT_PREFIX + s if s is not None else None for s in ids]
+    out["NearestStopDistM"] = dist
+    if not patterns:
+        return out
+
+    # irány: 1) a trip_id a menetrendből, 2) melyik irány megállósorában van a következő megálló,
+    #        3) amelyikhez a pont közelebb van
+    dirs = list(patterns)
+    located = {d: patterns[d].locate(lat, lon) for d in dirs}
+    off = np.vstack([located[d]["off_m"] for d in dirs])
+    choice = off.argmin(axis=0)
+    if "StopId" in out:
+        nxt = out["StopId"].map(strip_rt).to_numpy(dtype=object)
+        for k, d in enumerate(dirs):
+            choice[np.isin(nxt, patterns[d].stop_ids)] = k
+    if trip_dir and "TripId" in out:
+        known = out["TripId"].map(strip_rt).map(trip_dir).to_numpy(dtype=object)
+        for k, d in enumerate(dirs):
+            choice[known == d] = k
+
+    n = len(out)
+    seg = np.zeros(n, dtype=np.int64)
+    cols = {"frac": np.zeros(n), "progress": np.zeros(n), "off_m": np.zeros(n)}
+    from_id = np.empty(n, dtype=object)
+    to_id = np.empty(n, dtype=object)
+    for k, d in enumerate(dirs):
+        m = choice == k
+        loc = located[d]
+        seg[m] = loc["seg"][m]
+        for c in cols:
+            cols[c][m] = loc[c][m]
+        from_id[m] = patterns[d].stop_ids[seg[m]]
+        to_id[m] = patterns[d].stop_ids[seg[m] + 1]
+
+    valid = ~(np.isnan(lat) | np.isnan(lon))
+    out["Direction"] = np.where(valid, np.array(dirs, dtype=object)[choice], None)
+    out["SegFromStopId"] = np.where(valid, [RT_PREFIX + s for s in from_id], None)
+    out["SegToStopId"] = np.where(valid, [RT_PREFIX + s for s in to_id], None)
+    out["SegPercent"] = np.where(valid, np.round(cols["frac"] * 100, 1), np.nan)
+    out["RouteProgress"] = np.where(valid, cols["progress"], np.nan)
+    out["OffRouteM"] = np.where(valid, cols["off_m"], np.nan)
+    return out
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Megálló rács index + 100E előrehaladás a jármű pozíciókra")
+    ap.add_argument("--route", default=ROUTE_ID, help="GTFS route_id (alap: 1005 = 100E)")
+    ap.add_argument("--out", help="annotált sorok CSV-be")
+    args = ap.parse_args(argv)
+
+    engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+    t0 = time.perf_counter()
+    grid = StopGrid.from_db(engine)
+    patterns, trip_dir = patterns_from_db(engine, args.route)
+    print(f"→ index: {len(grid.stop_ids)} megálló, {len(grid.keys)} cella | "
+          f"{len(patterns)} irány ({', '.join(f'{d}: {len(p.stop_ids)} megálló' for d, p in patterns.items())}) "
+          f"| {time.perf_counter() - t0:.2f}s")
+
+    pos = pd.read_sql("SELECT * FROM stg.RealTime_VehiclePositions", engine)
+    t0 = time.perf_counter()
+    out = annotate(pos, grid, patterns, trip_dir)
+    dt = time.perf_counter() - t0
+    print(f"✅ {len(out)} pozíció annotálva | {len(out) / dt if dt else 0:,.0f} pozíció/s")
+    if args.out:
+        out.to_csv(args.out, index=False, encoding="utf-8")
+        print(f"   -> {args.out}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,167 @@
+import io, os, sys, csv, json, zlib, time, argparse
+import pandas as pd
+
+# =========================================================
+# trip_id -> bájt tartomány index a GTFS stop_times.txt-hez
+# =========================================================
+# Egyszer végigolvassuk a fájlt (csak a trip_id oszlopot nézzük), és eltesszük, melyik trip
+# mely bájt tartomány(ok)ban van. Az index a feed mellé kerül: stop_times.txt.tidx
+# (zlib-bel tömörített JSON, a fájl méretével és mtime-jával). Ha a stop_times.txt változik,
+# a következő open() automatikusan újraépíti.
+#
+# Bármilyen trip részhalmaz (egy vonal, több vonal, egy üzemnap trip-jei) így seek + összefüggő
+# olvasás, a teljes fájl parse-olása nélkül:
+#   idx = StopTimesIndex.open(path)
+#   for chunk in idx.iter_trips(trip_set, usecols=[...]): ...
+
+INDEX_SUFFIX = ".tidx"
+INDEX_VERSION = 1
+READ_GAP = 256 * 1024          # ennél közelebbi tartományokat egy olvasással vesszük (a köztes sorokat szűrjük)
+CHUNK_BYTES = 32 * 1024 * 1024 # iter_trips ennyi bájtonként ad vissza egy DataFrame-et
+BUILD_BLOCK = 8 * 1024 * 1024
+
+def _trip_col(header: bytes):
+    names = next(csv.reader([header.decode("utf-8-sig").strip()]))
+    return [n.strip() for n in names].index("trip_id")
+
+def build(path):
+    """Index építése: {"trips": {trip_id: [[offset, hossz], ...]}, ...}; a tartományok fájlsorrendben"""
+    st = os.stat(path)
+    trips = {}
+    with open(path, "rb") as f:
+        header = f.readline()
+        col = _trip_col(header)
+        offset = len(header)
+        cur_trip, cur_start = None, offset
+        rest = b""
+        while True:
+            block = f.read(BUILD_BLOCK)
+            if not block and not rest:
+                break
+            data = rest + block
+            if block:
+                cut = data.rfind(b"\n") + 1
+                if cut == 0:
+                    rest = data
+                    continue
+                data, rest = data[:cut], data[cut:]
+            else:
+                rest = b""
+            for line in data.splitlines(keepends=True):
+                if line.strip():
+                    if b'"' in line:
+                        trip = next(csv.reader([line.decode("utf-8", "replace")]))[col]
+                    elif col == 0:
+                        trip = line.split(b",", 1)[0].decode("utf-8", "replace")
+                    else:
+                        trip = line.split(b",")[col].decode("utf-8", "replace")
+                    trip = trip.strip()
+                    if trip != cur_trip:
+                        if cur_trip is not None:
+                            trips.setdefault(cur_trip, []).append([cur_start, offset - cur_start])
+                        cur_trip, cur_start = trip, offset
+                offset += len(line)
+        if cur_trip is not None:
+            trips.setdefault(cur_trip, []).append([cur_start, offset - cur_start])
+
+    return {
+        "version": INDEX_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "header": header.decode("utf-8"),
+        "trips": trips,
+    }
+
+
+class StopTimesIndex:
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.header = meta["header"].encode("utf-8")
+        self.trips = meta["trips"]
+
+    @classmethod
+    def open(cls, path, rebuild=False):
+        """Betölti a stop_times.txt melletti indexet; ha nincs vagy elavult, újraépíti és elmenti"""
+        idx_path = path + INDEX_SUFFIX
+        st = os.stat(path)
+        if not rebuild and os.path.exists(idx_path):
+            try:
+                with open(idx_path, "rb") as f:
+                    meta = json.loads(zlib.decompress(f.read()))
+                if (meta.get("version") == INDEX_VERSION and meta.get("size") == st.st_size
+                        and meta.get("mtime_ns") == st.st_mtime_ns):
+                    return cls(path, meta)
+            except (OSError, ValueError, zlib.error):
+                pass
+
+        t0 = time.perf_counter()
+        meta = build(path)
+        tmp = idx_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(zlib.compress(json.dumps(meta, separators=(",", ":")).encode("utf-8"), 6))
+        os.replace(tmp, idx_path)
+        print(f"   stop_times index kész: {len(meta['trips'])} trip, {time.perf_counter() - t0:.1f}s -> {idx_path}")
+        return cls(path, meta)
+
+    def ranges(self, trip_ids):
+        """A kért trip-ek bájt tartományai fájlsorrendben, READ_GAP-en belül összevonva"""
+        spans = sorted(r for t in set(trip_ids) for r in self.trips.get(t, ()))
+        merged = []
+        for off, ln in spans:
+            if merged and off - (merged[-1][0] + merged[-1][1]) <= READ_GAP:
+                merged[-1][1] = max(merged[-1][1], off + ln - merged[-1][0])
+            else:
+                merged.append([off, ln])
+        return merged
+
+    def iter_trips(self, trip_ids, usecols=None, chunk_bytes=CHUNK_BYTES, **read_csv_kw):
+        """DataFrame-ek (dtype=str) csak a kért trip-ek soraival, fájlsorrendben.
+        Egy összefüggő tartományban álló trip (a szokásos eset) sosem vágódik két chunk közé."""
+        trip_set = set(trip_ids)
+        kw = dict(header=0, dtype=str, encoding="utf-8", on_bad_lines="skip")
+        kw.update(read_csv_kw)
+        if usecols is not None and "trip_id" not in usecols:
+            usecols = list(usecols) + ["trip_id"]
+
+        def frame(parts):
+            df = pd.read_csv(io.BytesIO(self.header + b"".join(parts)), usecols=usecols, **kw)
+            # az összevont tartományok közti "hézag" sorai más trip-ekhez tartoznak
+            return df[df["trip_id"].isin(trip_set)]
+
+        with open(self.path, "rb") as f:
+            parts, size = [], 0
+            for off, ln in self.ranges(trip_set):
+                f.seek(off)
+                parts.append(f.read(ln))
+                size += ln
+                if size >= chunk_bytes:
+                    yield frame(parts)
+                    parts, size = [], 0
+            if parts:
+                yield frame(parts)
+
+    def read_trips(self, trip_ids, usecols=None, **read_csv_kw):
+        frames = list(self.iter_trips(trip_ids, usecols, **read_csv_kw))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=usecols)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="trip_id -> bájt tartomány index a stop_times.txt-hez")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="index (újra)építése")
+    b.add_argument("path")
+    t = sub.add_parser("trips", help="a megadott trip-ek sorai")
+    t.add_argument("path")
+    t.add_argument("trip_id", nargs="+")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        idx = StopTimesIndex.open(args.path, rebuild=True)
+        print(f"✅ {len(idx.trips)} trip")
+    else:
+        df = StopTimesIndex.open(args.path).read_trips(args.trip_id)
+        df.to_csv(sys.stdout, index=False)
+
+if __name__ == "__main__":
+    main()
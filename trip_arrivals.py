@@ -0,0 +1,230 @@
+from datetime import datetime
+import pandas as pd
+
+import backend
+import bulk_load
+
+# =========================================================
+# stg.RealTime_TripArrivals: trip szintű tömörített érkezések
+# =========================================================
+# A poller minden 30 mp-es körben minden látható trip-re új sort ír a stg.RealTime_StopArrivals-ba;
+# egy 60 percig látható 100E trip így ~120-szor szerepel. Itt (ServiceDate, TripId, StopId) kulcson
+# egyetlen sor van, helyben frissítve:
+#   First* - az első megfigyelés (első predikció)
+#   Last*  - a legutóbbi megfigyelés
+#   Final* - az utolsó megfigyelés, ami még az (előrejelzett) érkezés előtt készült; ha ilyen nincs
+#            (a FUTÁR a trip-et az esedékesség után is listázza), az esedékesség utáni első
+#   DelayHistory - "eltolás:késés;..." ahol eltolás = SnapshotDT - FirstSnapshotDT mp-ben (a snapshotok
+#                  sorrendjét követi; a ScheduledArrivalDT a FUTÁR-ban snapshotonként változhat, az arra
+#                  vett eltolás nem monoton, és a tömörítés a batch határoktól függött volna);
+#                  csak a késés változásai, legfeljebb HISTORY_MAX elem (az első + a legutóbbiak)
+#   SeenSnapshots - a már beépített snapshotok: eltolások a FirstSnapshotDT-hez, növekvő sorrendben,
+#                   különbségekként ("0;30;31;..."), hogy a sor rövid maradjon
+#
+# Idempotens: egy snapshot a SeenSnapshots alapján egyszer épül be, így a backfill ugyanazt a snapshotot
+# akárhányszor újra beküldheti, a sorrendjét vesztett (pl. a db_writer spoolból később visszajátszott)
+# snapshot pedig akkor is beépül, ha a [FirstSnapshotDT, LastSnapshotDT] közé esik.
+# A SeenSnapshots előtti sorokon (NULL) marad a régi szabály: a [First, Last] közöttit feldolgozottnak vesszük.
+
+HISTORY_MAX = 16
+READ_KEYS_CHUNK = 500       # ennyi TripId megy egy IN (...) listába (mssql: max 2100 paraméter)
+
+TRIP_COLS = [
+    "ServiceDate", "TripId", "StopId", "RouteIdRT", "ScheduledArrivalDT",
+    "FirstSnapshotDT", "FirstPredictedDT", "FirstDelaySec",
+    "LastSnapshotDT", "LastPredictedDT", "LastDelaySec",
+    "FinalSnapshotDT", "FinalPredictedDT", "FinalDelaySec",
+    "ObsCount", "DelayHistory", "SeenSnapshots",
+]
+
+TRIP_ARRIVALS_DDL = """
+IF OBJECT_ID('stg.RealTime_TripArrivals','U') IS NULL
+CREATE TABLE stg.RealTime_TripArrivals(
+    ServiceDate DATE NOT NULL,
+    TripId VARCHAR(100) NOT NULL,
+    StopId VARCHAR(50) NOT NULL,
+    RouteIdRT VARCHAR(50) NULL,
+    ScheduledArrivalDT DATETIME2(0) NULL,
+    FirstSnapshotDT DATETIME2(0) NOT NULL,
+    FirstPredictedDT DATETIME2(0) NULL,
+    FirstDelaySec INT NULL,
+    LastSnapshotDT DATETIME2(0) NOT NULL,
+    LastPredictedDT DATETIME2(0) NULL,
+    LastDelaySec INT NULL,
+    FinalSnapshotDT DATETIME2(0) NULL,
+    FinalPredictedDT DATETIME2(0) NULL,
+    FinalDelaySec INT NULL,
+    ObsCount INT NOT NULL,
+    DelayHistory VARCHAR(400) NULL,
+    SeenSnapshots VARCHAR(MAX) NULL,
+    CONSTRAINT PK_RealTime_TripArrivals PRIMARY KEY (ServiceDate, TripId, StopId)
+);
+"""
+
+# a SeenSnapshots oszlop előtt létrehozott táblákra
+TRIP_ARRIVALS_MIGRATE = """
+IF COL_LENGTH('stg.RealTime_TripArrivals','SeenSnapshots') IS NULL
+    ALTER TABLE stg.RealTime_TripArrivals ADD SeenSnapshots VARCHAR(MAX) NULL;
+"""
+
+def ensure_table(conn):
+    conn.exec_driver_sql(backend.sql(TRIP_ARRIVALS_DDL))
+    conn.exec_driver_sql(backend.sql(TRIP_ARRIVALS_MIGRATE))
+
+# ---------- DelayHistory ----------
+def parse_history(s):
+    out = {}
+    for part in (s or "").split(";"):
+        off, sep, delay = part.partition(":")
+        if sep:
+            out[int(off)] = int(delay)
+    return out
+
+def format_history(hist):
+    points = []
+    for off in sorted(hist):
+        if not points or points[-1][1] != hist[off]:
+            points.append((off, hist[off]))
+    if len(points) > HISTORY_MAX:
+        points = points[:1] + points[-(HISTORY_MAX - 1):]
+    return ";".join(f"{off}:{delay}" for off, delay in points) or None
+
+# ---------- SeenSnapshots ----------
+def parse_seen(s):
+    """-> eltolások halmaza; None: a SeenSnapshots előtti sor"""
+    if s is None:
+        return None
+    seen, off = set(), 0
+    for part in s.split(";"):
+        if part:
+            off += int(part)
+            seen.add(off)
+    return seen
+
+def format_seen(seen):
+    if seen is None:
+        return None
+    offs = sorted(seen)
+    return ";".join(str(b - a) for a, b in zip([0] + offs, offs))
+
+# ---------- összefésülés (DB nélkül) ----------
+def _none(x):
+    return None if pd.isna(x) else x
+
+def _final_rank(snap, pred):
+    # nagyobb = jobb "végső" predikció: előbb az érkezés előtti legkésőbbi, aztán az utáni legkorábbi
+    if snap <= pred:
+        return (1, snap.timestamp())
+    return (0, -snap.timestamp())
+
+def _offset(state, snap):
+    return int((snap - state["FirstSnapshotDT"]).total_seconds())
+
+def _observe(state, hist, seen, o):
+    """Egy megfigyelés (parse_arrivals sor) beépítése; -> False, ha már benne volt"""
+    snap = o["SnapshotDT"]
+    if state is None:
+        state = {k: None for k in TRIP_COLS}
+        state.update(ServiceDate=o["ServiceDate"], TripId=o["TripId"], StopId=o["StopId"], ObsCount=0,
+                     FirstSnapshotDT=snap, FirstPredictedDT=o["PredictedArrivalDT"], FirstDelaySec=o["DelaySec"],
+                     LastSnapshotDT=snap)
+    elif seen is None:
+        if state["FirstSnapshotDT"] <= snap <= state["LastSnapshotDT"]:
+            return state, False
+    elif _offset(state, snap) in seen:
+        return state, False
+
+    if snap < state["FirstSnapshotDT"]:
+        # korábbi snapshot utólag (backfill): az eddigi eltolások az új FirstSnapshotDT-hez
+        shift = int((state["FirstSnapshotDT"] - snap).total_seconds())
+        moved = {off + shift: delay for off, delay in hist.items()}
+        hist.clear()
+        hist.update(moved)
+        if seen is not None:
+            moved = {off + shift for off in seen}
+            seen.clear()
+            seen.update(moved)
+        state.update(FirstSnapshotDT=snap, FirstPredictedDT=o["PredictedArrivalDT"], FirstDelaySec=o["DelaySec"])
+    elif snap > state["LastSnapshotDT"]:
+        state["LastSnapshotDT"] = snap
+
+    if snap >= state["LastSnapshotDT"]:
+        state.update(LastPredictedDT=o["PredictedArrivalDT"], LastDelaySec=o["DelaySec"],
+                     RouteIdRT=o["RouteIdRT"] or state["RouteIdRT"],
+                     ScheduledArrivalDT=o["ScheduledArrivalDT"] or state["ScheduledArrivalDT"])
+    pred = o["PredictedArrivalDT"]
+    if pred is not None and (state["FinalSnapshotDT"] is None or _final_rank(snap, pred) >
+                             _final_rank(state["FinalSnapshotDT"], state["FinalPredictedDT"])):
+        state.update(FinalSnapshotDT=snap, FinalPredictedDT=pred, FinalDelaySec=o["DelaySec"])
+
+    off = _offset(state, snap)
+    if o["DelaySec"] is not None:
+        hist[off] = int(o["DelaySec"])
+    if seen is not None:
+        seen.add(off)
+    state["ObsCount"] += 1
+    return state, True
+
+def merge(existing, rows):
+    """existing: {kulcs: állapot dict} (a DB-ből), rows: parse_arrivals sorok
+    -> a megváltozott kulcsok új állapota (TRIP_COLS dict-ek)"""
+    changed = {}
+    hists = {}
+    seens = {}
+    for o in sorted(rows, key=lambda r: r["SnapshotDT"]):
+        if not o.get("TripId") or not o.get("StopId") or o.get("ServiceDate") is None:
+            continue
+        key = (o["ServiceDate"], o["TripId"], o["StopId"])
+        state = changed.get(key) or existing.get(key)
+        if key not in hists:
+            hists[key] = parse_history(state["DelayHistory"] if state else None)
+            seens[key] = parse_seen(state["SeenSnapshots"]) if state else set()
+        state, new = _observe(dict(state) if key not in changed and state else state, hists[key], seens[key], o)
+        if new:
+            changed[key] = state
+    for key, state in changed.items():
+        state["DelayHistory"] = format_history(hists[key])
+        state["SeenSnapshots"] = format_seen(seens[key])
+    return changed
+
+# ---------- DB ----------
+def _read_existing(conn, keys):
+    by_date = {}
+    for sd, trip, stop in keys:
+        by_date.setdefault(sd, set()).add(trip)
+
+    existing = {}
+    cols = ", ".join(TRIP_COLS)
+    for sd, trips in by_date.items():
+        trips = sorted(trips)
+        for i in range(0, len(trips), READ_KEYS_CHUNK):
+            part = trips[i:i + READ_KEYS_CHUNK]
+            marks = ", ".join("?" for _ in part)
+            res = conn.exec_driver_sql(
+                f"SELECT {cols} FROM stg.RealTime_TripArrivals WHERE ServiceDate = ? AND TripId IN ({marks})",
+                (sd, *part))
+            for r in res:
+                st = dict(zip(TRIP_COLS, r))
+                if isinstance(st["ServiceDate"], datetime):
+                    st["ServiceDate"] = st["ServiceDate"].date()
+                key = (st["ServiceDate"], st["TripId"], st["StopId"])
+                if key in keys:
+                    existing[key] = st
+    return existing
+
+def upsert(conn, rows):
+    """parse_arrivals sorok -> stg.RealTime_TripArrivals (a hívó tranzakciójában); -> frissített kulcsok száma"""
+    rows = [{k: _none(v) for k, v in r.items()} for r in rows]
+    keys = {(r.get("ServiceDate"), r.get("TripId"), r.get("StopId")) for r in rows}
+    if not keys:
+        return 0
+    changed = merge(_read_existing(conn, keys), rows)
+    if not changed:
+        return 0
+    # törlés + beszúrás: mindkét backenden ugyanaz, és a bulk_load útját használja
+    conn.exec_driver_sql(
+        "DELETE FROM stg.RealTime_TripArrivals WHERE ServiceDate = ? AND TripId = ? AND StopId = ?",
+        list(changed))
+    bulk_load.insert(conn, pd.DataFrame(list(changed.values()), columns=TRIP_COLS),
+                     "RealTime_TripArrivals", "stg", report=False)
+    return len(changed)
@@ -0,0 +1,289 @@
+import os, sys, glob, json, argparse
+from datetime import datetime
+
+import snapshot_archive
+from snapshot_archive import ArchiveWriter, ArchiveReader
+
+# =========================================================
+# Delta-kódolt jármű snapshot tár (vehicles-for-route)
+# =========================================================
+# Időnként egy teljes kulcskép (keyframe), közte csak a változások járművenként.
+# A rekordok a snapshot_archive szegmenseibe kerülnek, a flags mondja meg a típust:
+#   FLAG_KEYFRAME: a teljes válasz JSON
+#   FLAG_DELTA:    {"upd": {vehicleId: {mező: új érték}},   - változott mezők (pl. lastUpdateTime, location)
+#                   "add": {vehicleId: teljes jármű},         - új jármű a vonalon
+#                   "del": [vehicleId, ...],                  - eltűnt jármű
+#                   "unset": {vehicleId: [mező, ...]},        - megszűnt mező
+#                   "order": [vehicleId, ...],                - csak ha a lista sorrendje változott
+#                   "env": {kulcs: érték}, "data": {kulcs: érték},  - változott boríték (currentTime, outOfRange...)
+#                   "refs": {kategória: {"set": {id: objektum}, "rm": [id, ...]}}}  - references id-szinten
+#
+# Olvasás: legutolsó kulcskép <= T, majd a deltákat rájátsszuk -> a teljes snapshot T-ben.
+# A deltafolyam maga a "mi változott" feed (changes()).
+
+FLAG_KEYFRAME = 1
+FLAG_DELTA = 2
+
+KEYFRAME_EVERY = 120   # ~1 óra 30 mp-es pollnál; naponta (új szegmensben) mindig új kulcskép indul
+
+def _vehicles(payload):
+    return ((payload.get("data") or {}).get("list")) or []
+
+def _split(payload):
+    """payload -> (boríték a lista nélkül, data a lista nélkül, {vehicleId: jármű}, sorrend)"""
+    env = {k: v for k, v in payload.items() if k != "data"}
+    data = {k: v for k, v in (payload.get("data") or {}).items() if k != "list"}
+    vehicles = {}
+    order = []
+    for v in _vehicles(payload):
+        vid = v.get("vehicleId")
+        vehicles[vid] = v
+        order.append(vid)
+    return env, data, vehicles, order
+
+def _dict_diff(old, new):
+    changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    removed = [k for k in old if k not in new]
+    return changed, removed
+
+def _refs_diff(old, new):
+    """references (kategória -> id -> objektum) különbsége id szinten; None, ha nem ilyen alakú"""
+    if not (isinstance(old, dict) and isinstance(new, dict)
+            and all(isinstance(v, dict) for v in old.values())
+            and all(isinstance(v, dict) for v in new.values())):
+        return None
+    out = {}
+    for cat in set(old) | set(new):
+        changed, removed = _dict_diff(old.get(cat, {}), new.get(cat, {}))
+        if changed or removed:
+            out[cat] = {"set": changed, "rm": removed}
+    return out
+
+def make_delta(prev, cur):
+    """Két teljes snapshot közti delta (dict); üres dict, ha semmi nem változott"""
+    p_env, p_data, p_veh, p_order = prev
+    c_env, c_data, c_veh, c_order = cur
+    delta = {}
+
+    # a references a legnagyobb és ritkán változó rész: id szinten diffeljük, nem egészben
+    refs = _refs_diff(p_data.get("references"), c_data.get("references"))
+    if refs is not None:
+        if refs:
+            delta["refs"] = refs
+        p_data = {k: v for k, v in p_data.items() if k != "references"}
+        c_data = {k: v for k, v in c_data.items() if k != "references"}
+
+    env, env_rm = _dict_diff(p_env, c_env)
+    data, data_rm = _dict_diff(p_data, c_data)
+    if env:
+        delta["env"] = env
+    if data:
+        delta["data"] = data
+    if env_rm or data_rm:
+        delta["env_rm"] = env_rm
+        delta["data_rm"] = data_rm
+
+    upd, unset, add = {}, {}, {}
+    for vid, v in c_veh.items():
+        old = p_veh.get(vid)
+        if old is None:
+            add[vid] = v
+            continue
+        # kulcs: vehicleId + lastUpdateTime; a többi mezőt is összevetjük (pl. "stale" frissítés nélkül is változhat)
+        if old is v or old == v:
+            continue
+        changed, removed = _dict_diff(old, v)
+        if changed:
+            upd[vid] = changed
+        if removed:
+            unset[vid] = removed
+    gone = [vid for vid in p_veh if vid not in c_veh]
+
+    if upd:
+        delta["upd"] = upd
+    if unset:
+        delta["unset"] = unset
+    if add:
+        delta["add"] = add
+    if gone:
+        delta["del"] = gone
+
+    # a sorrend csak akkor kell, ha nem az lesz, ami a régi sorrend + hozzáfűzött újakból adódik
+    expected = [vid for vid in p_order if vid in c_veh] + [vid for vid in c_order if vid not in p_veh]
+    if expected != c_order:
+        delta["order"] = c_order
+    return delta
+
+def apply_delta(state, delta):
+    """state = _split() eredménye; helyben frissíti és visszaadja"""
+    env, data, veh, order = state
+    for k in delta.get("env_rm", []):
+        env.pop(k, None)
+    for k in delta.get("data_rm", []):
+        data.pop(k, None)
+    env.update(delta.get("env", {}))
+    data.update(delta.get("data", {}))
+    if "refs" in delta:
+        refs = {cat: dict(objs) for cat, objs in data["references"].items()}
+        for cat, ch in delta["refs"].items():
+            objs = refs.setdefault(cat, {})
+            for k in ch["rm"]:
+                objs.pop(k, None)
+            objs.update(ch["set"])
+        data["references"] = refs
+
+    gone = set(delta.get("del", []))
+    for vid in gone:
+        veh.pop(vid, None)
+    for vid, changed in delta.get("upd", {}).items():
+        # új dict, hogy a korábban kiadott snapshotok ne változzanak utólag
+        veh[vid] = {**veh[vid], **changed}
+    for vid, fields in delta.get("unset", {}).items():
+        veh[vid] = {k: v for k, v in veh[vid].items() if k not in fields}
+    add = delta.get("add", {})
+    veh.update(add)
+
+    if "order" in delta:
+        order[:] = delta["order"]
+    else:
+        order[:] = [vid for vid in order if vid not in gone] + [vid for vid in add if vid not in order]
+    return state
+
+def assemble(state):
+    env, data, veh, order = state
+    out = dict(env)
+    out["data"] = {"list": [veh[vid] for vid in order], **data}
+    return out
+
+
+class DeltaWriter:
+    """A realtime_collector ezt hívja minden pollnál: append(snap_dt, payload)"""
+
+    def __init__(self, stream="bkk_100e_delta", root=None, keyframe_every=KEYFRAME_EVERY):
+        self.archive = ArchiveWriter(stream, root)
+        self.keyframe_every = keyframe_every
+        self._state = None     # az utolsó kiírt snapshot (_split alakban)
+        self._since_kf = 0
+        self._day = None
+
+    def append(self, snap_dt: datetime, payload):
+        cur = _split(payload)
+        # újraindulás után / új napon / N delta után mindig kulcskép: egy szegmens magában is olvasható
+        if (self._state is None or self._day != snap_dt.date() or self._since_kf >= self.keyframe_every
+                or len(cur[2]) != len(cur[3])):   # duplikált vehicleId: azt csak kulcsképpel tudjuk hűen tárolni
+            n = self.archive.append(snap_dt, payload, flags=FLAG_KEYFRAME)
+            self._since_kf = 0
+        else:
+            n = self.archive.append(snap_dt, make_delta(self._state, cur), flags=FLAG_DELTA)
+            self._since_kf += 1
+        self._state = cur
+        self._day = snap_dt.date()
+        return n
+
+    def close(self):
+        self.archive.close()
+
+
+class DeltaReader:
+    def __init__(self, stream="bkk_100e_delta", root=None):
+        self.archive = ArchiveReader(stream, root)
+
+    def _replay(self, t1, t2):
+        """(ts, state, delta) a [t1, t2] ablakban; a legutolsó t1 előtti kulcsképtől indul"""
+        kf = self.archive.locate(t1, flag_mask=FLAG_KEYFRAME)
+        start = snapshot_archive.ms_to_dt(kf[0][0]) if kf else t1
+        state = None
+        for ts, flags, payload in self.archive.records(start, t2):
+            if flags & FLAG_KEYFRAME:
+                state = _split(payload)
+                delta = None
+            elif state is None:
+                # kulcskép nélküli delta (pl. törölt szegmens) - a következő kulcsképig nem rekonstruálható
+                continue
+            else:
+                delta = payload
+                apply_delta(state, delta)
+            if ts >= t1:
+                yield ts, state, delta
+
+    def at(self, t: datetime):
+        """A teljes snapshot T-ben (ts, payload) vagy None"""
+        kf = self.archive.locate(t, flag_mask=FLAG_KEYFRAME)
+        if kf is None:
+            return None
+        last = None
+        for ts, state, delta in self._replay(snapshot_archive.ms_to_dt(kf[0][0]), t):
+            last = ts
+        return (last, assemble(state)) if last is not None else None
+
+    def between(self, t1: datetime, t2: datetime):
+        """Teljes snapshotok t1..t2 között (ts, payload)"""
+        for ts, state, delta in self._replay(t1, t2):
+            yield ts, assemble(state)
+
+    def changes(self, t1: datetime, t2: datetime):
+        """Csak a változások: (ts, delta); kulcsképnél delta=None"""
+        for ts, state, delta in self._replay(t1, t2):
+            yield ts, delta
+
+
+def convert(src, stream="bkk_100e_delta", root=None):
+    """Meglévő bkk_100e_*.json mappa vagy teljes archív stream átírása delta tárba"""
+    writer = DeltaWriter(stream, root)
+    n = raw = packed = 0
+    try:
+        if os.path.isdir(src):
+            items = []
+            for path in glob.glob(os.path.join(src, "bkk_100e_*.json")):
+                parsed = snapshot_archive.split_raw_name(path)
+                if parsed and parsed[0] == "bkk_100e":
+                    items.append((parsed[1], path))
+            for ts, path in sorted(items):
+                with open(path, "rb") as f:
+                    body = f.read()
+                raw += len(body)
+                packed += writer.append(ts, json.loads(body))
+                n += 1
+        else:
+            for ts, payload in ArchiveReader(src, root).between(datetime(1970, 1, 2), datetime(9999, 1, 1)):
+                raw += len(json.dumps(payload, ensure_ascii=False, indent=4).encode("utf-8"))
+                packed += writer.append(ts, payload)
+                n += 1
+    finally:
+        writer.close()
+    print(f"✅ {n} snapshot -> {stream}: {raw/1e6:.1f} MB -> {packed/1e6:.2f} MB ({raw / packed if packed else 0:.0f}x)")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Delta-kódolt jármű snapshot tár")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("convert", help="JSON mappa vagy archív stream -> delta stream")
+    c.add_argument("src")
+    c.add_argument("--stream", default="bkk_100e_delta")
+    a = sub.add_parser("at", help="teljes snapshot egy időpontban")
+    a.add_argument("time")
+    a.add_argument("--stream", default="bkk_100e_delta")
+    ch = sub.add_parser("changes", help="változások két időpont között")
+    ch.add_argument("t1")
+    ch.add_argument("t2")
+    ch.add_argument("--stream", default="bkk_100e_delta")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "convert":
+        convert(args.src, args.stream)
+    elif args.cmd == "at":
+        hit = DeltaReader(args.stream).at(datetime.fromisoformat(args.time))
+        if hit is None:
+            print("Nincs snapshot ennél korábban.")
+        else:
+            json.dump(hit[1], sys.stdout, ensure_ascii=False, indent=2)
+            print(f"\n# ts={hit[0]}")
+    elif args.cmd == "changes":
+        for ts, delta in DeltaReader(args.stream).changes(datetime.fromisoformat(args.t1), datetime.fromisoformat(args.t2)):
+            if delta is None:
+                print(f"{ts}  KULCSKÉP")
+                continue
+            moved = ", ".join(f"{vid}:{sorted(f)}" for vid, f in (delta.get("upd") or {}).items())
+            print(f"{ts}  +{list(delta.get('add', {}))} -{delta.get('del', [])}  {moved}")
+
+if __name__ == "__main__":
+    main()
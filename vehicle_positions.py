@@ -0,0 +1,241 @@
+import os, glob, time, argparse
+from datetime import datetime
+import pandas as pd
+
+import backend
+import bulk_load
+import futar_decode
+import snapshot_archive
+import vehicle_delta_store
+from arrivals_parse import epoch_to_dt, service_date
+
+# =========================================================
+# vehicles-for-route -> stg.RealTime_VehiclePositions + stg.RealTime_FleetState
+# =========================================================
+# A realtime_collector.py eddig csak JSON-t mentett; a Power BI Folder connector minden frissítéskor
+# az egyre több fájlt listázta / nyitotta meg. Itt minden snapshot data.list-je típusos sorokká válik:
+#   stg.RealTime_VehiclePositions - jármű pozíciók snapshotonként (append, RawFile-lal)
+#   stg.RealTime_FleetState       - járművenként egy sor, mindig a legutolsó ismert állapot
+# A Power BI a FleetState-et olvassa: a frissítés költsége nem nő a gyűjtés hosszával.
+#
+# python vehicle_positions.py                              -> alap mappa (Data\RealTime_JSON) betöltése
+# python vehicle_positions.py --archive bkk_100e           -> snapshot_archive stream
+# python vehicle_positions.py --delta bkk_100e_delta       -> vehicle_delta_store stream
+# Idempotens: a már betöltött RawFile-okat kihagyja.
+
+DEFAULT_SRC = r"C:\Users\SinkoGraphy\ME\School\uzleti_intelligencia_hf\BudAirportBI\Data\RealTime_JSON"
+RAW_PREFIX = "bkk_100e"
+WRITE_BATCH_ROWS = 50_000
+
+SERVER = r"(localdb)\mssqllocaldb"
+DATABASE = "BudAirportBI"
+DRIVER = "ODBC Driver 17 for SQL Server"
+
+POSITION_COLS = ["SnapshotDT", "VehicleId", "RouteIdRT", "TripId", "StopId", "StopSequence",
+                 "StopDistancePercent", "Bearing", "Lat", "Lon", "Status", "LastUpdateDT",
+                 "ServiceDate", "LicensePlate", "RawFile"]
+FLEET_COLS = [c for c in POSITION_COLS if c != "RawFile"]
+
+POSITIONS_DDL = """
+IF OBJECT_ID('stg.RealTime_VehiclePositions','U') IS NULL
+CREATE TABLE stg.RealTime_VehiclePositions(
+    SnapshotDT DATETIME2(0) NOT NULL,
+    VehicleId VARCHAR(50) NOT NULL,
+    RouteIdRT VARCHAR(50) NULL,
+    TripId VARCHAR(100) NULL,
+    StopId VARCHAR(50) NULL,
+    StopSequence INT NULL,
+    StopDistancePercent INT NULL,
+    Bearing FLOAT NULL,
+    Lat FLOAT NULL,
+    Lon FLOAT NULL,
+    Status VARCHAR(30) NULL,
+    LastUpdateDT DATETIME2(0) NULL,
+    ServiceDate DATE NULL,
+    LicensePlate VARCHAR(20) NULL,
+    RawFile NVARCHAR(260) NULL
+);
+"""
+
+FLEET_DDL = """
+IF OBJECT_ID('stg.RealTime_FleetState','U') IS NULL
+CREATE TABLE stg.RealTime_FleetState(
+    SnapshotDT DATETIME2(0) NOT NULL,
+    VehicleId VARCHAR(50) NOT NULL PRIMARY KEY,
+    RouteIdRT VARCHAR(50) NULL,
+    TripId VARCHAR(100) NULL,
+    StopId VARCHAR(50) NULL,
+    StopSequence INT NULL,
+    StopDistancePercent INT NULL,
+    Bearing FLOAT NULL,
+    Lat FLOAT NULL,
+    Lon FLOAT NULL,
+    Status VARCHAR(30) NULL,
+    LastUpdateDT DATETIME2(0) NULL,
+    ServiceDate DATE NULL,
+    LicensePlate VARCHAR(20) NULL
+);
+"""
+
+def ensure_tables(engine=None, conn=None):
+    """engine: saját tranzakció | conn: a hívó tranzakciójában (pl. db_writer batch)"""
+    if conn is None:
+        with engine.begin() as conn:
+            return ensure_tables(conn=conn)
+    conn.exec_driver_sql(backend.sql(POSITIONS_DDL))
+    conn.exec_driver_sql(backend.sql(FLEET_DDL))
+
+# ---------- parse (DB nélkül) ----------
+def _int(x):
+    try:
+        return None if x is None else int(x)
+    except (TypeError, ValueError):
+        return None
+
+def _float(x):
+    try:
+        return None if x is None else float(x)
+    except (TypeError, ValueError):
+        return None
+
+def parse_vehicles(data, snap_dt, raw_name):
+    """Egy vehicles-for-route válasz -> jármű sorok (POSITION_COLS)"""
+    rows = []
+    for v in ((data.get("data") or {}).get("list")) or []:
+        vid = v.get("vehicleId")
+        if not vid:
+            continue
+        loc = v.get("location") or {}
+        last = epoch_to_dt(v.get("lastUpdateTime"))
+        rows.append({
+            "SnapshotDT": snap_dt,
+            "VehicleId": vid,
+            "RouteIdRT": v.get("routeId"),
+            "TripId": v.get("tripId"),
+            "StopId": v.get("stopId"),
+            "StopSequence": _int(v.get("stopSequence")),
+            "StopDistancePercent": _int(v.get("stopDistancePercent")),
+            "Bearing": _float(v.get("bearing")),
+            "Lat": _float(loc.get("lat")),
+            "Lon": _float(loc.get("lon")),
+            "Status": v.get("status"),
+            "LastUpdateDT": last,
+            "ServiceDate": service_date(v.get("serviceDate"), last),
+            "LicensePlate": v.get("licensePlate"),
+            "RawFile": raw_name,
+        })
+    return rows
+
+def positions_frame(rows):
+    df = pd.DataFrame(rows, columns=POSITION_COLS)
+    for c in ("StopSequence", "StopDistancePercent"):
+        df[c] = df[c].astype("Int64")
+    return df
+
+# ---------- DB ----------
+def update_fleet(conn, df):
+    """Járművenként a legfrissebb sor -> stg.RealTime_FleetState (törlés + beszúrás, csak ha újabb)"""
+    latest = df.sort_values("SnapshotDT").drop_duplicates("VehicleId", keep="last")
+    ids = latest["VehicleId"].tolist()
+    known = {}
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        marks = ", ".join("?" for _ in part)
+        for vid, snap in conn.exec_driver_sql(
+                f"SELECT VehicleId, SnapshotDT FROM stg.RealTime_FleetState WHERE VehicleId IN ({marks})", tuple(part)):
+            known[vid] = snap
+
+    newer = latest[[known.get(v) is None or s > known[v]
+                    for v, s in zip(latest["VehicleId"], latest["SnapshotDT"])]]
+    if newer.empty:
+        return 0
+    conn.exec_driver_sql("DELETE FROM stg.RealTime_FleetState WHERE VehicleId = ?",
+                         [(v,) for v in newer["VehicleId"]])
+    bulk_load.insert(conn, newer[FLEET_COLS], "RealTime_FleetState", "stg", report=False)
+    return len(newer)
+
+def insert_positions(conn, rows):
+    """Pozíciók + flotta állapot a hívó tranzakciójában; -> (pozíció sorok, frissített járművek)"""
+    if not rows:
+        return 0, 0
+    df = positions_frame(rows)
+    n = bulk_load.insert(conn, df, "RealTime_VehiclePositions", "stg", report=False)
+    return n, update_fleet(conn, df)
+
+def write_positions(engine, rows):
+    """Pozíciók + flotta állapot egy tranzakcióban; -> (pozíció sorok, frissített járművek)"""
+    if not rows:
+        return 0, 0
+    with engine.begin() as conn:
+        return insert_positions(conn, rows)
+
+# ---------- betöltés meglévő snapshotokból ----------
+def loaded_raw_files(engine):
+    sql = "SELECT DISTINCT RawFile FROM stg.RealTime_VehiclePositions WHERE RawFile IS NOT NULL"
+    return set(pd.read_sql(sql, engine)["RawFile"].astype(str))
+
+def raw_name(snap_dt):
+    # ugyanaz a név, amit a realtime_collector fájl módban ad -> archívumból betöltve sem duplikál
+    return f"{RAW_PREFIX}_{snap_dt.strftime('%Y%m%d_%H%M%S')}.json"
+
+def iter_snapshots(srcs, archives, deltas):
+    """(snapshot idő, RawFile név, payload) minden forrásból"""
+    for src in srcs:
+        for path in sorted(glob.glob(os.path.join(src, f"{RAW_PREFIX}_*.json"))):
+            parsed = snapshot_archive.split_raw_name(path)
+            if not parsed or parsed[0] != RAW_PREFIX:
+                continue
+            try:
+                with open(path, "rb") as f:
+                    data = futar_decode.decode_vehicles(f.read())
+            except (OSError, futar_decode.DecodeError):
+                continue
+            yield parsed[1], os.path.basename(path), data
+
+    lo, hi = datetime(1970, 1, 2), datetime(9999, 1, 1)
+    for stream in archives:
+        for ts, data in snapshot_archive.ArchiveReader(stream).between(lo, hi):
+            yield ts, raw_name(ts), data
+    for stream in deltas:
+        for ts, data in vehicle_delta_store.DeltaReader(stream).between(lo, hi):
+            yield ts, raw_name(ts), data
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="vehicles-for-route snapshotok -> stg.RealTime_VehiclePositions / FleetState")
+    ap.add_argument("src", nargs="*", help="JSON mappa(k) (alap: Data\\RealTime_JSON)")
+    ap.add_argument("--archive", action="append", default=[], metavar="STREAM", help="snapshot_archive stream")
+    ap.add_argument("--delta", action="append", default=[], metavar="STREAM", help="vehicle_delta_store stream")
+    args = ap.parse_args(argv)
+
+    srcs = args.src or ([] if args.archive or args.delta else [DEFAULT_SRC])
+    engine = backend.make_engine(SERVER, DATABASE, DRIVER)
+    ensure_tables(engine)
+    loaded = loaded_raw_files(engine)
+
+    t0 = time.perf_counter()
+    snaps = skipped = 0
+    totals = [0, 0]
+    buf = []
+    for snap_dt, name, data in iter_snapshots(srcs, args.archive, args.delta):
+        if name in loaded:
+            skipped += 1
+            continue
+        loaded.add(name)
+        snaps += 1
+        # fájlból típusos rekord (futar_decode.py), archívumból dict: mindkettőt kezeli
+        buf.extend(futar_decode.vehicle_rows(data, snap_dt, name))
+        if len(buf) >= WRITE_BATCH_ROWS:
+            n, fleet = write_positions(engine, buf)
+            totals[0] += n
+            totals[1] += fleet
+            buf = []
+    if buf:
+        n, fleet = write_positions(engine, buf)
+        totals[0] += n
+        totals[1] += fleet
+
+    print(f"✅ Kész: {snaps} snapshot ({skipped} már betöltve) | pozíciók={totals[0]} | "
+          f"flotta frissítés={totals[1]} | {time.perf_counter() - t0:.1f}s")
+
+if __name__ == "__main__":
+    main()